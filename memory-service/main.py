@@ -4,27 +4,46 @@ ISAC Memory Service - Cloud Edition
 """
 from __future__ import annotations
 
+import asyncio
+import base64
 import hashlib
 import json
+import math
 import os
+import posixpath
 import re
 import secrets
 import sqlite3
+import threading
 import time
-from collections import defaultdict
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
 from datetime import datetime, timedelta
 from enum import Enum
 from functools import wraps
+from heapq import heappop, heappush
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, NamedTuple, Optional
+from urllib.parse import parse_qsl, unquote, urlencode
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
-from fastapi import FastAPI, Query, HTTPException, Depends, Header, Request
+from fastapi import FastAPI, Query, HTTPException, Depends, Header, Request, Response, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 import tiktoken
 
+try:
+    import numpy as np
+except ImportError:  # numpy 未導入環境では純Python実装にフォールバック
+    np = None
+
 # ============================================================
 # アプリケーション設定
 # ============================================================
@@ -56,6 +75,64 @@ RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # seconds
 
 DEFAULT_TTL_DAYS = {"decision": 365, "work": 30, "knowledge": 365}
 MAX_CONTENT_LENGTH = 65536  # コンテンツの最大文字数
+STORE_BATCH_MAX = 100       # /store/batch で1回に保存できる件数
+
+# Idempotency-Key（リトライで同じ記憶が二重に保存されないようにする）
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))  # 超えたら古い順に削除
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_STALE_SECONDS = 300   # 処理中のまま残ったキー（プロセス異常終了など）を引き継ぐまでの秒数
+
+# /store?defer_enrich=true の後処理（カテゴリ/タグ推定・要約・埋め込み）
+ENRICH_BATCH_SIZE = 100           # 1トランザクションで処理する件数
+ENRICH_BATCH_DELAY = 0.05         # 起こされてから処理を始めるまでの待ち（連続した保存をまとめる）
+ENRICH_POLL_INTERVAL = 5.0        # 通知がなくても未処理の記憶を確認する間隔（秒）
+ENRICH_WAIT_MAX_SECONDS = 30      # /enrichment/wait で待てる最大秒数
+
+# セマンティック検索（ローカル埋め込み）
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))  # 埋め込みベクトルの次元数
+EMBEDDING_MAX_CHARS = 8192        # 埋め込み計算に使う先頭文字数（長文のstore時間を抑える）
+SEMANTIC_MIN_SIMILARITY = 0.05    # これ未満のコサイン類似度は「無関係」とみなす
+REINDEX_BATCH_SIZE = 500          # 再インデックスジョブの1トランザクションあたりの件数
+
+# 近似重複の検出（64bit SimHash を 16bit×4 のバンドに分けて索引。ハミング距離 3 以下なら必ずどれかのバンドが一致）
+SIMHASH_BANDS = 4
+NEAR_DUPLICATE_MAX_DISTANCE = min(int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "3")), SIMHASH_BANDS - 1)
+NEAR_DUPLICATE_CANDIDATES = 50    # /store で照合する候補の上限
+
+# 同じファイルへの連続した作業記録（post-edit）を1つの work 記憶に追記する時間窓（秒、0 で無効）
+COALESCE_WINDOW_MAX_SECONDS = 3600
+COALESCE_WINDOW_SECONDS = min(int(os.getenv("COALESCE_WINDOW_SECONDS", "0")), COALESCE_WINDOW_MAX_SECONDS)
+
+# プロジェクト別インメモリ転置インデックス（0 で無効）
+INVERTED_INDEX_MAX_BYTES = int(os.getenv("INVERTED_INDEX_MAX_MB", "64")) * 1024 * 1024
+
+# /context 結果キャッシュ（0 で無効）
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "30"))  # seconds
+CONTEXT_CACHE_SIZE = 256
+
+# /context のセッション差分（送信済み記憶の追跡）
+CONTEXT_SESSION_TTL = int(os.getenv("CONTEXT_SESSION_TTL", "3600"))  # seconds（最終アクセスから）
+CONTEXT_SESSION_MAX = 1000             # 保持するセッション数の上限（超過分は LRU で破棄）
+CONTEXT_SESSION_MAX_IDS = 2000         # 1セッションで追跡する記憶IDの上限
+
+# 差分エクスポート: 削除の墓標（tombstone）を保持する日数（/cleanup で期限切れを削除）
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+
+# 変更フィード（/changes）: 変更ログを保持する日数（/cleanup で期限切れを削除）
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "7"))
+CHANGES_MAX_LIMIT = 1000
+
+# 変更の SSE 配信（/changes/stream）
+SSE_POLL_INTERVAL = float(os.getenv("SSE_POLL_INTERVAL", "0.5"))  # 変更ログを読む間隔（秒）
+SSE_HEARTBEAT_SECONDS = 15        # 無通信時のハートビート間隔
+SSE_QUEUE_SIZE = 1000             # 購読者ごとの未送信イベント上限（超えたら切断）
+SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "200"))
+
+# 自動カテゴリ推定・タグ抽出のキーワード辞書（JSON）。未指定なら組み込みの辞書のみ
+KEYWORD_DICTIONARY_PATH = os.getenv("KEYWORD_DICTIONARY_PATH", "")
+KEYWORD_DICTIONARY_CHECK_SECONDS = float(os.getenv("KEYWORD_DICTIONARY_CHECK_SECONDS", "5"))  # 更新確認の間隔
+RETAG_BATCH_SIZE = 500            # 再タグ付けジョブの1トランザクションあたりの件数
 
 # トークンカウンター
 try:
@@ -95,6 +172,33 @@ TYPE_METADATA_SCHEMA: dict[str, dict] = {
 }
 
 
+class SearchMode(str, Enum):
+    KEYWORD = "keyword"    # キーワード一致（従来方式）
+    SEMANTIC = "semantic"  # 埋め込みベクトルのコサイン類似度
+    HYBRID = "hybrid"      # キーワード一致＋コサイン類似度
+
+
+class ContextFormat(str, Enum):
+    JSON = "json"          # ContextResponse（従来形式）
+    MARKDOWN = "markdown"  # Hook でそのまま注入できる Markdown
+    TEXT = "text"          # 装飾なしのプレーンテキスト
+
+
+class ExportFormat(str, Enum):
+    JSON = "json"      # 1つの JSON ドキュメント（従来形式）
+    NDJSON = "ndjson"  # 1行1記憶のストリーミング
+
+
+class NearDuplicatePolicy(str, Enum):
+    KEEP = "keep"            # 新しい記憶として保存し、近似重複の ID を返すだけ
+    MERGE = "merge"          # 保存せず、最も近い既存の記憶を更新する（完全一致の重複と同じ扱い）
+    SUPERSEDE = "supersede"  # 新しい記憶として保存し、近似重複を廃止する
+
+
+# /store・/store/batch で near_duplicates を省略した場合の扱い
+NEAR_DUPLICATE_POLICY = NearDuplicatePolicy(os.getenv("NEAR_DUPLICATE_POLICY", "keep"))
+
+
 class MemoryCategory(str, Enum):
     BACKEND = "backend"        # サーバーサイド
     FRONTEND = "frontend"      # クライアントサイド
@@ -151,6 +255,7 @@ class MemoryResponse(BaseModel):
     expires_at: Optional[str] = None
     deprecated: bool = False
     superseded_by: Optional[str] = None
+    duplicate_count: int = 0  # 同じ内容の保存が重複として抑止された回数
 
 
 class ContextResponse(BaseModel):
@@ -159,6 +264,8 @@ class ContextResponse(BaseModel):
     project_decisions: list[MemoryResponse]
     project_recent: list[MemoryResponse]
     total_tokens: int
+    truncated: bool = False  # 期限（deadline）内に全 tier を取得できなかった場合 True
+    unchanged_ids: list[str] = Field(default_factory=list)  # session_id 指定時: 送信済みで変更のない記憶ID（本文は省略）
 
 
 class StoreResponse(BaseModel):
@@ -172,6 +279,21 @@ class StoreResponse(BaseModel):
     superseded_ids: list[str] = Field(default_factory=list)  # 廃止された記憶のIDリスト
     skipped_supersedes: list[dict] = Field(default_factory=list)  # スキップされた廃止対象（理由付き）
     warnings: list[str] = Field(default_factory=list)  # 非致命的な警告（owner未指定など）
+    deduplicated: bool = False  # 同じ内容の既存の記憶を更新した（新しい記憶は作っていない）
+    duplicate_count: int = 0  # この記憶への保存が重複として抑止された回数
+    near_duplicate_ids: list[str] = Field(default_factory=list)  # 近似重複（行番号・時刻だけ違う等）の記憶ID
+    coalesced: bool = False  # 同じファイルの直近の作業記憶に追記した（新しい記憶は作っていない）
+    coalesce_count: int = 0  # この記憶に追記された保存の回数
+
+
+class StoreBatchRequest(BaseModel):
+    memories: list[MemoryEntry] = Field(..., min_length=1, max_length=STORE_BATCH_MAX)
+
+
+class StoreBatchResponse(BaseModel):
+    results: list[StoreResponse]  # リクエストと同じ順序
+    count: int
+    deduplicated: int = 0  # 重複として既存の記憶の更新にまとめた件数
 
 
 class TeamCreate(BaseModel):
@@ -217,6 +339,17 @@ def count_tokens(text: str) -> int:
     return len(text) // 4
 
 
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """テキストを max_tokens 以内に切り詰める（切り詰めた場合は末尾に ... を付ける）"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if ENCODER:
+        return ENCODER.decode(ENCODER.encode(text)[:max(max_tokens - 1, 0)]) + "..."
+    return text[:max(max_tokens - 1, 0) * 4] + "..."
+
+
 def validate_content_not_empty(content: str) -> None:
     """コンテンツが空でないことをチェック。空の場合は HTTPException を送出。"""
     if not content or not content.strip():
@@ -358,6 +491,244 @@ def create_summary(content: str, max_length: int = 100) -> str:
     return first_line[:max_length-3] + "..."
 
 
+_WHITESPACE_RUN_RE = re.compile(r"\s+")
+
+
+def content_hash(content: str, metadata: dict) -> str:
+    """完全一致の重複判定に使うハッシュ
+
+    NFKC 正規化して空白の連続を1つにまとめた本文と、メタデータ（キー順を揃えた JSON）の SHA-256。
+    メタデータも含めるので、別ファイルの作業や別の担当者の todo はまとめない。
+    """
+    normalized = _WHITESPACE_RUN_RE.sub(" ", unicodedata.normalize("NFKC", content)).strip()
+    canonical_metadata = json.dumps(metadata, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(f"{normalized}\0{canonical_metadata}".encode("utf-8")).hexdigest()
+
+
+# キーワード → タグの対応表（auto_extract_tags と埋め込みの概念特徴で共用）
+TAG_KEYWORD_PATTERNS = [
+    # 技術スタック
+    ('python', 'python'), ('javascript', 'javascript'), ('typescript', 'typescript'),
+    ('react', 'react'), ('vue', 'vue'), ('next.js', 'nextjs'), ('nuxt', 'nuxt'),
+    ('fastapi', 'fastapi'), ('django', 'django'), ('flask', 'flask'),
+    ('postgresql', 'postgresql'), ('postgres', 'postgresql'), ('mysql', 'mysql'),
+    ('mongodb', 'mongodb'), ('redis', 'redis'), ('sqlite', 'sqlite'),
+    ('docker', 'docker'), ('kubernetes', 'kubernetes'), ('k8s', 'kubernetes'),
+    ('aws', 'aws'), ('gcp', 'gcp'), ('azure', 'azure'),
+    # 概念
+    ('jwt', 'jwt'), ('oauth', 'oauth'), ('api', 'api'), ('rest', 'rest'),
+    ('graphql', 'graphql'), ('websocket', 'websocket'),
+    ('認証', 'auth'), ('authentication', 'auth'), ('authorization', 'auth'),
+    ('ログイン', 'auth'), ('login', 'auth'),
+    ('キャッシュ', 'cache'), ('cache', 'cache'),
+    ('ログ', 'logging'), ('logging', 'logging'),
+    ('エラー', 'error'), ('error', 'error'),
+    ('パフォーマンス', 'performance'), ('performance', 'performance'),
+]
+
+# コンテンツ → カテゴリの推定ルール（上から順に評価し、最初にキーワードが出現したカテゴリを採用）
+CATEGORY_KEYWORD_RULES = [
+    ("security", ['セキュリティ', 'security', '認証', 'authentication', 'auth', '暗号', 'encrypt', 'jwt', 'oauth']),
+    ("database", ['データベース', 'database', 'db', 'sql', 'postgres', 'mysql', 'mongodb', 'redis', 'マイグレーション']),
+    ("api", ['api', 'エンドポイント', 'endpoint', 'rest', 'graphql', 'grpc']),
+    ("architecture", ['アーキテクチャ', 'architecture', '設計', 'design', 'パターン', 'pattern']),
+    ("ui", ['ui', 'ux', 'デザイン', 'レイアウト', 'スタイル', 'css']),
+    ("test", ['テスト', 'test', 'testing', 'pytest', 'jest', 'unittest']),
+    ("infra", ['インフラ', 'infrastructure', 'deploy', 'デプロイ', 'ci/cd', 'pipeline']),
+    ("frontend", ['フロントエンド', 'frontend', 'react', 'vue', 'angular', 'next.js', 'コンポーネント']),
+    ("backend", ['バックエンド', 'backend', 'サーバー', 'server', 'fastapi', 'django', 'flask']),
+]
+
+
+def _keyword_trie_pattern(keywords: Iterable[str]) -> str:
+    """キーワード群を先頭文字で枝分かれするトライ状の正規表現にする（各位置で最長のキーワードに一致）"""
+    trie: dict = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # ここで終わるキーワードがあれば続きは省略可（貪欲なので長い方を優先）
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """カテゴリ推定・タグ抽出・埋め込みの概念特徴で共用するキーワード判定
+
+    全キーワードを1つの正規表現（トライ状の選択）にコンパイルし、テキストを1回走査して出現したキーワードを求める。
+    先読みで各位置から始まる最長のキーワードを拾い、それに含まれるキーワードも出現扱いにする
+    （ある位置から始まるキーワードはその位置の最長キーワードの接頭辞なので、auth ⊂ authentication なども漏れない）。
+    /store では同じ本文に対してカテゴリ推定とタグ抽出が続けて呼ばれるため、直前の走査結果をスレッドごとに1件保持する。
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        keywords = sorted(set(keywords))
+        self._contained = {k: frozenset(other for other in keywords if other in k) for k in keywords}
+        self._pattern = re.compile(f"(?=({_keyword_trie_pattern(keywords)}))") if keywords else None
+        self._local = threading.local()
+
+    def scan(self, text_lower: str) -> frozenset:
+        """text_lower（小文字化済み）に出現するキーワードの集合を返す"""
+        last = getattr(self._local, "last", None)
+        if last is not None and last[0] == text_lower:
+            return last[1]
+        found = set()
+        if self._pattern is not None:
+            for longest in set(self._pattern.findall(text_lower)):
+                found |= self._contained[longest]
+        found = frozenset(found)
+        self._local.last = (text_lower, found)
+        return found
+
+
+class KeywordDictionary:
+    """カテゴリ推定ルール・タグ対応表と、それをまとめた KeywordMatcher の組（差し替えの単位）"""
+
+    def __init__(
+        self,
+        category_rules: list[tuple[str, list[str]]],
+        tag_patterns: list[tuple[str, str]],
+        version: str,
+    ):
+        self.category_rules = category_rules
+        self.tag_patterns = tag_patterns
+        self.version = version
+        self.matcher = KeywordMatcher(
+            [keyword for _, keywords in category_rules for keyword in keywords]
+            + [pattern for pattern, _ in tag_patterns]
+        )
+
+
+BUILTIN_KEYWORD_DICTIONARY = KeywordDictionary(CATEGORY_KEYWORD_RULES, TAG_KEYWORD_PATTERNS, "builtin")
+
+
+def _dictionary_keyword(value, where: str) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"{where}: キーワードは空でない文字列で指定してください")
+    return value.strip().lower()
+
+
+def parse_keyword_dictionary(data: dict, version: str) -> KeywordDictionary:
+    """辞書ファイル（JSON）の内容から KeywordDictionary を作る。不正な場合は ValueError
+
+    形式:
+        {
+          "replace_defaults": false,                    // true なら組み込みの辞書を使わない
+          "categories": {"infra": ["argocd", "内製基盤"]}, // カテゴリ → キーワード（既存カテゴリには追記、新規は末尾に追加）
+          "tags": {"argocd": "argocd"}                  // キーワード → タグ
+        }
+    """
+    if not isinstance(data, dict):
+        raise ValueError("辞書ファイルは JSON オブジェクトで記述してください")
+    unknown = set(data) - {"replace_defaults", "categories", "tags"}
+    if unknown:
+        raise ValueError(f"未知のキーです: {', '.join(sorted(unknown))}")
+
+    categories = data.get("categories", {})
+    tags = data.get("tags", {})
+    if not isinstance(categories, dict) or not isinstance(tags, dict):
+        raise ValueError("categories と tags はオブジェクトで指定してください")
+
+    replace = bool(data.get("replace_defaults", False))
+    rules: dict[str, list[str]] = {} if replace else {c: list(k) for c, k in CATEGORY_KEYWORD_RULES}
+    for category, keywords in categories.items():
+        if category not in CATEGORIES:
+            raise ValueError(f"categories: 不明なカテゴリです: {category}")
+        if not isinstance(keywords, list):
+            raise ValueError(f"categories.{category}: キーワードは配列で指定してください")
+        merged = rules.setdefault(category, [])
+        for keyword in keywords:
+            keyword = _dictionary_keyword(keyword, f"categories.{category}")
+            if keyword not in merged:
+                merged.append(keyword)
+
+    tag_patterns = [] if replace else list(TAG_KEYWORD_PATTERNS)
+    for keyword, tag in tags.items():
+        keyword = _dictionary_keyword(keyword, "tags")
+        if not isinstance(tag, str) or not tag.strip():
+            raise ValueError(f"tags.{keyword}: タグは空でない文字列で指定してください")
+        tag_patterns.append((keyword, tag.strip().lower()))
+
+    return KeywordDictionary(list(rules.items()), tag_patterns, version)
+
+
+class KeywordDictionaryStore:
+    """キーワード辞書の読み込みとホットリロード
+
+    KEYWORD_DICTIONARY_PATH のファイルを読み、更新（mtime の変化）を最大 check_interval 秒間隔で検知して差し替える。
+    読み込みに失敗した場合は直前の辞書（初回は組み込み辞書）を使い続け、エラーを status() で返す。
+    """
+
+    def __init__(self, path: str, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self._dictionary = BUILTIN_KEYWORD_DICTIONARY
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._loaded_at: Optional[str] = None
+        self._error: Optional[str] = None
+        self._lock = threading.Lock()
+        if path:
+            self.reload(force=True)
+
+    def current(self) -> KeywordDictionary:
+        if self.path and time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._dictionary
+
+    def reload(self, force: bool = False) -> bool:
+        """ファイルが更新されていれば（force なら常に）読み直す。辞書を差し替えたら True"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError as e:
+                return self._fail(str(e), None)
+            if not force and mtime == self._mtime:
+                return False
+            try:
+                with open(self.path, "rb") as f:
+                    raw = f.read()
+                dictionary = parse_keyword_dictionary(json.loads(raw), hashlib.sha1(raw).hexdigest()[:12])
+            except (OSError, ValueError) as e:
+                return self._fail(str(e), mtime)
+            self._dictionary = dictionary
+            self._mtime = mtime
+            self._loaded_at = datetime.utcnow().isoformat()
+            self._error = None
+            return True
+
+    def _fail(self, error: str, mtime: Optional[float]) -> bool:
+        # 壊れたファイルを毎回読み直さないよう mtime は記録する（修正されれば mtime が変わって再読込される）
+        self._mtime = mtime
+        if error != self._error:
+            print(f"Keyword dictionary not loaded: {error}")
+        self._error = error
+        return False
+
+    def status(self) -> dict:
+        dictionary = self._dictionary
+        return {
+            "path": self.path or None,
+            "version": dictionary.version,
+            "loaded_at": self._loaded_at,
+            "error": self._error,
+            "categories": {category: len(keywords) for category, keywords in dictionary.category_rules},
+            "tag_patterns": len(dictionary.tag_patterns),
+        }
+
+
+keyword_dictionaries = KeywordDictionaryStore(KEYWORD_DICTIONARY_PATH, KEYWORD_DICTIONARY_CHECK_SECONDS)
+
+
 def auto_detect_category(content: str, file_path: Optional[str] = None) -> Optional[str]:
     """コンテンツやファイルパスからカテゴリを自動推定"""
     content_lower = content.lower()
@@ -385,33 +756,11 @@ def auto_detect_category(content: str, file_path: Optional[str] = None) -> Optio
                 return "infra"
 
     # コンテンツからの推定
-    # セキュリティ
-    if any(x in content_lower for x in ['セキュリティ', 'security', '認証', 'authentication', 'auth', '暗号', 'encrypt', 'jwt', 'oauth']):
-        return "security"
-    # データベース
-    if any(x in content_lower for x in ['データベース', 'database', 'db', 'sql', 'postgres', 'mysql', 'mongodb', 'redis', 'マイグレーション']):
-        return "database"
-    # API
-    if any(x in content_lower for x in ['api', 'エンドポイント', 'endpoint', 'rest', 'graphql', 'grpc']):
-        return "api"
-    # アーキテクチャ
-    if any(x in content_lower for x in ['アーキテクチャ', 'architecture', '設計', 'design', 'パターン', 'pattern']):
-        return "architecture"
-    # UI
-    if any(x in content_lower for x in ['ui', 'ux', 'デザイン', 'レイアウト', 'スタイル', 'css']):
-        return "ui"
-    # テスト
-    if any(x in content_lower for x in ['テスト', 'test', 'testing', 'pytest', 'jest', 'unittest']):
-        return "test"
-    # インフラ
-    if any(x in content_lower for x in ['インフラ', 'infrastructure', 'deploy', 'デプロイ', 'ci/cd', 'pipeline']):
-        return "infra"
-    # フロントエンド
-    if any(x in content_lower for x in ['フロントエンド', 'frontend', 'react', 'vue', 'angular', 'next.js', 'コンポーネント']):
-        return "frontend"
-    # バックエンド
-    if any(x in content_lower for x in ['バックエンド', 'backend', 'サーバー', 'server', 'fastapi', 'django', 'flask']):
-        return "backend"
+    dictionary = keyword_dictionaries.current()
+    found = dictionary.matcher.scan(content_lower)
+    for category, keywords in dictionary.category_rules:
+        if any(x in found for x in keywords):
+            return category
 
     return None
 
@@ -434,27 +783,10 @@ def auto_extract_tags(content: str, file_path: Optional[str] = None) -> list[str
                 tags.add(part)
 
     # キーワードマッチング
-    keyword_patterns = [
-        # 技術スタック
-        ('python', 'python'), ('javascript', 'javascript'), ('typescript', 'typescript'),
-        ('react', 'react'), ('vue', 'vue'), ('next.js', 'nextjs'), ('nuxt', 'nuxt'),
-        ('fastapi', 'fastapi'), ('django', 'django'), ('flask', 'flask'),
-        ('postgresql', 'postgresql'), ('postgres', 'postgresql'), ('mysql', 'mysql'),
-        ('mongodb', 'mongodb'), ('redis', 'redis'), ('sqlite', 'sqlite'),
-        ('docker', 'docker'), ('kubernetes', 'kubernetes'), ('k8s', 'kubernetes'),
-        ('aws', 'aws'), ('gcp', 'gcp'), ('azure', 'azure'),
-        # 概念
-        ('jwt', 'jwt'), ('oauth', 'oauth'), ('api', 'api'), ('rest', 'rest'),
-        ('graphql', 'graphql'), ('websocket', 'websocket'),
-        ('認証', 'auth'), ('authentication', 'auth'), ('authorization', 'auth'),
-        ('キャッシュ', 'cache'), ('cache', 'cache'),
-        ('ログ', 'logging'), ('logging', 'logging'),
-        ('エラー', 'error'), ('error', 'error'),
-        ('パフォーマンス', 'performance'), ('performance', 'performance'),
-    ]
-
-    for pattern, tag in keyword_patterns:
-        if pattern in content_lower:
+    dictionary = keyword_dictionaries.current()
+    found = dictionary.matcher.scan(content_lower)
+    for pattern, tag in dictionary.tag_patterns:
+        if pattern in found:
             tags.add(tag)
 
     # 最大10個まで
@@ -476,15 +808,174 @@ def select_within_budget(
     return selected
 
 
+# ============================================================
+# セマンティック検索（ローカル埋め込み）
+# ============================================================
+#
+# 外部APIを使わず、特徴ハッシングで固定長ベクトルを作る。
+#   - 単語（英数字）と文字 2/3-gram（日本語の部分一致を拾う）
+#   - TAG_KEYWORD_PATTERNS による概念特徴（「認証」「login」→ auth など言い換えの橋渡し）
+# ベクトルは L2 正規化済み float32 の BLOB として memories.embedding に保存し、
+# 検索時は内積（= コサイン類似度）で順位付けする。
+
+_EMBEDDING_WORD_RE = re.compile(r"[a-z0-9_.#+-]+")
+
+
+def _embedding_features(text: str) -> list[tuple[str, float]]:
+    """埋め込みの特徴量（特徴名, 重み）を列挙する"""
+    text_lower = text[:EMBEDDING_MAX_CHARS].lower()
+    features: list[tuple[str, float]] = []
+
+    for word in _EMBEDDING_WORD_RE.findall(text_lower):
+        features.append(("w:" + word, 1.0))
+
+    normalized = " ".join(text_lower.split())
+    for n, weight in ((2, 0.5), (3, 0.5)):
+        for i in range(len(normalized) - n + 1):
+            gram = normalized[i:i + n]
+            if " " not in gram:
+                features.append((f"c{n}:" + gram, weight))
+
+    dictionary = keyword_dictionaries.current()
+    found = dictionary.matcher.scan(text_lower)
+    concepts = {tag for pattern, tag in dictionary.tag_patterns if pattern in found}
+    for tag in concepts:
+        features.append(("t:" + tag, 3.0))
+
+    return features
+
+
+def embed_text(text: str) -> bytes:
+    """テキストを L2 正規化済み float32 ベクトル（BLOB）に変換"""
+    vector = [0.0] * EMBEDDING_DIM
+    for feature, weight in _embedding_features(text):
+        h = zlib.crc32(feature.encode("utf-8"))
+        sign = -1.0 if h & 0x80000000 else 1.0
+        vector[h % EMBEDDING_DIM] += sign * weight
+
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm:
+        vector = [v / norm for v in vector]
+    return array("f", vector).tobytes()
+
+
+def embed_memory(content: str, tags: list[str]) -> bytes:
+    """記憶（コンテンツ＋タグ）の埋め込みを計算"""
+    return embed_text(content + "\n" + " ".join(tags))
+
+
+# ============================================================
+# 近似重複（SimHash）
+# ============================================================
+#
+# 行番号や時刻だけが違う記憶を見つけるための 64bit 指紋。
+# 数字を 0 に寄せて正規化した本文の文字 3-gram から SimHash を作り、memories.simhash に符号付き整数で保存する。
+# 16bit ずつ4つのバンドに式インデックスを張り、いずれかのバンドが一致する記憶だけをハミング距離で照合する。
+
+_DIGIT_RUN_RE = re.compile(r"\d+")
+_UINT64_MASK = (1 << 64) - 1
+
+
+def simhash(text: str) -> int:
+    """本文の SimHash（SQLite の INTEGER に収まる符号付き 64bit）"""
+    normalized = unicodedata.normalize("NFKC", text[:EMBEDDING_MAX_CHARS]).lower()
+    normalized = _WHITESPACE_RUN_RE.sub(" ", _DIGIT_RUN_RE.sub("0", normalized)).strip()
+    grams = Counter(normalized[i:i + 3] for i in range(len(normalized) - 2)) or Counter([normalized])
+
+    digests = b"".join(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest() for gram in grams)
+    if np is not None:
+        bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        weights = np.fromiter(grams.values(), dtype=np.float64, count=len(grams))
+        totals = weights @ (bits.astype(np.float64) * 2 - 1)
+        value = int(np.packbits(totals > 0, bitorder="little").view("<u8")[0])
+    else:
+        totals = [0] * 64
+        for i, weight in enumerate(grams.values()):
+            h = int.from_bytes(digests[i * 8:i * 8 + 8], "little")
+            for bit in range(64):
+                totals[bit] += weight if h >> bit & 1 else -weight
+        value = sum(1 << bit for bit in range(64) if totals[bit] > 0)
+
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def simhash_distance(a: int, b: int) -> int:
+    """2つの SimHash のハミング距離"""
+    return ((a ^ b) & _UINT64_MASK).bit_count()
+
+
+def simhash_band_sql(band: int) -> str:
+    """バンドの式（インデックス定義と検索条件で同じ式を使うこと）"""
+    return f"((simhash >> {band * 16}) & 65535)"
+
+
+def simhash_band(value: int, band: int) -> int:
+    return (value >> (band * 16)) & 0xFFFF
+
+
+def semantic_scores(query_vector: bytes, blobs: list[Optional[bytes]]) -> list[float]:
+    """クエリベクトルと各記憶ベクトルのコサイン類似度を返す
+
+    埋め込み未計算（NULL）や次元数の異なる古いベクトルは 0.0 とする。
+    """
+    expected_size = EMBEDDING_DIM * 4
+    scores = [0.0] * len(blobs)
+    valid = [i for i, blob in enumerate(blobs) if blob and len(blob) == expected_size]
+    if not valid:
+        return scores
+
+    if np is not None:
+        query = np.frombuffer(query_vector, dtype=np.float32)
+        matrix = np.frombuffer(b"".join(blobs[i] for i in valid), dtype=np.float32)
+        sims = matrix.reshape(len(valid), EMBEDDING_DIM) @ query
+        for i, sim in zip(valid, sims.tolist()):
+            scores[i] = sim
+        return scores
+
+    query = array("f", query_vector)
+    for i in valid:
+        vector = array("f", blobs[i])
+        scores[i] = sum(a * b for a, b in zip(query, vector))
+    return scores
+
+
+def search_words(text: str) -> set[str]:
+    """検索語への分割（クエリ・本文・転置インデックスで共通。Unicode の小文字化と空白区切り）"""
+    return set(text.lower().split())
+
+
+def search_terms(content: str, tags: list[str]) -> str:
+    """search_terms カラムの値（本文の語と小文字化したタグを空白で囲んで並べたもの）
+
+    保存時に Python 側で分割しておき、SQL では instr(search_terms, ' 語 ') だけで判定する
+    （SQLite の lower() は ASCII のみ・全角空白で区切らないため、転置インデックスと結果がずれるのを防ぐ）。
+    空白を含むタグは空白を含まないクエリ語と一致しないので入れない。
+    """
+    terms = search_words(content) | {t.lower() for t in tags if not any(c.isspace() for c in t)}
+    return " " + " ".join(sorted(terms)) + " "
+
+
+def keyword_score(query_words: set[str], memory: MemoryResponse) -> float:
+    """キーワード一致率（0.0〜1.0）。ハイブリッド検索で類似度と合算する"""
+    if not query_words:
+        return 0.0
+    words = search_words(memory.content) | set(t.lower() for t in memory.tags)
+    return len(query_words & words) / len(query_words)
+
+
 # ============================================================
 # データベース
 # ============================================================
 
 @contextmanager
-def get_db():
-    """データベース接続を取得"""
+def get_db(check_same_thread: bool = True):
+    """データベース接続を取得
+
+    check_same_thread=False はストリーミングレスポンスのように、1つの接続を
+    スレッドプール上の複数スレッドから順に使う場合に指定する。
+    """
     Path(DATABASE_PATH).parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(DATABASE_PATH, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
@@ -495,6 +986,9 @@ def get_db():
 def init_db():
     """データベースを初期化"""
     with get_db() as conn:
+        # WAL モード: 長時間の読み取り（ストリーミングエクスポート等）中も書き込みをブロックしない
+        conn.execute("PRAGMA journal_mode=WAL")
+
         # スキーママイグレーション: 旧スキーマ(project_id)から新スキーマ(scope)への移行
         cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='memories'")
         if cursor.fetchone():
@@ -580,6 +1074,26 @@ def init_db():
         except sqlite3.OperationalError:
             pass  # カラムが既に存在する場合は無視
 
+        # embedding カラムの追加（セマンティック検索用の float32 ベクトル）
+        try:
+            conn.execute("ALTER TABLE memories ADD COLUMN embedding BLOB")
+        except sqlite3.OperationalError:
+            pass  # カラムが既に存在する場合は無視
+
+        # enrich_pending カラムの追加（/store?defer_enrich=true で自動推定を後回しにした記憶）
+        try:
+            conn.execute("ALTER TABLE memories ADD COLUMN enrich_pending INTEGER DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass  # カラムが既に存在する場合は無視
+        # 後処理に失敗した記憶のエラー（失敗した記憶はキューから外し、推定前の内容のまま残す）
+        try:
+            conn.execute("ALTER TABLE memories ADD COLUMN enrich_error TEXT")
+        except sqlite3.OperationalError:
+            pass  # カラムが既に存在する場合は無視
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_memories_enrich_pending ON memories(created_at) WHERE enrich_pending = 1"
+        )
+
         # 監査ログ
         conn.execute("""
             CREATE TABLE IF NOT EXISTS audit_logs (
@@ -594,6 +1108,21 @@ def init_db():
             )
         """)
 
+        # 冪等キー（Idempotency-Key ヘッダー）と最初の応答。IDEMPOTENCY_TTL_HOURS 経過で削除
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                owner TEXT NOT NULL,              -- ユーザーID（認証無効時は ''）
+                endpoint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                request_hash TEXT NOT NULL,       -- パス・クエリ・ボディのハッシュ
+                status_code INTEGER,              -- NULL は処理中
+                response TEXT,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (owner, endpoint, key)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys(created_at)")
+
         # インデックス
         conn.execute("CREATE INDEX IF NOT EXISTS idx_memories_scope ON memories(scope, scope_id)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_memories_type ON memories(type)")
@@ -603,6 +1132,7 @@ def init_db():
         conn.execute("CREATE INDEX IF NOT EXISTS idx_memories_deprecated ON memories(deprecated)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_user ON audit_logs(user_id)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_audit_created ON audit_logs(created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_project_members_user ON project_members(user_id, project_id)")
 
         # 旧データのマイグレーション
         cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='memories_old'")
@@ -616,9 +1146,415 @@ def init_db():
             conn.execute("DROP TABLE memories_old")
             print("Migration completed!")
 
+        init_change_tracking(conn)
+        init_project_stats(conn)
+        init_content_dedup(conn)
+        init_near_duplicates(conn)
+        init_write_coalescing(conn)
+        init_search_terms(conn)
+
         conn.commit()
 
 
+# 変更として扱うカラム（access_count や embedding など派生・統計カラムの更新は含めない）
+_TRACKED_COLUMNS = "scope, scope_id, type, content, summary, importance, metadata, category, tags, expires_at, deprecated, superseded_by"
+
+
+def init_change_tracking(conn: sqlite3.Connection):
+    """変更シーケンス・変更ログ・墓標（tombstone）をトリガーで維持する
+
+    change_seq は書き込みトランザクション内で採番するため、コミット順に単調増加する。
+    （SQLite は書き込みが直列化されるので、読み取った最大値より小さい番号が後からコミットされることはない）
+    トリガーで維持するため、/store 以外の書き込み経路（import, cleanup 等）も漏れなく記録される。
+    - memories.change_seq / updated_at: 差分エクスポート用（記憶ごとの最新の変更番号）
+    - memory_changes: 変更フィード（/changes）用の追記ログ。seq が主キーなので範囲読み出しは索引で済む
+    - memory_tombstones: 差分エクスポート用の削除記録（/import の置き換えで別スコープに移った記憶の移動元も含む）
+    """
+    try:
+        conn.execute("ALTER TABLE memories ADD COLUMN change_seq INTEGER")
+    except sqlite3.OperationalError:
+        pass  # カラムが既に存在する場合は無視
+    try:
+        conn.execute("ALTER TABLE memories ADD COLUMN updated_at TEXT")
+    except sqlite3.OperationalError:
+        pass  # カラムが既に存在する場合は無視
+
+    # 採番カウンタ（1行のみ）。purged_seq / changes_purged_seq は保持期間切れで削除した墓標・変更ログの最大番号
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS change_sequence (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL,
+            purged_seq INTEGER NOT NULL DEFAULT 0,
+            changes_purged_seq INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_tombstones (
+            id TEXT PRIMARY KEY,
+            scope TEXT,
+            scope_id TEXT,
+            change_seq INTEGER NOT NULL,
+            deleted_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS memory_changes (
+            seq INTEGER PRIMARY KEY,
+            memory_id TEXT NOT NULL,
+            op TEXT NOT NULL,
+            scope TEXT,
+            scope_id TEXT,
+            changed_at TEXT NOT NULL
+        )
+    """)
+
+    # 既存の記憶に番号を振る（初回のみ）。
+    # 既存分の変更ログは無いため、それ以前からの追従は changes_purged_seq で 410 とし、エクスポートから始めてもらう
+    if conn.execute("SELECT 1 FROM change_sequence").fetchone() is None:
+        conn.execute("UPDATE memories SET change_seq = rowid, updated_at = created_at WHERE change_seq IS NULL")
+        conn.execute("""
+            INSERT INTO change_sequence (id, value, changes_purged_seq)
+            SELECT 1, COALESCE(MAX(change_seq), 0), COALESCE(MAX(change_seq), 0) FROM memories
+        """)
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memories_change_seq ON memories(change_seq)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tombstones_change_seq ON memory_tombstones(change_seq)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_changes_scope ON memory_changes(scope_id, seq)")
+
+    now_sql = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+    seq_sql = "(SELECT value FROM change_sequence WHERE id = 1)"
+    bump = f"""
+        UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+        UPDATE memories SET change_seq = {seq_sql}, updated_at = {now_sql} WHERE id = NEW.id;
+    """
+
+    # 定義変更に追従できるよう、トリガーは毎回作り直す
+    for name in ("trg_memories_change_replace", "trg_memories_change_insert",
+                 "trg_memories_change_update", "trg_memories_change_delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    # INSERT OR REPLACE（/import）は recursive_triggers 無効だと DELETE トリガーが発火しないため、
+    # 置き換えで記憶が別のスコープに移る場合は、移動元のスコープ向けの墓標と delete の変更をここで残す
+    conn.execute(f"""
+        CREATE TRIGGER trg_memories_change_replace BEFORE INSERT ON memories
+        WHEN EXISTS (
+            SELECT 1 FROM memories
+            WHERE id = NEW.id AND (scope IS NOT NEW.scope OR scope_id IS NOT NEW.scope_id)
+        )
+        BEGIN
+            UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+            INSERT OR REPLACE INTO memory_tombstones (id, scope, scope_id, change_seq, deleted_at)
+            SELECT id, scope, scope_id, {seq_sql}, {now_sql} FROM memories WHERE id = NEW.id;
+            INSERT INTO memory_changes (seq, memory_id, op, scope, scope_id, changed_at)
+            SELECT {seq_sql}, id, 'delete', scope, scope_id, {now_sql} FROM memories WHERE id = NEW.id;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_memories_change_insert AFTER INSERT ON memories
+        BEGIN
+            {bump}
+            DELETE FROM memory_tombstones WHERE id = NEW.id AND scope IS NEW.scope AND scope_id IS NEW.scope_id;
+            INSERT INTO memory_changes (seq, memory_id, op, scope, scope_id, changed_at)
+            VALUES ({seq_sql}, NEW.id, 'insert', NEW.scope, NEW.scope_id, {now_sql});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_memories_change_update AFTER UPDATE OF {_TRACKED_COLUMNS} ON memories
+        BEGIN
+            {bump}
+            INSERT INTO memory_changes (seq, memory_id, op, scope, scope_id, changed_at)
+            VALUES ({seq_sql}, NEW.id,
+                    CASE WHEN NEW.deprecated AND NOT COALESCE(OLD.deprecated, 0) THEN 'deprecate' ELSE 'update' END,
+                    NEW.scope, NEW.scope_id, {now_sql});
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_memories_change_delete AFTER DELETE ON memories
+        BEGIN
+            UPDATE change_sequence SET value = value + 1 WHERE id = 1;
+            INSERT OR REPLACE INTO memory_tombstones (id, scope, scope_id, change_seq, deleted_at)
+            VALUES (OLD.id, OLD.scope, OLD.scope_id, {seq_sql}, {now_sql});
+            INSERT INTO memory_changes (seq, memory_id, op, scope, scope_id, changed_at)
+            VALUES ({seq_sql}, OLD.id, 'delete', OLD.scope, OLD.scope_id, {now_sql});
+        END
+    """)
+
+
+# 同じスコープ・type で有効な（廃止されていない）記憶のうち、本文が同じものを探す。
+# 条件は idx_memories_content_hash（部分一意インデックス）の定義と揃えておくこと
+_DUPLICATE_LOOKUP_SQL = """
+    SELECT * FROM memories
+    WHERE content_hash = ? AND scope = ? AND COALESCE(scope_id, '') = ? AND type = ?
+      AND COALESCE(deprecated, 0) = 0
+"""
+
+
+def init_content_dedup(conn: sqlite3.Connection):
+    """完全一致の重複を検出するための content_hash と、抑止した回数 duplicate_count を用意する
+
+    content_hash は有効な記憶の中でスコープ・type ごとに一意（部分一意インデックス）。
+    インポートや復元で既に同じ内容の記憶がある場合は NULL のまま残し、重複判定の対象外にする。
+    """
+    try:
+        conn.execute("ALTER TABLE memories ADD COLUMN content_hash TEXT")
+        added = True
+    except sqlite3.OperationalError:
+        added = False  # カラムが既に存在する場合は無視
+    try:
+        conn.execute("ALTER TABLE memories ADD COLUMN duplicate_count INTEGER DEFAULT 0")
+    except sqlite3.OperationalError:
+        pass  # カラムが既に存在する場合は無視
+
+    if added:
+        # 既存の記憶に付与（初回のみ）。同じ内容が複数ある場合は最新の1件だけが代表になる
+        claimed = set()
+        updates = []
+        cursor = conn.execute("""
+            SELECT id, scope, scope_id, type, content, metadata, deprecated FROM memories ORDER BY created_at DESC
+        """)
+        for row in cursor:
+            digest = content_hash(row["content"], json.loads(row["metadata"] or "{}"))
+            if not row["deprecated"]:
+                key = (row["scope"], row["scope_id"] or "", row["type"], digest)
+                if key in claimed:
+                    continue
+                claimed.add(key)
+            updates.append((digest, row["id"]))
+        conn.executemany("UPDATE memories SET content_hash = ? WHERE id = ?", updates)
+
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_memories_content_hash
+        ON memories(content_hash, scope, COALESCE(scope_id, ''), type)
+        WHERE content_hash IS NOT NULL AND COALESCE(deprecated, 0) = 0
+    """)
+
+
+def claimable_content_hash(
+    conn: sqlite3.Connection, memory_id: str, scope: str, scope_id: Optional[str], memory_type: str, digest: str
+) -> Optional[str]:
+    """他に同じ内容の有効な記憶がなければ digest を、あれば None を返す（更新・復元時の content_hash 用）"""
+    row = conn.execute(
+        _DUPLICATE_LOOKUP_SQL + " AND id != ?", (digest, scope, scope_id or "", memory_type, memory_id)
+    ).fetchone()
+    return None if row else digest
+
+
+def init_near_duplicates(conn: sqlite3.Connection):
+    """近似重複の検出用に simhash カラムとバンドごとの式インデックスを用意する
+
+    既存の記憶の simhash は NULL のまま（/admin/reindex で計算される）。
+    """
+    try:
+        conn.execute("ALTER TABLE memories ADD COLUMN simhash INTEGER")
+    except sqlite3.OperationalError:
+        pass  # カラムが既に存在する場合は無視
+    for band in range(SIMHASH_BANDS):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_memories_simhash_b{band} ON memories(scope_id, {simhash_band_sql(band)})"
+        )
+
+
+def init_search_terms(conn: sqlite3.Connection):
+    """キーワード検索用の search_terms カラムを用意し、未設定の記憶に付与する"""
+    try:
+        conn.execute("ALTER TABLE memories ADD COLUMN search_terms TEXT")
+    except sqlite3.OperationalError:
+        pass  # カラムが既に存在する場合は無視
+    rows = conn.execute("SELECT id, content, tags FROM memories WHERE search_terms IS NULL").fetchall()
+    conn.executemany(
+        "UPDATE memories SET search_terms = ? WHERE id = ?",
+        [(search_terms(row["content"], json.loads(row["tags"] or "[]")), row["id"]) for row in rows]
+    )
+
+
+def init_write_coalescing(conn: sqlite3.Connection):
+    """同じファイルへの作業記録をまとめるための coalesce_key（metadata.file）と、追記回数・トークン数のカラムを用意する
+
+    token_count は保存時に数えたトークン数（追記のたびに加算）。NULL の古い記憶は読み出し時に数える。
+    """
+    for column in ("coalesce_key TEXT", "coalesce_count INTEGER DEFAULT 0", "token_count INTEGER"):
+        try:
+            conn.execute(f"ALTER TABLE memories ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass  # カラムが既に存在する場合は無視
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_memories_coalesce
+        ON memories(coalesce_key, scope_id, created_at) WHERE coalesce_key IS NOT NULL
+    """)
+
+
+def find_near_duplicates(
+    conn: sqlite3.Connection,
+    scope: str,
+    scope_id: Optional[str],
+    memory_type: str,
+    value: int,
+    max_distance: int = NEAR_DUPLICATE_MAX_DISTANCE,
+    exclude_id: Optional[str] = None
+) -> list[tuple[int, sqlite3.Row]]:
+    """同じスコープ・type の有効な記憶から近似重複を探し、(距離, 行) を近い順・新しい順で返す"""
+    # 似た記憶が大量にあるバケットでも照合件数が増えすぎないよう、バンドごとに新しい方から候補を絞る
+    bands_sql = " UNION ".join(
+        f"SELECT id FROM (SELECT id FROM memories WHERE scope_id IS ? AND {simhash_band_sql(band)} = ? "
+        f"ORDER BY rowid DESC LIMIT ?)"
+        for band in range(SIMHASH_BANDS)
+    )
+    params: list = []
+    for band in range(SIMHASH_BANDS):
+        params += [scope_id, simhash_band(value, band), NEAR_DUPLICATE_CANDIDATES]
+    # CROSS JOIN でバンドの検索結果から引くよう結合順を固定する（scope の索引で全件を舐めないように）
+    cursor = conn.execute(f"""
+        SELECT m.id, m.simhash, m.created_by, m.created_at
+        FROM ({bands_sql}) AS candidates CROSS JOIN memories m ON m.id = candidates.id
+        WHERE m.scope = ? AND m.type = ? AND COALESCE(m.deprecated, 0) = 0 AND m.id != ?
+        ORDER BY m.created_at DESC LIMIT ?
+    """, params + [scope, memory_type, exclude_id or "", NEAR_DUPLICATE_CANDIDATES])
+
+    matches = []
+    for row in cursor.fetchall():
+        distance = simhash_distance(value, row["simhash"])
+        if distance <= max_distance:
+            matches.append((distance, row))
+    matches.sort(key=lambda match: match[0])  # 安定ソートなので同じ距離なら新しい順
+    return matches
+
+
+# project_stats のキー（scope_id が NULL の global も一意に扱えるよう '' に正規化する）
+_STATS_KEY_SQL = "{row}.scope, COALESCE({row}.scope_id, ''), {row}.type, CASE WHEN {row}.deprecated THEN 1 ELSE 0 END"
+# 重要度の合計は 10^6 倍した整数で持つ（REAL の加減算を繰り返すと SUM(importance) から誤差がたまるため）
+IMPORTANCE_SCALE = 1_000_000
+_STATS_IMPORTANCE_SQL = f"CAST(ROUND({{row}}.importance * {IMPORTANCE_SCALE}) AS INTEGER)"
+
+
+def rebuild_project_stats(conn: sqlite3.Connection) -> int:
+    """project_stats を memories から作り直す（コミットは呼び出し側）。作成した集計行数を返す"""
+    conn.execute("DELETE FROM project_stats")
+    cursor = conn.execute(f"""
+        INSERT INTO project_stats (scope, scope_id, type, deprecated, count, importance_micros, importance_count, last_activity)
+        SELECT {_STATS_KEY_SQL.format(row="memories")}, COUNT(*),
+               COALESCE(SUM({_STATS_IMPORTANCE_SQL.format(row="memories")}), 0), COUNT(importance), MAX(created_at)
+        FROM memories
+        GROUP BY 1, 2, 3, 4
+    """)
+    return cursor.rowcount
+
+
+def init_project_stats(conn: sqlite3.Connection):
+    """スコープ別の集計（件数・重要度合計・最終活動日時）をトリガーで維持する
+
+    /projects と /stats/{project_id} は memories を集計せずにこの表を読む（プロジェクト数・type 数に比例）。
+    last_activity は作成日時の最大値で、削除しても巻き戻さない（正確な値が必要なら /admin/stats/rebuild）。
+    重要度は AVG(importance) と同じく NULL を除いて平均できるよう、整数化した合計と NULL 以外の件数を持つ。
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(project_stats)")}
+    if columns and "importance_micros" not in columns:
+        # 旧形式（importance_sum REAL）は誤差を含むので作り直す
+        conn.execute("DROP TABLE project_stats")
+        columns = set()
+    created = not columns
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS project_stats (
+            scope TEXT NOT NULL,
+            scope_id TEXT NOT NULL,           -- global は ''
+            type TEXT NOT NULL,
+            deprecated INTEGER NOT NULL,      -- 0 / 1
+            count INTEGER NOT NULL,
+            importance_micros INTEGER NOT NULL,  -- SUM(ROUND(importance * 10^6))
+            importance_count INTEGER NOT NULL,   -- importance が NULL でない件数
+            last_activity TEXT,
+            PRIMARY KEY (scope, scope_id, type, deprecated)
+        )
+    """)
+    # プロジェクト名の一覧が変わる（プロジェクトが現れる・消える）たびに増えるカウンタ（1行のみ）。
+    # /projects/suggest の名前レジストリはこれを見て再構築する
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS project_names_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO project_names_version (id, value) VALUES (1, 0)")
+    for name in ("trg_project_names_insert", "trg_project_names_delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("""
+        CREATE TRIGGER trg_project_names_insert AFTER INSERT ON project_stats
+        WHEN NEW.scope = 'project' AND NOT EXISTS (
+            SELECT 1 FROM project_stats
+            WHERE scope = 'project' AND scope_id = NEW.scope_id AND rowid != NEW.rowid
+        )
+        BEGIN
+            UPDATE project_names_version SET value = value + 1 WHERE id = 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER trg_project_names_delete AFTER DELETE ON project_stats
+        WHEN OLD.scope = 'project' AND NOT EXISTS (
+            SELECT 1 FROM project_stats WHERE scope = 'project' AND scope_id = OLD.scope_id
+        )
+        BEGIN
+            UPDATE project_names_version SET value = value + 1 WHERE id = 1;
+        END
+    """)
+
+    if created:
+        rebuild_project_stats(conn)
+
+    def add(row: str, sign: str) -> str:
+        return f"""
+            INSERT INTO project_stats (scope, scope_id, type, deprecated, count, importance_micros, importance_count, last_activity)
+            VALUES ({_STATS_KEY_SQL.format(row=row)}, {sign}1,
+                    {sign}COALESCE({_STATS_IMPORTANCE_SQL.format(row=row)}, 0),
+                    {sign}({row}.importance IS NOT NULL), {row}.created_at)
+            ON CONFLICT (scope, scope_id, type, deprecated) DO UPDATE SET
+                count = count + excluded.count,
+                importance_micros = importance_micros + excluded.importance_micros,
+                importance_count = importance_count + excluded.importance_count,
+                last_activity = MAX(COALESCE(last_activity, ''), COALESCE(excluded.last_activity, ''));
+        """
+
+    remove_empty = "DELETE FROM project_stats WHERE count <= 0;"
+
+    for name in ("trg_project_stats_replace", "trg_project_stats_insert",
+                 "trg_project_stats_update", "trg_project_stats_delete"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    # INSERT OR REPLACE（/import）は recursive_triggers 無効だと DELETE トリガーが発火しないため、置き換え前の行をここで差し引く
+    conn.execute(f"""
+        CREATE TRIGGER trg_project_stats_replace BEFORE INSERT ON memories
+        WHEN EXISTS (SELECT 1 FROM memories WHERE id = NEW.id)
+        BEGIN
+            INSERT INTO project_stats (scope, scope_id, type, deprecated, count, importance_micros, importance_count, last_activity)
+            SELECT {_STATS_KEY_SQL.format(row="memories")}, -1,
+                   -COALESCE({_STATS_IMPORTANCE_SQL.format(row="memories")}, 0), -(importance IS NOT NULL), created_at
+            FROM memories WHERE id = NEW.id
+            ON CONFLICT (scope, scope_id, type, deprecated) DO UPDATE SET
+                count = count + excluded.count,
+                importance_micros = importance_micros + excluded.importance_micros,
+                importance_count = importance_count + excluded.importance_count;
+            {remove_empty}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_project_stats_insert AFTER INSERT ON memories
+        BEGIN
+            {add("NEW", "")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_project_stats_update AFTER UPDATE OF scope, scope_id, type, importance, deprecated, created_at ON memories
+        BEGIN
+            {add("OLD", "-")}
+            {add("NEW", "")}
+            {remove_empty}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_project_stats_delete AFTER DELETE ON memories
+        BEGIN
+            {add("OLD", "-")}
+            {remove_empty}
+        END
+    """)
+
+
 init_db()
 
 
@@ -629,8 +1565,8 @@ init_db()
 rate_limit_store: dict[str, list[float]] = defaultdict(list)
 
 
-def check_rate_limit(identifier: str) -> bool:
-    """レート制限をチェック"""
+def check_rate_limit(identifier: str, cost: int = 1) -> bool:
+    """レート制限をチェック（cost: 消費するリクエスト数。バッチ API は件数分を消費する）"""
     now = datetime.utcnow().timestamp()
     window_start = now - RATE_LIMIT_WINDOW
 
@@ -640,10 +1576,10 @@ def check_rate_limit(identifier: str) -> bool:
     ]
 
     # 制限チェック
-    if len(rate_limit_store[identifier]) >= RATE_LIMIT_REQUESTS:
+    if len(rate_limit_store[identifier]) + cost > RATE_LIMIT_REQUESTS:
         return False
 
-    rate_limit_store[identifier].append(now)
+    rate_limit_store[identifier].extend([now] * cost)
     return True
 
 
@@ -762,6 +1698,119 @@ def require_admin(func):
     return wrapper
 
 
+# ============================================================
+# 冪等性キー（Idempotency-Key）
+# ============================================================
+
+class IdempotentRequest:
+    """Idempotency-Key 付きリクエストの予約・応答保存・再送時の応答再生
+
+    キーは呼び出し元ユーザーとエンドポイントごとに独立。begin() で予約し、
+    成功時は complete() で応答を保存する（/store では記憶の INSERT と同じトランザクション）。
+    失敗時は abort() で予約を消し、修正したリクエストを同じキーで送り直せるようにする。
+    """
+
+    def __init__(self, key: str, current_user: Optional[CurrentUser], endpoint: str, request_hash: str):
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+            )
+        self.key = key
+        self.owner = current_user.user_id if current_user else ""
+        self.endpoint = endpoint
+        self.request_hash = request_hash
+
+    def derive_id(self, *parts) -> str:
+        """キーから決まる記憶ID（同じキーでの再送では同じ値になる）"""
+        seed = "\n".join([self.owner, self.endpoint, self.key, *map(str, parts)])
+        return hashlib.sha256(seed.encode("utf-8")).hexdigest()[:8]
+
+    @staticmethod
+    def hash_request(request: Request, body: bytes = b"") -> str:
+        digest = hashlib.sha256(f"{request.url.path}?{request.url.query}\n".encode("utf-8"))
+        digest.update(body)
+        return digest.hexdigest()
+
+    def begin(self) -> Optional[JSONResponse]:
+        """キーを予約する。完了済みなら最初の応答を返す（呼び出し元はそれをそのまま返す）"""
+        now = datetime.utcnow()
+        with get_db() as conn:
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < ?",
+                ((now - timedelta(hours=IDEMPOTENCY_TTL_HOURS)).isoformat(),)
+            )
+            row = conn.execute("""
+                SELECT request_hash, status_code, response, created_at FROM idempotency_keys
+                WHERE owner = ? AND endpoint = ? AND key = ?
+            """, (self.owner, self.endpoint, self.key)).fetchone()
+
+            if row is not None:
+                if row["request_hash"] != self.request_hash:
+                    conn.commit()
+                    raise HTTPException(
+                        status_code=422, detail="Idempotency-Key was already used with a different request"
+                    )
+                if row["status_code"] is not None:
+                    conn.commit()
+                    return JSONResponse(
+                        status_code=row["status_code"],
+                        content=json.loads(row["response"]),
+                        headers={"Idempotent-Replayed": "true"}
+                    )
+                stale = datetime.fromisoformat(row["created_at"]) < now - timedelta(seconds=IDEMPOTENCY_STALE_SECONDS)
+                if not stale:
+                    conn.commit()
+                    raise HTTPException(
+                        status_code=409, detail="A request with this Idempotency-Key is still in progress"
+                    )
+
+            cursor = conn.execute("""
+                INSERT OR REPLACE INTO idempotency_keys (owner, endpoint, key, request_hash, status_code, response, created_at)
+                SELECT ?, ?, ?, ?, NULL, NULL, ?
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM idempotency_keys
+                    WHERE owner = ? AND endpoint = ? AND key = ? AND created_at >= ?
+                )
+            """, (
+                self.owner, self.endpoint, self.key, self.request_hash, now.isoformat(),
+                self.owner, self.endpoint, self.key,
+                (now - timedelta(seconds=IDEMPOTENCY_STALE_SECONDS)).isoformat(),
+            ))
+            if cursor.rowcount == 0:
+                # 同じキーの並行リクエストに先を越された
+                conn.commit()
+                raise HTTPException(
+                    status_code=409, detail="A request with this Idempotency-Key is still in progress"
+                )
+
+            # 件数の上限を超えた分は古い順に削除
+            conn.execute("""
+                DELETE FROM idempotency_keys WHERE rowid IN (
+                    SELECT rowid FROM idempotency_keys ORDER BY created_at
+                    LIMIT MAX((SELECT COUNT(*) FROM idempotency_keys) - ?, 0)
+                )
+            """, (IDEMPOTENCY_MAX_KEYS,))
+            conn.commit()
+        return None
+
+    def complete(self, conn: sqlite3.Connection, status_code: int, body):
+        """応答を保存する（コミットは呼び出し側）"""
+        conn.execute("""
+            UPDATE idempotency_keys SET status_code = ?, response = ?
+            WHERE owner = ? AND endpoint = ? AND key = ?
+        """, (status_code, json.dumps(body), self.owner, self.endpoint, self.key))
+
+    def abort(self):
+        """予約を取り消す"""
+        with get_db() as conn:
+            conn.execute("""
+                DELETE FROM idempotency_keys
+                WHERE owner = ? AND endpoint = ? AND key = ? AND status_code IS NULL
+            """, (self.owner, self.endpoint, self.key))
+            conn.commit()
+
+
 # ============================================================
 # 監査ログ
 # ============================================================
@@ -792,6 +1841,30 @@ def log_audit(
         conn.commit()
 
 
+def log_audit_many(conn: sqlite3.Connection, entries: list[dict]):
+    """監査ログをまとめて記録（呼び出し側のトランザクションに含め、コミットは呼び出し側）
+
+    entries の各要素は log_audit と同じキーワード引数の dict。
+    """
+    now = datetime.utcnow().isoformat()
+    conn.executemany("""
+        INSERT INTO audit_logs (id, user_id, action, resource_type, resource_id, details, ip_address, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (
+            generate_id(),
+            e.get("user_id"),
+            e["action"],
+            e.get("resource_type"),
+            e.get("resource_id"),
+            json.dumps(e["details"]) if e.get("details") else None,
+            e.get("ip_address"),
+            now,
+        )
+        for e in entries
+    ])
+
+
 # ============================================================
 # ヘルパー関数
 # ============================================================
@@ -815,75 +1888,788 @@ def row_to_memory(row: sqlite3.Row) -> MemoryResponse:
         tags=tags,
         created_by=row["created_by"],
         created_at=row["created_at"],
-        tokens=count_tokens(content),
+        tokens=row["token_count"] if "token_count" in row.keys() and row["token_count"] is not None else count_tokens(content),
         expires_at=row["expires_at"] if "expires_at" in row.keys() else None,
         deprecated=bool(row["deprecated"]) if "deprecated" in row.keys() else False,
-        superseded_by=row["superseded_by"] if "superseded_by" in row.keys() else None
+        superseded_by=row["superseded_by"] if "superseded_by" in row.keys() else None,
+        duplicate_count=(row["duplicate_count"] or 0) if "duplicate_count" in row.keys() else 0
     )
 
 
-# ============================================================
-# API エンドポイント: ヘルスチェック
-# ============================================================
+def fetch_ranked_candidates(
+    conn: sqlite3.Connection,
+    where_sql: str,
+    params: list,
+    order_sql: str,
+    limit: int,
+    query_vector: Optional[bytes] = None
+) -> tuple[list[MemoryResponse], dict[str, float]]:
+    """候補となる記憶を取得する
 
-@app.get("/health")
-async def health():
-    """ヘルスチェック"""
-    return {
-        "status": "healthy",
-        "service": "isac-memory",
-        "version": "2.1.0",
-        "auth_required": REQUIRE_AUTH,
-        "uptime_seconds": round(time.time() - _START_TIME, 1)
-    }
+    query_vector が無い場合は order_sql の順に limit 件を返す（キーワード検索用）。
+    ある場合は条件に合う全件のベクトルを走査し、類似度上位 limit 件を類似度順に返す。
 
+    Returns:
+        (記憶のリスト, 記憶ID → コサイン類似度)
+    """
+    if query_vector is None:
+        cursor = conn.execute(
+            f"SELECT * FROM memories WHERE {where_sql} ORDER BY {order_sql} LIMIT ?",
+            params + [limit]
+        )
+        return [row_to_memory(row) for row in cursor.fetchall()], {}
 
-# ============================================================
-# API エンドポイント: 記憶管理
-# ============================================================
+    cursor = conn.execute(f"SELECT id, embedding FROM memories WHERE {where_sql}", params)
+    rows = cursor.fetchall()
+    scores = semantic_scores(query_vector, [row["embedding"] for row in rows])
+    ranked = sorted(zip(scores, (row["id"] for row in rows)), key=lambda x: x[0], reverse=True)[:limit]
+    if not ranked:
+        return [], {}
 
-@app.post("/store", response_model=StoreResponse)
-async def store_memory(
-    entry: MemoryEntry,
-    request: Request,
-    current_user: Optional[CurrentUser] = Depends(get_current_user)
-):
-    """記憶を保存"""
-    user_id = current_user.user_id if current_user else None
+    similarities = {memory_id: score for score, memory_id in ranked}
+    placeholders = ",".join("?" * len(ranked))
+    cursor = conn.execute(f"SELECT * FROM memories WHERE id IN ({placeholders})", list(similarities))
+    by_id = {row["id"]: row_to_memory(row) for row in cursor.fetchall()}
+    return [by_id[memory_id] for _, memory_id in ranked if memory_id in by_id], similarities
 
-    # バリデーション
-    validate_content_not_empty(entry.content)
-    validate_content_length(entry.content)
-    if entry.expires_at:
-        validate_expires_at(entry.expires_at)
 
-    # 制御文字サニタイズ（保存データに生制御文字が残らないようにする＝JSON堅牢化の根本対策）
-    entry.content = sanitize_control_chars(entry.content)
-    if entry.summary:
-        entry.summary = sanitize_control_chars(entry.summary)
-    entry.metadata = sanitize_metadata(entry.metadata)
+# ============================================================
+# 転置インデックス（ホットプロジェクト用）
+# ============================================================
+#
+# scope_id 単位で「単語 → doc番号配列」の転置インデックスをメモリ上に保持し、
+# キーワード検索の候補生成を SQL の全件スキャンなしで行う。
+#   - 初回アクセス時に遅延ロード、store/update/deprecate/delete で差分更新
+#   - 本文の単語・タグ・カテゴリのポスティングはいずれも昇順の doc番号配列
+#   - doc番号は削除時に即座にポスティングから外して再利用する（番号は生存 doc 数程度に収まる）
+#   - 合計サイズが INVERTED_INDEX_MAX_BYTES を超えたら LRU で追い出す
+# 有効期限などの最終判定は候補IDに対する SQL で行うため、インデックスは候補の絞り込みにのみ使う。
+
+_DOC_ALIVE = 1
+_DOC_DEPRECATED = 2
+
+
+def _posting_add(posting: array, n: int):
+    """昇順の doc番号配列に n を挿入"""
+    if not posting or posting[-1] < n:
+        posting.append(n)
+    else:
+        posting.insert(bisect_left(posting, n), n)
 
-    # type別メタデータの自動補完・検証（todo の owner 自動補完、status 既定値、enum 検証）
-    metadata_warnings = enforce_type_metadata(entry, current_user)
 
-    # レート制限
-    client_ip = request.client.host if request.client else "unknown"
-    if not check_rate_limit(user_id or client_ip):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+class IndexMatch(NamedTuple):
+    """ProjectIndex.match の1件分（並び替えに使う値も一致時点のものを持つ）"""
+    content_hits: int      # 本文の一致語数
+    tag_hits: int          # タグの一致語数
+    either_hits: int       # 本文またはタグの一致語数
+    in_category: bool      # include_category に属するか
+    importance: float
+    created_at: str
 
-    # スコープに応じた権限チェック
-    if entry.scope == MemoryScope.PROJECT and entry.scope_id:
-        if current_user and not current_user.can_write_project(entry.scope_id):
-            raise HTTPException(status_code=403, detail="No write access to this project")
 
-    if entry.scope == MemoryScope.TEAM:
-        if current_user and current_user.team_id:
-            entry.scope_id = entry.scope_id or current_user.team_id
-        elif entry.scope_id is None:
-            raise HTTPException(status_code=400, detail="team scope requires scope_id")
+class ProjectIndex:
+    """1つの scope_id に属する記憶の転置インデックス
+
+    読み書きは self._lock で直列化する（差分更新と検索が別スレッドから来るため）。
+    """
+
+    def __init__(self, scope_id: str):
+        self.scope_id = scope_id
+        self.doc_ids: list[Optional[str]] = []   # doc番号 → 記憶ID（空き番号は None）
+        self.doc_numbers: dict[str, int] = {}    # 記憶ID → doc番号
+        self.free_numbers: list[int] = []        # 再利用する doc番号（ヒープ。小さい番号から使う）
+        self.flags = bytearray()                 # doc番号 → _DOC_ALIVE | _DOC_DEPRECATED
+        self.doc_types: list[Optional[str]] = []   # doc番号 → type
+        self.doc_scopes: list[Optional[str]] = []  # doc番号 → scope
+        self.doc_categories: list[Optional[str]] = []     # doc番号 → category
+        self.doc_tags: list[frozenset] = []               # doc番号 → タグ（小文字）
+        self.doc_words: list[tuple] = []                  # doc番号 → 本文の単語（削除時にポスティングから外す）
+        self.importance = array("d")             # doc番号 → importance（同点時の並び順）
+        self.created_at: list[Optional[str]] = []  # doc番号 → created_at（同点時の並び順）
+        self.postings: dict[str, array] = {}     # 単語 → doc番号配列
+        self.tag_postings: dict[str, array] = {}       # タグ → doc番号配列
+        self.category_postings: dict[str, array] = {}  # カテゴリ → doc番号配列
+        self.approx_bytes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, scope_id: str) -> "ProjectIndex":
+        """DB から scope_id の全記憶を読み込んで構築"""
+        index = cls(scope_id)
+        cursor = conn.execute("""
+            SELECT id, scope, type, content, tags, category, importance, created_at, deprecated
+            FROM memories WHERE scope_id = ?
+        """, (scope_id,))
+        for row in cursor:
+            index.add(
+                row["id"], row["scope"], row["type"], row["content"],
+                json.loads(row["tags"] or "[]"), row["category"],
+                row["importance"], row["created_at"], bool(row["deprecated"])
+            )
+        return index
+
+    def _posting_for(self, postings: dict[str, array], key: str) -> array:
+        posting = postings.get(key)
+        if posting is None:
+            posting = postings[key] = array("I")
+            self.approx_bytes += 96 + len(key)
+        return posting
+
+    def _posting_discard(self, postings: dict[str, array], key: str, n: int):
+        """昇順の doc番号配列から n を除く（空になった配列は辞書からも消す）"""
+        posting = postings[key]
+        i = bisect_left(posting, n)
+        if i < len(posting) and posting[i] == n:
+            del posting[i]
+        if not posting:
+            del postings[key]
+            self.approx_bytes -= 96 + len(key)
+
+    def add(self, memory_id: str, scope: str, type_: str, content: str, tags: list[str],
+            category: Optional[str], importance: float, created_at: str, deprecated: bool = False):
+        """記憶を追加（既存IDの場合は置き換え）"""
+        words = tuple(search_words(content))
+        doc_tags = frozenset(t.lower() for t in tags)
+        with self._lock:
+            self._remove(memory_id)
+            flags = _DOC_ALIVE | (_DOC_DEPRECATED if deprecated else 0)
+            importance = importance if importance is not None else 0.0
+            if self.free_numbers:
+                n = heappop(self.free_numbers)
+                self.doc_ids[n] = memory_id
+                self.flags[n] = flags
+                self.doc_types[n] = type_
+                self.doc_scopes[n] = scope
+                self.doc_categories[n] = category
+                self.doc_tags[n] = doc_tags
+                self.doc_words[n] = words
+                self.importance[n] = importance
+                self.created_at[n] = created_at
+            else:
+                n = len(self.doc_ids)
+                self.doc_ids.append(memory_id)
+                self.flags.append(flags)
+                self.doc_types.append(type_)
+                self.doc_scopes.append(scope)
+                self.doc_categories.append(category)
+                self.doc_tags.append(doc_tags)
+                self.doc_words.append(words)
+                self.importance.append(importance)
+                self.created_at.append(created_at)
+            self.doc_numbers[memory_id] = n
+            self.approx_bytes += 96 + len(memory_id)
+
+            for word in words:
+                _posting_add(self._posting_for(self.postings, word), n)
+            for tag in doc_tags:
+                _posting_add(self._posting_for(self.tag_postings, tag), n)
+            if category:
+                _posting_add(self._posting_for(self.category_postings, category), n)
+            self.approx_bytes += 4 * (len(words) + len(doc_tags) + (1 if category else 0))
+
+    def remove(self, memory_id: str):
+        """記憶を削除（ポスティングから外し、doc番号を再利用に回す）"""
+        with self._lock:
+            self._remove(memory_id)
+
+    def _remove(self, memory_id: str):
+        n = self.doc_numbers.pop(memory_id, None)
+        if n is None:
+            return
+        words, doc_tags, category = self.doc_words[n], self.doc_tags[n], self.doc_categories[n]
+        for word in words:
+            self._posting_discard(self.postings, word, n)
+        for tag in doc_tags:
+            self._posting_discard(self.tag_postings, tag, n)
+        if category:
+            self._posting_discard(self.category_postings, category, n)
+        self.approx_bytes -= 96 + len(memory_id) + 4 * (len(words) + len(doc_tags) + (1 if category else 0))
+
+        self.doc_ids[n] = None
+        self.flags[n] = 0
+        self.doc_types[n] = self.doc_scopes[n] = self.doc_categories[n] = self.created_at[n] = None
+        self.doc_tags[n] = frozenset()
+        self.doc_words[n] = ()
+        heappush(self.free_numbers, n)
+
+    def set_deprecated(self, memory_id: str, deprecated: bool):
+        """廃止フラグを更新"""
+        with self._lock:
+            n = self.doc_numbers.get(memory_id)
+            if n is None:
+                return
+            self.flags[n] = _DOC_ALIVE | (_DOC_DEPRECATED if deprecated else 0)
+
+    @staticmethod
+    def sort_key(memory_id: str, match: IndexMatch, score: float) -> tuple[float, float, str, str]:
+        """検索の並び順キー (score, importance, created_at, id)。SQL 側の ORDER BY と一致させる"""
+        return (score, match.importance, match.created_at, memory_id)
+
+    @staticmethod
+    def rank(matched: dict[str, IndexMatch], scores: dict[str, float], by_importance: bool = True) -> list[str]:
+        """スコア降順（同点は importance → created_at、または created_at のみの降順）に並べた記憶ID"""
+        def sort_key(memory_id: str):
+            match = matched[memory_id]
+            if by_importance:
+                return (scores[memory_id], match.importance, match.created_at, memory_id)
+            return (scores[memory_id], match.created_at, memory_id)
+        return sorted(scores, key=sort_key, reverse=True)
+
+    def match(
+        self,
+        query_words: set[str],
+        scope: Optional[str] = None,
+        types: Optional[set[str]] = None,
+        category: Optional[str] = None,
+        tags: Optional[set[str]] = None,
+        include_deprecated: bool = False,
+        include_category: Optional[str] = None
+    ) -> dict[str, IndexMatch]:
+        """クエリ語を含む記憶を返す
+
+        include_category を指定すると、クエリ語を含まなくてもそのカテゴリの記憶を一致数0で含める
+        （/context のカテゴリ優先と同じ候補集合にするため）。
+        """
+        with self._lock:
+            # 一致数の集計はポスティング単位で Counter に任せる（doc ごとの Python ループは候補の判定だけ）
+            content_counts: Counter = Counter()
+            tag_counts: Counter = Counter()
+            either_counts: Counter = Counter()
+            for word in query_words:
+                content_docs = self.postings.get(word, ())
+                tag_docs = self.tag_postings.get(word, ())
+                content_counts.update(content_docs)
+                either_counts.update(content_docs)
+                if tag_docs:
+                    tag_counts.update(tag_docs)
+                    either_counts.update(set(tag_docs).difference(content_docs))
+            candidates = either_counts.keys()
+            if include_category:
+                candidates = candidates | set(self.category_postings.get(include_category, ()))
+
+            matched = {}
+            for n in candidates:
+                flags = self.flags[n]
+                if not flags & _DOC_ALIVE:
+                    continue
+                if flags & _DOC_DEPRECATED and not include_deprecated:
+                    continue
+                if scope and self.doc_scopes[n] != scope:
+                    continue
+                if types and self.doc_types[n] not in types:
+                    continue
+                if category and self.doc_categories[n] != category:
+                    continue
+                if tags and not tags & self.doc_tags[n]:
+                    continue
+                matched[self.doc_ids[n]] = IndexMatch(
+                    content_counts[n], tag_counts[n], either_counts[n],
+                    bool(include_category) and self.doc_categories[n] == include_category,
+                    self.importance[n], self.created_at[n]
+                )
+            return matched
+
+
+class ProjectIndexCache:
+    """ProjectIndex の LRU キャッシュ（合計サイズ上限つき）"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._indexes: OrderedDict[str, ProjectIndex] = OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, conn: sqlite3.Connection, scope_id: str) -> Optional[ProjectIndex]:
+        """インデックスを取得（未ロードなら構築してキャッシュ）"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            index = self._indexes.get(scope_id)
+            if index is not None:
+                self._indexes.move_to_end(scope_id)
+                return index
+            index = ProjectIndex.load(conn, scope_id)
+            self._indexes[scope_id] = index
+            self._evict()
+            return index
+
+    def peek(self, scope_id: Optional[str]) -> Optional[ProjectIndex]:
+        """ロード済みの場合のみインデックスを返す（差分更新・期限付きの /context 用）"""
+        if not scope_id:
+            return None
+        with self._lock:
+            return self._indexes.get(scope_id)
+
+    def warm(self, scope_id: str):
+        """未ロードならインデックスを構築する（レスポンス後のバックグラウンド処理用）"""
+        with get_db() as conn:
+            self.get(conn, scope_id)
+
+    def invalidate(self, scope_id: Optional[str] = None):
+        """インデックスを破棄（scope_id 省略時は全て）。次回アクセス時に再構築される"""
+        with self._lock:
+            if scope_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(scope_id, None)
+
+    def on_upsert(self, row):
+        """記憶の追加・更新を反映（row は memories の行、または同じキーを持つ dict）"""
+        index = self.peek(row["scope_id"])
+        if index is None:
+            return
+        with self._lock:
+            index.add(
+                row["id"], row["scope"], row["type"], row["content"],
+                json.loads(row["tags"] or "[]"), row["category"],
+                row["importance"], row["created_at"], bool(row["deprecated"])
+            )
+
+    def on_deprecate(self, memory_id: str, deprecated: bool):
+        """廃止・復元を反映"""
+        with self._lock:
+            for index in self._indexes.values():
+                index.set_deprecated(memory_id, deprecated)
+
+    def on_delete(self, memory_id: str):
+        """削除を反映"""
+        with self._lock:
+            for index in self._indexes.values():
+                index.remove(memory_id)
+
+    def total_bytes(self) -> int:
+        return sum(index.approx_bytes for index in self._indexes.values())
+
+    def _evict(self):
+        # 直近にロードしたものは残す（上限より大きい単独プロジェクトでも1つは保持）
+        while len(self._indexes) > 1 and self.total_bytes() > self.max_bytes:
+            self._indexes.popitem(last=False)
+
+
+project_indexes = ProjectIndexCache(INVERTED_INDEX_MAX_BYTES)
+
+
+# ============================================================
+# キーワード検索（SQL プッシュダウン＋キーセットページネーション）
+# ============================================================
+
+SEARCH_MAX_QUERY_WORDS = 32  # スコア計算に使うクエリ語数の上限（SQL の肥大化防止）
+
+
+def encode_search_cursor(match_only: bool, score: float, importance: float, created_at: str, memory_id: str) -> str:
+    """検索位置を不透明なカーソル文字列にする"""
+    payload = json.dumps([1 if match_only else 0, score, importance, created_at, memory_id])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_search_cursor(cursor: str) -> tuple:
+    """カーソル文字列を (match_only, score, importance, created_at, id) に戻す。不正なら 400"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        match_only, score, importance, created_at, memory_id = json.loads(payload)
+        if not isinstance(created_at, str) or not isinstance(memory_id, str):
+            raise ValueError
+        return bool(match_only), float(score), float(importance), created_at, memory_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyword_search_page(
+    conn: sqlite3.Connection,
+    query_words: set[str],
+    where_sql: str,
+    params: list,
+    position: Optional[tuple],
+    limit: int,
+    offset: int
+) -> tuple[list[MemoryResponse], Optional[str]]:
+    """キーワード一致数（本文の語またはタグに含まれるクエリ語の数）で順位付けした1ページを SQL で取得
+
+    一致が1件も無い場合は、フィルタ条件のみの一覧（score=0）を同じ並び順で返す。
+    """
+    words = sorted(query_words)[:SEARCH_MAX_QUERY_WORDS]
+    score_terms = []
+    score_params: list = []
+    for word in words:
+        score_terms.append("(instr(search_terms, ?) > 0)")
+        score_params.append(f" {word} ")
+    score_sql = " + ".join(score_terms) or "0"
+
+    def fetch(match_only: bool, position: Optional[tuple], page_limit: int, page_offset: int) -> list[sqlite3.Row]:
+        conditions = ["1=1"]
+        page_params: list = []
+        if match_only:
+            conditions.append("score > 0")
+        if position:
+            conditions.append("(score, rank_importance, created_at, id) < (?, ?, ?, ?)")
+            page_params.extend(position[1:])
+        cursor = conn.execute(f"""
+            SELECT * FROM (
+                SELECT memories.*, ({score_sql}) AS score, COALESCE(importance, 0) AS rank_importance
+                FROM memories
+                WHERE {where_sql}
+            )
+            WHERE {" AND ".join(conditions)}
+            ORDER BY score DESC, rank_importance DESC, created_at DESC, id DESC
+            LIMIT ? OFFSET ?
+        """, score_params + params + page_params + [page_limit, page_offset])
+        return cursor.fetchall()
+
+    match_only = position[0] if position else True
+    rows = fetch(match_only, position, limit + 1, offset)
+    if not rows and position is None and match_only and limit > 0:
+        # 一致が1件も無ければフィルタ条件のみの一覧に切り替える（従来の挙動）
+        if not fetch(True, None, 1, 0):
+            match_only = False
+            rows = fetch(False, None, limit + 1, offset)
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and page:
+        last = page[-1]
+        next_cursor = encode_search_cursor(
+            match_only, last["score"], last["rank_importance"], last["created_at"], last["id"]
+        )
+    return [row_to_memory(row) for row in page], next_cursor
+
+
+def indexed_keyword_page(
+    conn: sqlite3.Connection,
+    matched: dict[str, "IndexMatch"],
+    scores: dict[str, int],
+    where_sql: str,
+    params: list,
+    position: Optional[tuple],
+    limit: int,
+    offset: int
+) -> Optional[tuple[list[MemoryResponse], Optional[str]]]:
+    """転置インデックスの一致結果から keyword_search_page と同じ並び・カーソルの1ページを作る
+
+    一致が無い（またはすべて SQL 条件で除外された）場合は None（SQL 側で判定させる）。
+    """
+    if not scores:
+        return None
+    keys = {memory_id: ProjectIndex.sort_key(memory_id, matched[memory_id], score) for memory_id, score in scores.items()}
+    ranked_ids = sorted(keys, key=keys.get, reverse=True)
+    if position:
+        after = tuple(position[1:])
+        ranked_ids = [memory_id for memory_id in ranked_ids if keys[memory_id] < after]
+        if not ranked_ids:
+            return [], None
+
+    memories = fetch_indexed_candidates(conn, ranked_ids, where_sql, params, offset + limit + 1)
+    if not memories and position is None:
+        return None
+    rows = memories[offset:]
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and page:
+        next_cursor = encode_search_cursor(True, *keys[page[-1].id])
+    return page, next_cursor
 
-    memory_id = generate_id()
-    now = datetime.utcnow().isoformat()
+
+# ============================================================
+# コンテキストのレンダリング・キャッシュ
+# ============================================================
+
+# tier の表示順と見出し（/context の優先順と同じ）
+CONTEXT_TIER_TITLES = [
+    ("project_decisions", "プロジェクトの決定事項"),
+    ("project_recent", "最近の作業"),
+    ("global_knowledge", "グローバルナレッジ"),
+    ("team_knowledge", "チームナレッジ"),
+]
+
+
+def render_context(context: "ContextResponse", fmt: ContextFormat, max_tokens: int) -> tuple[str, list[str]]:
+    """ContextResponse を Hook で注入できるテキストに変換する
+
+    tier ごとに見出しを付け、各記憶は要約行＋本文（要約と異なる場合のみ）で表す。
+    出力全体が max_tokens を超えないよう、本文・要約を残り予算に合わせて切り詰める。
+    記憶が1件も無い場合は空文字列を返す。
+
+    Returns:
+        (テキスト, 切り詰めずに出力できた記憶IDのリスト)
+    """
+    markdown = fmt == ContextFormat.MARKDOWN
+    blocks: list[str] = []
+    rendered_ids: list[str] = []
+    remaining = max_tokens
+
+    for field, title in CONTEXT_TIER_TITLES:
+        memories = getattr(context, field)
+        if not memories:
+            continue
+        heading = f"## {title}" if markdown else f"[{title}]"
+        remaining -= count_tokens(heading) + 1
+        if remaining <= 0:
+            break
+        lines = [heading]
+        for m in memories:
+            label = f"[{m.category}] " if m.category else ""
+            summary = m.summary or create_summary(m.content)
+            line = f"- {label}{summary}"
+            line_tokens = count_tokens(line)
+            complete = line_tokens <= remaining
+            if not complete:
+                line = truncate_to_tokens(line, remaining)
+                line_tokens = remaining
+            if not line:
+                break
+            lines.append(line)
+            remaining -= line_tokens + 1
+
+            body = m.content.strip()
+            if body and body != summary:
+                truncated_body = truncate_to_tokens(body, remaining) if remaining > 0 else ""
+                complete = complete and truncated_body == body
+                if truncated_body:
+                    indented = "\n".join("  " + body_line for body_line in truncated_body.split("\n"))
+                    lines.append(indented)
+                    remaining -= count_tokens(indented) + 1
+            if complete:
+                rendered_ids.append(m.id)
+            if remaining <= 0:
+                break
+        blocks.append("\n".join(lines))
+        if remaining <= 0:
+            break
+
+    if context.unchanged_ids:
+        blocks.append(f"（送信済みの記憶 {len(context.unchanged_ids)} 件は省略: {', '.join(context.unchanged_ids)}）")
+    if not blocks:
+        return "", rendered_ids
+    if context.truncated:
+        blocks.append("（期限内に取得できなかった記憶があります）")
+    return "\n\n".join(blocks) + "\n", rendered_ids
+
+
+class ContextCache:
+    """/context の結果キャッシュ
+
+    同じユーザー・同じパラメータのリクエストに対し、ContextResponse とレンダリング済み
+    テキスト（format ごと）を同じエントリで保持する。記憶の書き込みがあれば全体を破棄する。
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.generation = 0  # 書き込みのたびに増える（計算中の結果が古くなったかの判定用）
+        self._entries: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[dict]:
+        if self.ttl_seconds <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires"] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, context: "ContextResponse", generation: int) -> dict:
+        """結果を保存（計算開始後に書き込みがあった場合はキャッシュしない）"""
+        entry = {"context": context, "rendered": {}, "expires": time.monotonic() + self.ttl_seconds}
+        if self.ttl_seconds <= 0 or context.truncated:
+            return entry
+        with self._lock:
+            if generation != self.generation:
+                return entry
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+context_cache = ContextCache(CONTEXT_CACHE_TTL, CONTEXT_CACHE_SIZE)
+
+
+def memory_version(memory: MemoryResponse) -> str:
+    """記憶の内容から短いバージョン文字列を作る（内容が変われば変わる）"""
+    payload = json.dumps([
+        memory.content, memory.summary, memory.tags, memory.category,
+        memory.importance, memory.deprecated, memory.superseded_by
+    ], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+class ContextSessionStore:
+    """セッションごとに送信済みの記憶ID→バージョンを保持する（TTL・件数上限つき）"""
+
+    def __init__(self, ttl_seconds: int, max_sessions: int, max_ids: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_ids = max_ids
+        self._sessions: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def apply_delta(self, key: tuple, context: "ContextResponse") -> "ContextResponse":
+        """送信済みで変更のない記憶を除いた ContextResponse を返す
+
+        送信済み集合は更新しない。実際に送った記憶が決まってから mark_sent で記録する。
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None or session["expires"] < time.monotonic():
+                sent = {}
+            else:
+                sent = dict(session["sent"])
+
+        unchanged_ids: list[str] = []
+        tiers = {}
+        for field, _ in CONTEXT_TIER_TITLES:
+            delta = []
+            for m in getattr(context, field):
+                if sent.get(m.id) == memory_version(m):
+                    unchanged_ids.append(m.id)
+                else:
+                    delta.append(m)
+            tiers[field] = delta
+
+        return context.model_copy(update={
+            **tiers,
+            "total_tokens": sum(m.tokens for memories in tiers.values() for m in memories),
+            "unchanged_ids": unchanged_ids,
+        })
+
+    def mark_sent(self, key: tuple, memories: list[MemoryResponse], unchanged_ids: list[str]):
+        """送信した記憶（と省略を通知した送信済みの記憶）を送信済み集合に記録する"""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            if session is None or session["expires"] < now:
+                session = {"sent": OrderedDict()}
+            sent: OrderedDict[str, str] = session["sent"]
+            for memory_id in unchanged_ids:
+                if memory_id in sent:
+                    sent.move_to_end(memory_id)
+            for m in memories:
+                sent[m.id] = memory_version(m)
+                sent.move_to_end(m.id)
+            while len(sent) > self.max_ids:
+                sent.popitem(last=False)
+
+            session["expires"] = now + self.ttl_seconds
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+
+context_sessions = ContextSessionStore(CONTEXT_SESSION_TTL, CONTEXT_SESSION_MAX, CONTEXT_SESSION_MAX_IDS)
+
+
+def fetch_indexed_candidates(
+    conn: sqlite3.Connection,
+    ranked_ids: list[str],
+    where_sql: str,
+    params: list,
+    limit: int
+) -> list[MemoryResponse]:
+    """インデックスで順位付けした記憶IDから、SQL の条件（有効期限・廃止）を満たすものを上位 limit 件取得"""
+    memories: list[MemoryResponse] = []
+    chunk_size = max(limit * 2, 50)
+    for start in range(0, len(ranked_ids), chunk_size):
+        chunk = ranked_ids[start:start + chunk_size]
+        placeholders = ",".join("?" * len(chunk))
+        cursor = conn.execute(
+            f"SELECT * FROM memories WHERE id IN ({placeholders}) AND {where_sql}",
+            chunk + params
+        )
+        by_id = {row["id"]: row_to_memory(row) for row in cursor.fetchall()}
+        memories.extend(by_id[memory_id] for memory_id in chunk if memory_id in by_id)
+        if len(memories) >= limit:
+            break
+    return memories[:limit]
+
+
+# ============================================================
+# API エンドポイント: ヘルスチェック
+# ============================================================
+
+@app.get("/health")
+async def health():
+    """ヘルスチェック"""
+    return {
+        "status": "healthy",
+        "service": "isac-memory",
+        "version": "2.1.0",
+        "auth_required": REQUIRE_AUTH,
+        "uptime_seconds": round(time.time() - _START_TIME, 1)
+    }
+
+
+# ============================================================
+# API エンドポイント: 記憶管理
+# ============================================================
+
+class PreparedMemory(BaseModel):
+    """検証・正規化済みの保存内容（/store と /store/batch で共通）"""
+    id: str
+    created_at: str
+    expires_at: str
+    summary: Optional[str]
+    category: Optional[str]
+    tags: list[str]
+    warnings: list[str]
+    content_hash: str
+    simhash: Optional[int]  # defer_enrich の場合は None（EnrichmentWorker が計算する）
+    token_count: Optional[int]  # 同上
+    enrich_pending: bool = False  # カテゴリ/タグ推定・要約・埋め込みをバックグラウンドに任せる
+    deduplicated: bool = False  # insert_memory が同じ内容の既存の記憶を更新した（id 等はその記憶のもの）
+    duplicate_count: int = 0
+    near_duplicate_ids: list[str] = Field(default_factory=list)  # insert_memory が見つけた近似重複
+    coalesced: bool = False  # insert_memory が同じファイルの開いている作業記憶に追記した
+    coalesce_count: int = 0
+
+
+def prepare_store_entry(
+    entry: MemoryEntry,
+    current_user: Optional[CurrentUser],
+    defer_enrich: bool = False
+) -> PreparedMemory:
+    """/store の検証・サニタイズ・権限チェック・カテゴリ/タグ推定を行う
+
+    entry はサニタイズ済みの内容に書き換えられる。不正な場合は HTTPException を送出。
+    defer_enrich=True の場合、カテゴリ/タグ推定・要約生成・トークン数と SimHash の計算は行わず、
+    指定された値だけを使う（EnrichmentWorker が後から補完する。近似重複の判定も行わない）。
+    """
+    # バリデーション
+    validate_content_not_empty(entry.content)
+    validate_content_length(entry.content)
+    if entry.expires_at:
+        validate_expires_at(entry.expires_at)
+
+    # 制御文字サニタイズ（保存データに生制御文字が残らないようにする＝JSON堅牢化の根本対策）
+    entry.content = sanitize_control_chars(entry.content)
+    if entry.summary:
+        entry.summary = sanitize_control_chars(entry.summary)
+    entry.metadata = sanitize_metadata(entry.metadata)
+
+    # type別メタデータの自動補完・検証（todo の owner 自動補完、status 既定値、enum 検証）
+    metadata_warnings = enforce_type_metadata(entry, current_user)
+
+    # スコープに応じた権限チェック
+    if entry.scope == MemoryScope.PROJECT and entry.scope_id:
+        if current_user and not current_user.can_write_project(entry.scope_id):
+            raise HTTPException(status_code=403, detail="No write access to this project")
+
+    if entry.scope == MemoryScope.TEAM:
+        if current_user and current_user.team_id:
+            entry.scope_id = entry.scope_id or current_user.team_id
+        elif entry.scope_id is None:
+            raise HTTPException(status_code=400, detail="team scope requires scope_id")
 
     # TTL計算（ユーザー指定があればそちらを優先）
     if entry.expires_at:
@@ -892,8 +2678,22 @@ async def store_memory(
         ttl_days = DEFAULT_TTL_DAYS.get(entry.type.value, 30)
         expires_at = (datetime.utcnow() + timedelta(days=ttl_days)).isoformat()
 
-    # 要約生成
-    summary = entry.summary or create_summary(entry.content)
+    digest = content_hash(entry.content, entry.metadata)
+
+    if defer_enrich:
+        return PreparedMemory(
+            id=generate_id(),
+            created_at=datetime.utcnow().isoformat(),
+            expires_at=expires_at,
+            summary=entry.summary,
+            category=entry.category.value if entry.category else None,
+            tags=list(dict.fromkeys(entry.tags))[:10],
+            warnings=metadata_warnings,
+            content_hash=digest,
+            simhash=None,
+            token_count=None,
+            enrich_pending=True,
+        )
 
     # カテゴリ・タグの処理
     # メタデータからファイルパスを取得（自動推定用）
@@ -906,80 +2706,713 @@ async def store_memory(
     auto_tags = auto_extract_tags(entry.content, file_path)
     all_tags = list(set(entry.tags + auto_tags))[:10]  # 最大10個
 
+    return PreparedMemory(
+        id=generate_id(),
+        created_at=datetime.utcnow().isoformat(),
+        expires_at=expires_at,
+        summary=entry.summary or create_summary(entry.content),  # 要約生成
+        category=category,
+        tags=all_tags,
+        warnings=metadata_warnings,
+        content_hash=digest,
+        simhash=simhash(entry.content),
+        token_count=count_tokens(entry.content),
+    )
+
+
+def insert_memory_row(
+    conn: sqlite3.Connection,
+    entry: MemoryEntry,
+    prepared: PreparedMemory,
+    user_id: Optional[str],
+    digest: Optional[str]
+):
+    """memories に1行 INSERT する（digest が None なら重複判定の対象外）"""
+    conn.execute("""
+        INSERT INTO memories (id, scope, scope_id, type, content, summary, importance, metadata, category, tags, created_by, created_at, expires_at, deprecated, embedding, enrich_pending, content_hash, simhash, coalesce_key, token_count, search_terms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, FALSE, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        prepared.id,
+        entry.scope.value,
+        entry.scope_id,
+        entry.type.value,
+        entry.content,
+        prepared.summary,
+        entry.importance,
+        json.dumps(entry.metadata),
+        prepared.category,
+        json.dumps(prepared.tags),
+        user_id,
+        prepared.created_at,
+        prepared.expires_at,
+        None if prepared.enrich_pending else embed_memory(entry.content, prepared.tags),
+        1 if prepared.enrich_pending else 0,
+        digest,
+        prepared.simhash,
+        coalesce_key(entry),
+        prepared.token_count,
+        search_terms(entry.content, prepared.tags)
+    ))
+
+
+def coalesce_key(entry: MemoryEntry) -> Optional[str]:
+    """追記でまとめる対象なら metadata.file を返す（ファイルの指定がある work 記憶のみ）"""
+    file_path = entry.metadata.get("file")
+    if entry.type == MemoryType.WORK and isinstance(file_path, str) and file_path:
+        return file_path
+    return None
+
+
+def find_coalesce_target(
+    conn: sqlite3.Connection,
+    entry: MemoryEntry,
+    user_id: Optional[str],
+    window_seconds: int
+) -> Optional[sqlite3.Row]:
+    """同じスコープ・ファイル・作成者で、時間窓内に保存（追記）された有効な作業記憶を返す"""
+    key = coalesce_key(entry)
+    if key is None or entry.supersedes:
+        return None
+    since = (datetime.utcnow() - timedelta(seconds=window_seconds)).isoformat()
+    row = conn.execute("""
+        SELECT * FROM memories
+        WHERE coalesce_key = ? AND scope_id IS ? AND created_at >= ?
+          AND scope = ? AND created_by IS ? AND COALESCE(deprecated, 0) = 0
+        ORDER BY created_at DESC LIMIT 1
+    """, (key, entry.scope_id, since, entry.scope.value, user_id)).fetchone()
+    if row is None or len(row["content"]) + 1 + len(entry.content) > MAX_CONTENT_LENGTH:
+        return None
+    return row
+
+
+def append_to_memory(conn: sqlite3.Connection, row: sqlite3.Row, entry: MemoryEntry, prepared: PreparedMemory):
+    """開いている作業記憶の末尾に今回の内容を追記する
+
+    トークン数・タグは追記分だけを数えて既存の値に足す（本文全体を数え直さない）。
+    defer_enrich の保存ではトークン数・SimHash を NULL にして後処理に任せる。
+    作成日時を今回の保存日時に進めるので、保存が続く間は同じ記憶に追記され続ける。
+    entry / prepared は追記後の記憶の内容に書き換える。
+    """
+    content = row["content"]
+    # 後処理待ちの保存ではトークン数・SimHash を NULL にし、EnrichmentWorker に数え直させる
+    deferred = prepared.token_count is None
+    token_count = None
+    if not deferred:
+        token_count = row["token_count"] if row["token_count"] is not None else count_tokens(content)
+    if not content.endswith(entry.content):  # 直前と同じ内容の保存は追記しない
+        content += "\n" + entry.content
+        if not deferred:
+            token_count += count_tokens("\n" + entry.content)
+    tags = list(dict.fromkeys(json.loads(row["tags"] or "[]") + prepared.tags))[:10]
+    importance = max(row["importance"] or 0.0, entry.importance)
+    expires_at = max(row["expires_at"] or "", prepared.expires_at)
+    enrich_pending = prepared.enrich_pending or bool(row["enrich_pending"])
+    digest = claimable_content_hash(
+        conn, row["id"], row["scope"], row["scope_id"], row["type"],
+        content_hash(content, json.loads(row["metadata"] or "{}"))
+    )
+    fingerprint = None if deferred else simhash(content)
+    conn.execute("""
+        UPDATE memories
+        SET content = ?, tags = ?, token_count = ?, importance = ?, expires_at = ?, created_at = ?,
+            content_hash = ?, simhash = ?, embedding = ?, enrich_pending = ?, search_terms = ?,
+            coalesce_count = COALESCE(coalesce_count, 0) + 1
+        WHERE id = ?
+    """, (
+        content, json.dumps(tags), token_count, importance, expires_at, prepared.created_at,
+        digest, fingerprint, None if enrich_pending else embed_memory(content, tags), 1 if enrich_pending else 0,
+        search_terms(content, tags), row["id"]
+    ))
+
+    entry.content = content
+    entry.importance = importance
+    prepared.id = row["id"]
+    prepared.expires_at = expires_at
+    prepared.summary = row["summary"]
+    prepared.category = row["category"]
+    prepared.tags = tags
+    prepared.token_count = token_count
+    prepared.simhash = fingerprint
+    prepared.near_duplicate_ids = [i for i in prepared.near_duplicate_ids if i != row["id"]]
+    prepared.enrich_pending = enrich_pending
+    prepared.coalesced = True
+    prepared.coalesce_count = (row["coalesce_count"] or 0) + 1
+
+
+def duplicate_adds_information(row: sqlite3.Row, entry: MemoryEntry) -> bool:
+    """同じ内容の保存が、既存の記憶にないタグ・カテゴリ・要約を指定しているか"""
+    if entry.category and entry.category.value != row["category"]:
+        return True
+    if entry.summary and entry.summary != row["summary"]:
+        return True
+    return not set(entry.tags) <= set(json.loads(row["tags"] or "[]"))
+
+
+def insert_memory(
+    conn: sqlite3.Connection,
+    entry: MemoryEntry,
+    prepared: PreparedMemory,
+    current_user: Optional[CurrentUser],
+    near_duplicates: NearDuplicatePolicy = NearDuplicatePolicy.KEEP,
+    coalesce_window: int = 0
+) -> tuple[list[str], list[dict]]:
+    """記憶を INSERT し、supersedes の記憶を廃止する（コミットは呼び出し側）
+
+    同じスコープ・type に本文・メタデータが同じ（content_hash が一致する）有効な記憶があれば INSERT せず、
+    その記憶を保存し直したものとして更新する（refresh_duplicate）。
+    ただし既存の記憶にないタグ・カテゴリ・要約が指定されている場合は、別の記憶として保存する。
+    完全一致がなければ近似重複（SimHash）を探して prepared.near_duplicate_ids に入れ、
+    near_duplicates に従って最も近い記憶にまとめる（merge）か、新しい記憶で廃止する（supersede）。
+    重複でなく coalesce_window > 0 の場合、同じファイルの作業記録は窓内の直近の記憶に追記する（append_to_memory）。
+
+    Returns:
+        (廃止した記憶IDのリスト, スキップした廃止対象のリスト)
+    """
+    user_id = current_user.user_id if current_user else None
+    lookup = (prepared.content_hash, entry.scope.value, entry.scope_id or "", entry.type.value)
+    duplicate = conn.execute(_DUPLICATE_LOOKUP_SQL, lookup).fetchone()
+    near_merge = False
+    if duplicate is None and prepared.simhash is not None:
+        near = find_near_duplicates(conn, entry.scope.value, entry.scope_id, entry.type.value, prepared.simhash)
+        prepared.near_duplicate_ids = [row["id"] for _, row in near]
+        if near and near_duplicates == NearDuplicatePolicy.MERGE:
+            duplicate = conn.execute("SELECT * FROM memories WHERE id = ?", (near[0][1]["id"],)).fetchone()
+            near_merge = True
+    coalesce_target = None
+    if duplicate is None and coalesce_window > 0:
+        coalesce_target = find_coalesce_target(conn, entry, user_id, coalesce_window)
+    if coalesce_target is not None:
+        append_to_memory(conn, coalesce_target, entry, prepared)
+    elif duplicate is None:
+        try:
+            insert_memory_row(conn, entry, prepared, user_id, prepared.content_hash)
+        except sqlite3.IntegrityError:
+            # 同じ内容が別の接続から並行して保存された
+            duplicate = conn.execute(_DUPLICATE_LOOKUP_SQL, lookup).fetchone()
+            if duplicate is None:
+                raise
+    if duplicate is not None:
+        if duplicate_adds_information(duplicate, entry):
+            # 完全一致なら重複判定の代表は既存の記憶のまま。
+            # 近似重複は本文が異なるので、次の完全一致の保存で見つかるよう自身の content_hash を持たせる
+            insert_memory_row(conn, entry, prepared, user_id, prepared.content_hash if near_merge else None)
+        else:
+            refresh_duplicate(conn, duplicate, entry, prepared)
+
+    supersedes = list(entry.supersedes)
+    if near_duplicates == NearDuplicatePolicy.SUPERSEDE and not (prepared.deduplicated or prepared.coalesced):
+        supersedes += prepared.near_duplicate_ids
+
+    # supersedes で指定された記憶を廃止（重複を除外）
     superseded_ids = []
-    with get_db() as conn:
+    skipped_ids = []
+    processed_ids = set()  # 重複チェック用
+    for old_id in supersedes:
+        if old_id in processed_ids:
+            continue  # 重複はスキップ
+        processed_ids.add(old_id)
+        if old_id == prepared.id:
+            skipped_ids.append({"id": old_id, "reason": "same_content"})  # 重複として更新した記憶自身
+            continue
+        cursor = conn.execute("SELECT id, created_by FROM memories WHERE id = ?", (old_id,))
+        row = cursor.fetchone()
+        if not row:
+            skipped_ids.append({"id": old_id, "reason": "not_found"})
+            continue
+
+        # 権限チェック: 作成者または管理者のみ廃止可能
+        if current_user and not current_user.is_admin:
+            if row["created_by"] and row["created_by"] != user_id:
+                skipped_ids.append({"id": old_id, "reason": "permission_denied"})
+                continue
+
         conn.execute("""
-            INSERT INTO memories (id, scope, scope_id, type, content, summary, importance, metadata, category, tags, created_by, created_at, expires_at, deprecated)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, FALSE)
-        """, (
-            memory_id,
-            entry.scope.value,
-            entry.scope_id,
-            entry.type.value,
-            entry.content,
-            summary,
-            entry.importance,
-            json.dumps(entry.metadata),
-            category,
-            json.dumps(all_tags),
-            user_id,
-            now,
-            expires_at
-        ))
+            UPDATE memories
+            SET deprecated = TRUE, superseded_by = ?
+            WHERE id = ?
+        """, (prepared.id, old_id))
+        superseded_ids.append(old_id)
+
+    return superseded_ids, skipped_ids
+
+
+def refresh_duplicate(conn: sqlite3.Connection, row: sqlite3.Row, entry: MemoryEntry, prepared: PreparedMemory):
+    """重複した保存を既存の記憶の更新として扱う
+
+    作成日時を今回の保存日時に進め（コンテキストの「最近の作業」に残す）、重要度・有効期限は大きい方を残し、
+    duplicate_count を1増やす。entry / prepared は既存の記憶の内容に書き換える。
+    """
+    importance = max(row["importance"] or 0.0, entry.importance)
+    expires_at = max(row["expires_at"] or "", prepared.expires_at)
+    conn.execute("""
+        UPDATE memories
+        SET created_at = ?, importance = ?, expires_at = ?, duplicate_count = COALESCE(duplicate_count, 0) + 1
+        WHERE id = ?
+    """, (prepared.created_at, importance, expires_at, row["id"]))
+
+    entry.content = row["content"]
+    entry.importance = importance
+    prepared.id = row["id"]
+    prepared.expires_at = expires_at
+    prepared.summary = row["summary"]
+    prepared.category = row["category"]
+    prepared.tags = json.loads(row["tags"] or "[]")
+    prepared.token_count = row["token_count"]
+    prepared.enrich_pending = bool(row["enrich_pending"])
+    prepared.deduplicated = True
+    prepared.duplicate_count = (row["duplicate_count"] or 0) + 1
+
+
+def index_stored_memory(entry: MemoryEntry, prepared: PreparedMemory, superseded_ids: list[str]):
+    """転置インデックスの差分更新（ロード済みプロジェクトのみ）"""
+    project_indexes.on_upsert({
+        "id": prepared.id, "scope": entry.scope.value, "scope_id": entry.scope_id,
+        "type": entry.type.value, "content": entry.content, "tags": json.dumps(prepared.tags),
+        "category": prepared.category, "importance": entry.importance, "created_at": prepared.created_at,
+        "deprecated": False,
+    })
+    for old_id in superseded_ids:
+        project_indexes.on_deprecate(old_id, True)
+
+
+def store_response(
+    entry: MemoryEntry,
+    prepared: PreparedMemory,
+    superseded_ids: list[str],
+    skipped_ids: list[dict]
+) -> StoreResponse:
+    if prepared.deduplicated:
+        message = f"Duplicate of existing memory, refreshed ({entry.scope.value}/{entry.type.value})"
+    elif prepared.coalesced:
+        message = f"Appended to recent work memory ({entry.scope.value}/{entry.type.value})"
+    else:
+        message = f"Memory stored ({entry.scope.value}/{entry.type.value})"
+    return StoreResponse(
+        id=prepared.id,
+        tokens=prepared.token_count if prepared.token_count is not None else count_tokens(entry.content),
+        scope=entry.scope,
+        scope_id=entry.scope_id,
+        category=prepared.category,
+        tags=prepared.tags,
+        message=message,
+        superseded_ids=superseded_ids,
+        skipped_supersedes=skipped_ids,
+        warnings=prepared.warnings,
+        deduplicated=prepared.deduplicated,
+        duplicate_count=prepared.duplicate_count,
+        near_duplicate_ids=prepared.near_duplicate_ids,
+        coalesced=prepared.coalesced,
+        coalesce_count=prepared.coalesce_count
+    )
+
+
+class EnrichmentWorker:
+    """defer_enrich で保存した記憶の後処理（カテゴリ/タグ推定・要約・埋め込み・トークン数・SimHash・転置インデックス）を行うワーカー
+
+    キューは memories.enrich_pending = 1 の行そのもので、再起動時の未処理分や別プロセスの書き込みも拾える。
+    保存時に notify() で起こし、それ以外は ENRICH_POLL_INTERVAL ごとに未処理の行を確認する。
+    処理中に PATCH などで行が変わった場合は上書きせず、次のバッチで読み直す。
+    1行の処理で例外が出た場合はその行だけ enrich_error に記録してキューから外し、残りの行は処理を続ける
+    （同じ行で毎回失敗してキューが詰まるのを防ぐ）。
+    """
 
-        # supersedes で指定された記憶を廃止（重複を除外）
-        skipped_ids = []
-        processed_ids = set()  # 重複チェック用
-        if entry.supersedes:
-            for old_id in entry.supersedes:
-                if old_id in processed_ids:
-                    continue  # 重複はスキップ
-                processed_ids.add(old_id)
-                cursor = conn.execute("SELECT id, created_by FROM memories WHERE id = ?", (old_id,))
-                row = cursor.fetchone()
-                if not row:
-                    skipped_ids.append({"id": old_id, "reason": "not_found"})
+    def __init__(self, batch_size: int, batch_delay: float, poll_interval: float):
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.poll_interval = poll_interval
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_at: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def notify(self):
+        """未処理の記憶があることを知らせる（ワーカーが未起動なら起動する）"""
+        with self._lock:
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name="enrichment-worker", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            time.sleep(self.batch_delay)
+            try:
+                while self.process_batch():
+                    pass
+            except Exception as e:
+                self.last_error = str(e)
+
+    def process_batch(self) -> int:
+        """未処理の記憶を古い順に最大 batch_size 件処理し、処理した件数を返す"""
+        with get_db() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM memories WHERE enrich_pending = 1 ORDER BY created_at LIMIT ?
+            """, (self.batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                return 0
+
+            updates = []
+            failures = []
+            enriched = {}
+            for row in rows:
+                try:
+                    file_path = json.loads(row["metadata"] or "{}").get("file")
+                    category = row["category"] or auto_detect_category(row["content"], file_path)
+                    tags = list(set(json.loads(row["tags"] or "[]") + auto_extract_tags(row["content"], file_path)))[:10]
+                    summary = row["summary"] or create_summary(row["content"])
+                    token_count = row["token_count"] if row["token_count"] is not None else count_tokens(row["content"])
+                    fingerprint = row["simhash"] if row["simhash"] is not None else simhash(row["content"])
+                    updates.append((
+                        category, json.dumps(tags), summary, embed_memory(row["content"], tags),
+                        search_terms(row["content"], tags), token_count, fingerprint, row["id"], row["change_seq"]
+                    ))
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    failures.append((error, row["id"], row["change_seq"]))
+                    self.last_error = f"{row['id']}: {error}"
+                    enriched[row["id"]] = dict(row)  # 推定前の内容のまま転置インデックスに載せる
                     continue
+                enriched[row["id"]] = {**dict(row), "category": category, "tags": json.dumps(tags)}
 
-                # 権限チェック: 作成者または管理者のみ廃止可能
-                if current_user and not current_user.is_admin:
-                    if row["created_by"] and row["created_by"] != user_id:
-                        skipped_ids.append({"id": old_id, "reason": "permission_denied"})
-                        continue
+            conn.executemany("""
+                UPDATE memories
+                SET category = ?, tags = ?, summary = ?, embedding = ?, search_terms = ?, token_count = ?, simhash = ?,
+                    enrich_pending = 0, enrich_error = NULL
+                WHERE id = ? AND enrich_pending = 1 AND change_seq IS ?
+            """, updates)
+            conn.executemany("""
+                UPDATE memories SET enrich_pending = 0, enrich_error = ?
+                WHERE id = ? AND enrich_pending = 1 AND change_seq IS ?
+            """, failures)
+            conn.commit()
 
-                conn.execute("""
-                    UPDATE memories
-                    SET deprecated = TRUE, superseded_by = ?
-                    WHERE id = ?
-                """, (memory_id, old_id))
-                superseded_ids.append(old_id)
+            # 実際に更新できた行だけ転置インデックスへ反映する（競合した行は次のバッチで処理）
+            placeholders = ",".join("?" * len(enriched))
+            cursor = conn.execute(
+                f"SELECT id FROM memories WHERE id IN ({placeholders}) AND enrich_pending = 0",
+                list(enriched)
+            )
+            done = [row["id"] for row in cursor.fetchall()]
 
-        conn.commit()
+        for memory_id in done:
+            project_indexes.on_upsert(enriched[memory_id])
+        if done:
+            context_cache.invalidate()
+        failed_ids = {memory_id for _, memory_id, _ in failures}
+        self.processed += len([memory_id for memory_id in done if memory_id not in failed_ids])
+        self.failed += len([memory_id for memory_id in done if memory_id in failed_ids])
+        self.batches += 1
+        self.last_batch_at = datetime.utcnow().isoformat()
+        return len(rows)
+
+
+enrichment_worker = EnrichmentWorker(ENRICH_BATCH_SIZE, ENRICH_BATCH_DELAY, ENRICH_POLL_INTERVAL)
+
+
+def resume_pending_enrichment():
+    """前回の終了時に残った未処理の記憶があればワーカーを起動する"""
+    with get_db() as conn:
+        if conn.execute("SELECT 1 FROM memories WHERE enrich_pending = 1 LIMIT 1").fetchone():
+            enrichment_worker.notify()
+
+
+resume_pending_enrichment()
+
+
+@app.post("/store", response_model=StoreResponse)
+async def store_memory(
+    entry: MemoryEntry,
+    request: Request,
+    defer_enrich: bool = Query(
+        False, description="カテゴリ/タグ推定・要約・埋め込みをバックグラウンドで行い、すぐに 202 を返す"
+    ),
+    near_duplicates: Optional[NearDuplicatePolicy] = Query(
+        None, description="近似重複が見つかった場合の扱い: keep, merge, supersede（省略時は NEAR_DUPLICATE_POLICY）"
+    ),
+    coalesce_window: Optional[int] = Query(
+        None, ge=0, le=COALESCE_WINDOW_MAX_SECONDS,
+        description="同じファイルの作業記録を直近の記憶に追記する時間窓（秒、0 で無効。省略時は COALESCE_WINDOW_SECONDS）"
+    ),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """記憶を保存
+
+    同じ内容の有効な記憶が既にあれば新しく作らず、その記憶を更新して deduplicated=true で返す。
+    defer_enrich=true の場合は検証・権限チェックだけを行って保存し、202 で ID を返す。
+    自動推定の完了は GET /enrichment/wait で待てる。
+
+    Idempotency-Key ヘッダーを付けると、同じキーでの再送には保存も監査ログの記録もせず最初の応答を返す
+    （Idempotent-Replayed: true ヘッダー付き）。
+    """
+    idempotent = None
+    if idempotency_key is not None:
+        idempotent = IdempotentRequest(
+            idempotency_key, current_user, "/store", IdempotentRequest.hash_request(request, await request.body())
+        )
+        replay = idempotent.begin()
+        if replay is not None:
+            return replay
+
+    try:
+        user_id = current_user.user_id if current_user else None
+        prepared = prepare_store_entry(entry, current_user, defer_enrich=defer_enrich)
+
+        # レート制限
+        client_ip = request.client.host if request.client else "unknown"
+        if not check_rate_limit(user_id or client_ip):
+            raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+        with get_db() as conn:
+            superseded_ids, skipped_ids = insert_memory(
+                conn, entry, prepared, current_user, near_duplicates or NEAR_DUPLICATE_POLICY,
+                COALESCE_WINDOW_SECONDS if coalesce_window is None else coalesce_window
+            )
+            if defer_enrich:
+                if prepared.deduplicated:
+                    message = f"Duplicate of existing memory, refreshed ({entry.scope.value}/{entry.type.value})"
+                elif prepared.coalesced:
+                    message = f"Appended to recent work memory ({entry.scope.value}/{entry.type.value})"
+                else:
+                    message = f"Memory accepted ({entry.scope.value}/{entry.type.value}), enrichment pending"
+                response = JSONResponse(status_code=202, content={
+                    "id": prepared.id,
+                    "scope": entry.scope.value,
+                    "scope_id": entry.scope_id,
+                    "category": prepared.category,
+                    "tags": prepared.tags,
+                    "message": message,
+                    "superseded_ids": superseded_ids,
+                    "skipped_supersedes": skipped_ids,
+                    "warnings": prepared.warnings,
+                    "deduplicated": prepared.deduplicated,
+                    "duplicate_count": prepared.duplicate_count,
+                    "near_duplicate_ids": prepared.near_duplicate_ids,
+                    "coalesced": prepared.coalesced,
+                    "coalesce_count": prepared.coalesce_count,
+                    # 重複として既に後処理済みの記憶を更新した場合は done
+                    "enrichment": "pending" if prepared.enrich_pending else "done",
+                })
+                if idempotent:
+                    idempotent.complete(conn, 202, json.loads(response.body))
+            else:
+                response = store_response(entry, prepared, superseded_ids, skipped_ids)
+                if idempotent:
+                    idempotent.complete(conn, 200, response.model_dump(mode="json"))
+            conn.commit()
+    except BaseException:
+        if idempotent:
+            idempotent.abort()
+        raise
+
+    context_cache.invalidate()
+    if prepared.enrich_pending:
+        # 転置インデックスへの追加は後処理で行う（廃止の反映だけ先に行う）
+        for old_id in superseded_ids:
+            project_indexes.on_deprecate(old_id, True)
+        enrichment_worker.notify()
+    else:
+        index_stored_memory(entry, prepared, superseded_ids)
 
     # 監査ログ
     log_audit(
         user_id=user_id,
         action="store_memory",
         resource_type="memory",
-        resource_id=memory_id,
-        details={"scope": entry.scope.value, "type": entry.type.value, "superseded": superseded_ids, "skipped": skipped_ids},
+        resource_id=prepared.id,
+        details={"scope": entry.scope.value, "type": entry.type.value, "superseded": superseded_ids,
+                 "skipped": skipped_ids, "deduplicated": prepared.deduplicated,
+                 "coalesced": prepared.coalesced},
         ip_address=client_ip
     )
 
-    return StoreResponse(
-        id=memory_id,
-        tokens=count_tokens(entry.content),
-        scope=entry.scope,
-        scope_id=entry.scope_id,
-        category=category,
-        tags=all_tags,
-        message=f"Memory stored ({entry.scope.value}/{entry.type.value})",
-        superseded_ids=superseded_ids,
-        skipped_supersedes=skipped_ids,
-        warnings=metadata_warnings
+    return response
+
+
+@app.post("/store/batch", response_model=StoreBatchResponse)
+async def store_memory_batch(
+    batch: StoreBatchRequest,
+    request: Request,
+    near_duplicates: Optional[NearDuplicatePolicy] = Query(
+        None, description="近似重複が見つかった場合の扱い: keep, merge, supersede（省略時は NEAR_DUPLICATE_POLICY）"
+    ),
+    coalesce_window: Optional[int] = Query(
+        None, ge=0, le=COALESCE_WINDOW_MAX_SECONDS,
+        description="同じファイルの作業記録を直近の記憶に追記する時間窓（秒、0 で無効。省略時は COALESCE_WINDOW_SECONDS）"
+    ),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """複数の記憶を1トランザクションで保存
+
+    各記憶には /store と同じ検証・メタデータ補完・サニタイズ・自動タグ付けを行う。
+    1件でも不正なものがあれば何も保存せず、index 付きでエラーを返す。
+    結果はリクエストと同じ順序で返す。
+    """
+    user_id = current_user.user_id if current_user else None
+
+    prepared_list = []
+    for index, entry in enumerate(batch.memories):
+        try:
+            prepared_list.append(prepare_store_entry(entry, current_user))
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail={"index": index, "detail": e.detail})
+
+    # レート制限（件数分を消費）
+    client_ip = request.client.host if request.client else "unknown"
+    if not check_rate_limit(user_id or client_ip, cost=len(batch.memories)):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+    results = []
+    audit_entries = []
+    with get_db() as conn:
+        for entry, prepared in zip(batch.memories, prepared_list):
+            superseded_ids, skipped_ids = insert_memory(
+                conn, entry, prepared, current_user, near_duplicates or NEAR_DUPLICATE_POLICY,
+                COALESCE_WINDOW_SECONDS if coalesce_window is None else coalesce_window
+            )
+            results.append(store_response(entry, prepared, superseded_ids, skipped_ids))
+            audit_entries.append(dict(
+                user_id=user_id,
+                action="store_memory",
+                resource_type="memory",
+                resource_id=prepared.id,
+                details={"scope": entry.scope.value, "type": entry.type.value, "superseded": superseded_ids,
+                         "skipped": skipped_ids, "deduplicated": prepared.deduplicated,
+                         "coalesced": prepared.coalesced, "batch": True},
+                ip_address=client_ip
+            ))
+        # 監査ログも同じトランザクションでまとめて書く
+        log_audit_many(conn, audit_entries)
+        conn.commit()
+
+    context_cache.invalidate()
+    for entry, prepared, result in zip(batch.memories, prepared_list, results):
+        index_stored_memory(entry, prepared, result.superseded_ids)
+
+    return StoreBatchResponse(
+        results=results, count=len(results), deduplicated=sum(result.deduplicated for result in results)
     )
 
 
+@app.get("/enrichment")
+async def get_enrichment_status():
+    """後処理キュー（defer_enrich で保存した記憶）の状況
+
+    lag_seconds は最も古い未処理の記憶が保存されてからの経過秒数。
+    """
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) AS pending, MIN(created_at) AS oldest FROM memories WHERE enrich_pending = 1"
+        ).fetchone()
+
+    lag_seconds = 0.0
+    if row["oldest"]:
+        lag_seconds = max((datetime.utcnow() - datetime.fromisoformat(row["oldest"])).total_seconds(), 0.0)
+        # 別プロセスの保存や再起動で残った分も処理されるようにする
+        enrichment_worker.notify()
+
+    return {
+        "pending": row["pending"],
+        "oldest_pending_at": row["oldest"],
+        "lag_seconds": round(lag_seconds, 3),
+        "processed": enrichment_worker.processed,
+        "failed": enrichment_worker.failed,
+        "batches": enrichment_worker.batches,
+        "last_batch_at": enrichment_worker.last_batch_at,
+        "last_error": enrichment_worker.last_error,
+        "worker_running": enrichment_worker.running,
+    }
+
+
+@app.get("/enrichment/wait")
+async def wait_enrichment(
+    ids: str = Query(..., description="待つ記憶IDのカンマ区切り"),
+    timeout: float = Query(5.0, ge=0, le=ENRICH_WAIT_MAX_SECONDS, description="最大待ち秒数"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """指定した記憶の後処理が終わるまで待つ
+
+    done=false の場合、pending に未処理のIDが入る。閲覧権限のない記憶は対象外。
+    """
+    memory_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not memory_ids:
+        raise HTTPException(status_code=422, detail="ids is required")
+    if len(memory_ids) > STORE_BATCH_MAX:
+        raise HTTPException(status_code=422, detail=f"Too many ids (max {STORE_BATCH_MAX})")
+
+    visible = visible_scope_ids(current_user)
+    placeholders = ",".join("?" * len(memory_ids))
+    deadline = time.monotonic() + timeout
+    while True:
+        with get_db() as conn:
+            cursor = conn.execute(
+                f"SELECT id, scope, scope_id FROM memories WHERE id IN ({placeholders}) AND enrich_pending = 1",
+                memory_ids
+            )
+            pending = {
+                row["id"] for row in cursor.fetchall()
+                if visible is None or row["scope"] == "global" or row["scope_id"] in visible
+            }
+        if not pending or time.monotonic() >= deadline:
+            break
+        enrichment_worker.notify()
+        await asyncio.sleep(0.05)
+
+    return {"done": not pending, "pending": [i for i in memory_ids if i in pending]}
+
+
+def record_context_access(conn: sqlite3.Connection, context: "ContextResponse", now: str):
+    """/context で返した記憶のアクセス回数・最終アクセス日時を更新する（キャッシュから返す場合も数える）"""
+    memory_ids = [m.id for field, _ in CONTEXT_TIER_TITLES for m in getattr(context, field)]
+    if memory_ids:
+        placeholders = ",".join("?" * len(memory_ids))
+        conn.execute(f"""
+            UPDATE memories
+            SET access_count = access_count + 1, last_accessed_at = ?
+            WHERE id IN ({placeholders})
+        """, [now] + memory_ids)
+        conn.commit()
+
+
+def context_output(entry: dict, fmt: ContextFormat, max_tokens: int, session_key: Optional[tuple] = None):
+    """キャッシュエントリから指定形式のレスポンスを作る（レンダリング結果もエントリに保存）
+
+    session_key がある場合は送信済みの記憶を除いた差分を返す（差分はセッションごとに異なるため保存しない）。
+    テキスト形式では max_tokens に収まらず出力しきれなかった記憶を送信済みにしない（次回また送る）。
+    """
+    if session_key is not None:
+        context = context_sessions.apply_delta(session_key, entry["context"])
+        memories = [m for field, _ in CONTEXT_TIER_TITLES for m in getattr(context, field)]
+        if fmt == ContextFormat.JSON:
+            context_sessions.mark_sent(session_key, memories, context.unchanged_ids)
+            return context
+        rendered, rendered_ids = render_context(context, fmt, max_tokens)
+        rendered_set = set(rendered_ids)
+        context_sessions.mark_sent(
+            session_key, [m for m in memories if m.id in rendered_set], context.unchanged_ids
+        )
+    elif fmt == ContextFormat.JSON:
+        return entry["context"]
+    else:
+        rendered = entry["rendered"].get(fmt)
+        if rendered is None:
+            rendered, _ = render_context(entry["context"], fmt, max_tokens)
+            entry["rendered"][fmt] = rendered
+    media_type = "text/markdown" if fmt == ContextFormat.MARKDOWN else "text/plain"
+    return PlainTextResponse(rendered, media_type=media_type)
+
+
 @app.get("/context/{project_id}", response_model=ContextResponse)
 async def get_context(
     project_id: str,
@@ -987,17 +3420,50 @@ async def get_context(
     max_tokens: int = Query(2000, description="最大トークン数"),
     category: Optional[MemoryCategory] = Query(None, description="カテゴリで優先フィルタ"),
     include_deprecated: bool = Query(False, description="廃止済み記憶を含めるか"),
+    mode: SearchMode = Query(SearchMode.KEYWORD, description="検索方式: keyword, semantic, hybrid"),
+    deadline_ms: Optional[int] = Query(None, ge=0, description="応答期限（ミリ秒）。超過した tier は返さない"),
+    x_deadline_ms: Optional[int] = Header(None, alias="X-Deadline-Ms", ge=0),
+    format: ContextFormat = Query(ContextFormat.JSON, description="出力形式: json, markdown, text"),
+    session_id: Optional[str] = Query(None, max_length=128, description="セッションID（指定時は送信済みで変更のない記憶を省略）"),
+    background_tasks: BackgroundTasks = None,
     request: Request = None,
     current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """階層化されたコンテキストを取得"""
+    """階層化されたコンテキストを取得
+
+    deadline_ms（または X-Deadline-Ms ヘッダー）を指定すると、期限内で
+    decisions → recent → global → team の優先順に tier を埋め、
+    間に合わなかった tier は空のまま truncated=True で返す（Hook のタイムアウト対策）。
+    期限付きの場合、未ロードの転置インデックスは構築せず SQL の候補を使う（構築はレスポンス後に行う）。
+
+    format=markdown/text の場合は tier ごとに整形済みのテキストを返す（Hook 側の jq 整形が不要）。
+
+    session_id を指定すると、同じセッションで送信済みかつ変更のない記憶は本文を省略し、
+    IDだけを unchanged_ids に返す。
+    """
     user_id = current_user.user_id if current_user else None
     team_id = current_user.team_id if current_user else None
+    if deadline_ms is None:
+        deadline_ms = x_deadline_ms
+    deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms is not None else None
+
+    def deadline_exceeded() -> bool:
+        return deadline is not None and time.monotonic() >= deadline
 
     # 権限チェック
     if current_user and not current_user.can_access_project(project_id):
         raise HTTPException(status_code=403, detail="No access to this project")
 
+    # キャッシュ（JSON とレンダリング済みテキストを共有）
+    cache_key = (user_id, team_id, project_id, query, max_tokens, category, include_deprecated, mode)
+    session_key = (user_id, project_id, session_id) if session_id else None
+    cached = context_cache.get(cache_key)
+    if cached is not None:
+        with get_db() as conn:
+            record_context_access(conn, cached["context"], datetime.utcnow().isoformat())
+        return context_output(cached, format, max_tokens, session_key)
+    generation = context_cache.generation
+
     # トークン予算を分配
     global_budget = int(max_tokens * 0.15)   # 15%
     team_budget = int(max_tokens * 0.15)     # 15%
@@ -1005,24 +3471,34 @@ async def get_context(
     recent_budget = int(max_tokens * 0.40)   # 40%
 
     now = datetime.utcnow().isoformat()
-    query_words = set(query.lower().split())
+    query_words = search_words(query)
+    query_vector = embed_text(query) if mode != SearchMode.KEYWORD else None
 
-    def filter_by_query(memories: list[MemoryResponse]) -> list[MemoryResponse]:
+    def filter_by_query(memories: list[MemoryResponse], similarities: dict[str, float]) -> list[MemoryResponse]:
         """クエリに関連する記憶をフィルタリング（カテゴリ・タグ考慮）"""
         scored = []
         for m in memories:
-            score = 0
-            content_words = set(m.content.lower().split())
-            tag_words = set(t.lower() for t in m.tags)
-
-            # クエリとのマッチング
-            content_match = len(query_words & content_words)
-            tag_match = len(query_words & tag_words)
-            score = content_match + (tag_match * 2)  # タグマッチは重み付け
-
-            # カテゴリが指定されている場合、一致するものを優先
-            if category and m.category == category.value:
-                score += 5
+            if mode == SearchMode.KEYWORD:
+                content_words = search_words(m.content)
+                tag_words = set(t.lower() for t in m.tags)
+
+                # クエリとのマッチング
+                content_match = len(query_words & content_words)
+                tag_match = len(query_words & tag_words)
+                score = content_match + (tag_match * 2)  # タグマッチは重み付け
+
+                # カテゴリが指定されている場合、一致するものを優先
+                if category and m.category == category.value:
+                    score += 5
+            else:
+                similarity = similarities.get(m.id, 0.0)
+                if similarity < SEMANTIC_MIN_SIMILARITY:
+                    continue
+                score = similarity
+                if mode == SearchMode.HYBRID:
+                    score += keyword_score(query_words, m)
+                if category and m.category == category.value:
+                    score += 0.5
 
             if score > 0:
                 scored.append((score, m))
@@ -1035,79 +3511,117 @@ async def get_context(
 
     # deprecated フィルタ条件
     deprecated_filter = "" if include_deprecated else "AND (deprecated IS NULL OR deprecated = FALSE)"
+    active_filter = f"(expires_at IS NULL OR expires_at > ?) {deprecated_filter}"
 
     with get_db() as conn:
-        # Global knowledge
-        cursor = conn.execute(f"""
-            SELECT * FROM memories
-            WHERE scope = 'global'
-            AND (expires_at IS NULL OR expires_at > ?)
-            {deprecated_filter}
-            ORDER BY importance DESC, created_at DESC
-            LIMIT 20
-        """, (now,))
-        global_raw = [row_to_memory(row) for row in cursor.fetchall()]
-        global_knowledge = select_within_budget(filter_by_query(global_raw), global_budget)
+        # キーワード検索ではプロジェクト tier の候補生成に転置インデックスを使う。
+        # 未ロードのプロジェクトは全件を読み込むため、期限付きでは構築を待たずに SQL 候補で返す
+        project_index = None
+        if mode == SearchMode.KEYWORD:
+            if deadline is None:
+                project_index = project_indexes.get(conn, project_id)
+            else:
+                project_index = project_indexes.peek(project_id)
+                if project_index is None and project_indexes.enabled:
+                    background_tasks.add_task(project_indexes.warm, project_id)
+
+        def fetch_project_tier(
+            types: set[str], where_sql: str, params: list, order_sql: str, by_importance: bool
+        ) -> tuple[list[MemoryResponse], dict[str, float]]:
+            """プロジェクト tier の候補を取得（一致が無ければ従来の SQL 候補にフォールバック）"""
+            if project_index is not None:
+                matched = project_index.match(
+                    query_words, scope="project", types=types, include_deprecated=include_deprecated,
+                    include_category=category.value if category else None
+                )
+                scores = {}
+                for memory_id, match in matched.items():
+                    score = match.content_hits + (match.tag_hits * 2)
+                    if match.in_category:
+                        score += 5
+                    if score > 0:
+                        scores[memory_id] = score
+                ranked_ids = ProjectIndex.rank(matched, scores, by_importance=by_importance)
+                memories = fetch_indexed_candidates(conn, ranked_ids, where_sql, params, 20)
+                if memories:
+                    return memories, {}
+            return fetch_ranked_candidates(conn, where_sql, params, order_sql, 20, query_vector)
+
+        def load_decisions() -> list[MemoryResponse]:
+            decisions_raw, similarities = fetch_project_tier(
+                {"decision"}, f"scope = 'project' AND scope_id = ? AND type = 'decision' AND {active_filter}",
+                [project_id, now], "importance DESC, created_at DESC", by_importance=True
+            )
+            return select_within_budget(filter_by_query(decisions_raw, similarities), decision_budget)
 
-        # Team knowledge
-        team_knowledge = []
-        if team_id:
-            cursor = conn.execute(f"""
-                SELECT * FROM memories
-                WHERE scope = 'team' AND scope_id = ?
-                AND (expires_at IS NULL OR expires_at > ?)
-                {deprecated_filter}
-                ORDER BY importance DESC, created_at DESC
-                LIMIT 20
-            """, (team_id, now))
-            team_raw = [row_to_memory(row) for row in cursor.fetchall()]
-            team_knowledge = select_within_budget(filter_by_query(team_raw), team_budget)
-
-        # Project decisions
-        cursor = conn.execute(f"""
-            SELECT * FROM memories
-            WHERE scope = 'project' AND scope_id = ? AND type = 'decision'
-            AND (expires_at IS NULL OR expires_at > ?)
-            {deprecated_filter}
-            ORDER BY importance DESC, created_at DESC
-            LIMIT 20
-        """, (project_id, now))
-        decisions_raw = [row_to_memory(row) for row in cursor.fetchall()]
-        project_decisions = select_within_budget(filter_by_query(decisions_raw), decision_budget)
+        def load_recent() -> list[MemoryResponse]:
+            recent_raw, similarities = fetch_project_tier(
+                {"work", "knowledge"}, f"scope = 'project' AND scope_id = ? AND type IN ('work', 'knowledge') AND {active_filter}",
+                [project_id, now], "created_at DESC", by_importance=False
+            )
+            return select_within_budget(filter_by_query(recent_raw, similarities), recent_budget)
 
-        # Project recent work
-        cursor = conn.execute(f"""
-            SELECT * FROM memories
-            WHERE scope = 'project' AND scope_id = ? AND type IN ('work', 'knowledge')
-            AND (expires_at IS NULL OR expires_at > ?)
-            {deprecated_filter}
-            ORDER BY created_at DESC
-            LIMIT 20
-        """, (project_id, now))
-        recent_raw = [row_to_memory(row) for row in cursor.fetchall()]
-        project_recent = select_within_budget(filter_by_query(recent_raw), recent_budget)
+        def load_global() -> list[MemoryResponse]:
+            global_raw, similarities = fetch_ranked_candidates(
+                conn, f"scope = 'global' AND {active_filter}", [now],
+                "importance DESC, created_at DESC", 20, query_vector
+            )
+            return select_within_budget(filter_by_query(global_raw, similarities), global_budget)
+
+        def load_team() -> list[MemoryResponse]:
+            if not team_id:
+                return []
+            team_raw, similarities = fetch_ranked_candidates(
+                conn, f"scope = 'team' AND scope_id = ? AND {active_filter}", [team_id, now],
+                "importance DESC, created_at DESC", 20, query_vector
+            )
+            return select_within_budget(filter_by_query(team_raw, similarities), team_budget)
 
-        # アクセス記録更新
-        all_memories = global_knowledge + team_knowledge + project_decisions + project_recent
-        memory_ids = [m.id for m in all_memories]
-        if memory_ids:
-            placeholders = ",".join("?" * len(memory_ids))
-            conn.execute(f"""
-                UPDATE memories
-                SET access_count = access_count + 1, last_accessed_at = ?
-                WHERE id IN ({placeholders})
-            """, [now] + memory_ids)
-            conn.commit()
+        # 優先度順に tier を埋める（期限超過時は SQLite のクエリも progress handler で中断）
+        tiers: dict[str, list[MemoryResponse]] = {
+            "project_decisions": [], "project_recent": [], "global_knowledge": [], "team_knowledge": []
+        }
+        truncated = False
+        if deadline is not None:
+            conn.set_progress_handler(lambda: 1 if deadline_exceeded() else 0, 1000)
+        try:
+            for name, loader in (
+                ("project_decisions", load_decisions),
+                ("project_recent", load_recent),
+                ("global_knowledge", load_global),
+                ("team_knowledge", load_team),
+            ):
+                if deadline_exceeded():
+                    truncated = True
+                    break
+                try:
+                    tiers[name] = loader()
+                except sqlite3.OperationalError:
+                    if not deadline_exceeded():
+                        raise
+                    truncated = True
+                    break
+        finally:
+            conn.set_progress_handler(None, 0)
+
+        global_knowledge = tiers["global_knowledge"]
+        team_knowledge = tiers["team_knowledge"]
+        project_decisions = tiers["project_decisions"]
+        project_recent = tiers["project_recent"]
 
-    total_tokens = sum(m.tokens for m in all_memories)
+        all_memories = global_knowledge + team_knowledge + project_decisions + project_recent
+        context = ContextResponse(
+            global_knowledge=global_knowledge,
+            team_knowledge=team_knowledge,
+            project_decisions=project_decisions,
+            project_recent=project_recent,
+            total_tokens=sum(m.tokens for m in all_memories),
+            truncated=truncated
+        )
+        # アクセス記録更新
+        record_context_access(conn, context, now)
 
-    return ContextResponse(
-        global_knowledge=global_knowledge,
-        team_knowledge=team_knowledge,
-        project_decisions=project_decisions,
-        project_recent=project_recent,
-        total_tokens=total_tokens
-    )
+    return context_output(context_cache.put(cache_key, context, generation), format, max_tokens, session_key)
 
 
 @app.get("/search")
@@ -1119,65 +3633,96 @@ async def search_memories(
     category: Optional[MemoryCategory] = Query(None, description="カテゴリでフィルタ"),
     tags: Optional[str] = Query(None, description="タグでフィルタ（カンマ区切り）"),
     include_deprecated: bool = Query(False, description="廃止済み記憶を含めるか"),
+    mode: SearchMode = Query(SearchMode.KEYWORD, description="検索方式: keyword, semantic, hybrid"),
     limit: int = Query(10, le=100),
     offset: int = Query(0, ge=0, description="結果のオフセット"),
+    cursor: Optional[str] = Query(None, description="前ページの next_cursor（keyword モードのみ）"),
+    background_tasks: BackgroundTasks = None,
     current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """記憶を検索"""
+    """記憶を検索
+
+    keyword モードではフィルタ・スコア計算・並び替えを SQL（またはロード済みの転置インデックス）で行い、
+    (score, importance, created_at, id) の降順で安定に並べる。レスポンスの next_cursor を
+    cursor に渡すとキーセット方式で続きを取得でき、ページが深くてもコストは変わらない。
+    """
     now = datetime.utcnow().isoformat()
+    query_words = search_words(query)
+    filter_tags = set(t.strip().lower() for t in tags.split(",")) if tags else None
 
-    with get_db() as conn:
-        sql = """
-            SELECT * FROM memories
-            WHERE (expires_at IS NULL OR expires_at > ?)
-        """
-        params: list = [now]
+    where_sql = "(expires_at IS NULL OR expires_at > ?)"
+    params: list = [now]
 
-        # デフォルトで廃止済み記憶を除外
-        if not include_deprecated:
-            sql += " AND (deprecated IS NULL OR deprecated = FALSE)"
+    # デフォルトで廃止済み記憶を除外
+    if not include_deprecated:
+        where_sql += " AND (deprecated IS NULL OR deprecated = FALSE)"
 
-        if scope:
-            sql += " AND scope = ?"
-            params.append(scope.value)
+    if scope:
+        where_sql += " AND scope = ?"
+        params.append(scope.value)
 
-        if scope_id:
-            sql += " AND scope_id = ?"
-            params.append(scope_id)
+    if scope_id:
+        where_sql += " AND scope_id = ?"
+        params.append(scope_id)
 
-        if type:
-            sql += " AND type = ?"
-            params.append(type.value)
+    if type:
+        where_sql += " AND type = ?"
+        params.append(type.value)
 
-        if category:
-            sql += " AND category = ?"
-            params.append(category.value)
+    if category:
+        where_sql += " AND category = ?"
+        params.append(category.value)
 
-        sql += " ORDER BY importance DESC, created_at DESC LIMIT ?"
-        params.append((offset + limit) * 5)  # タグフィルタ用＋offset考慮で多めに取得
+    if filter_tags:
+        placeholders = ",".join("?" * len(filter_tags))
+        where_sql += f" AND EXISTS (SELECT 1 FROM json_each(memories.tags) WHERE lower(json_each.value) IN ({placeholders}))"
+        params.extend(sorted(filter_tags))
 
-        cursor = conn.execute(sql, params)
-        all_memories = [row_to_memory(row) for row in cursor.fetchall()]
-
-    # タグでフィルタ（指定されている場合）
-    if tags:
-        filter_tags = set(t.strip().lower() for t in tags.split(","))
-        all_memories = [
-            m for m in all_memories
-            if filter_tags & set(t.lower() for t in m.tags)
-        ]
+    if mode == SearchMode.KEYWORD:
+        position = decode_search_cursor(cursor) if cursor else None
+        with get_db() as conn:
+            page = None
+            # scope_id 指定の検索はロード済み転置インデックスで候補を生成。
+            # 未ロードなら構築を待たずに SQL で検索し、インデックスはレスポンス後に構築する
+            project_index = None
+            if scope_id and project_indexes.enabled and (position is None or position[0]):
+                project_index = project_indexes.peek(scope_id)
+                if project_index is None:
+                    background_tasks.add_task(project_indexes.warm, scope_id)
+            if project_index is not None:
+                matched = project_index.match(
+                    query_words,
+                    scope=scope.value if scope else None,
+                    types={type.value} if type else None,
+                    category=category.value if category else None,
+                    tags=filter_tags,
+                    include_deprecated=include_deprecated
+                )
+                page = indexed_keyword_page(
+                    conn, matched, {memory_id: match.either_hits for memory_id, match in matched.items()},
+                    where_sql, params, position, limit, offset
+                )
+            if page is None:
+                page = keyword_search_page(conn, query_words, where_sql, params, position, limit, offset)
+        results, next_cursor = page
+        return {"memories": results, "count": len(results), "next_cursor": next_cursor}
+
+    # semantic / hybrid: 類似度上位の候補をベクトル走査で取得（offset 考慮で多めに取得）
+    with get_db() as conn:
+        all_memories, similarities = fetch_ranked_candidates(
+            conn, where_sql, params, "importance DESC, created_at DESC",
+            (offset + limit) * 5, embed_text(query)
+        )
 
-    # キーワードマッチング
-    query_words = set(query.lower().split())
     matched = []
     for m in all_memories:
-        content_words = set(m.content.lower().split())
-        # タグもマッチング対象に含める
-        tag_words = set(t.lower() for t in m.tags)
-        all_words = content_words | tag_words
-        score = len(query_words & all_words)
-        if score > 0:
-            matched.append((score, m))
+        similarity = similarities.get(m.id, 0.0)
+        if similarity < SEMANTIC_MIN_SIMILARITY:
+            continue
+        score = similarity
+        if mode == SearchMode.HYBRID:
+            score += keyword_score(query_words, m)
+        matched.append((score, m))
 
     matched.sort(key=lambda x: x[0], reverse=True)
     results = [m for _, m in matched]
@@ -1188,7 +3733,7 @@ async def search_memories(
     # offset と limit を適用
     results = results[offset:offset + limit]
 
-    return {"memories": results, "count": len(results)}
+    return {"memories": results, "count": len(results), "next_cursor": None}
 
 
 @app.get("/memory/{memory_id}")
@@ -1201,17 +3746,98 @@ async def get_memory(
         cursor = conn.execute("SELECT * FROM memories WHERE id = ?", (memory_id,))
         row = cursor.fetchone()
 
-        if not row:
-            raise HTTPException(status_code=404, detail="Memory not found")
+        if not row:
+            raise HTTPException(status_code=404, detail="Memory not found")
+
+        now = datetime.utcnow().isoformat()
+        conn.execute("""
+            UPDATE memories SET access_count = access_count + 1, last_accessed_at = ?
+            WHERE id = ?
+        """, (now, memory_id))
+        conn.commit()
+
+        return row_to_memory(row)
+
+
+MEMORY_BATCH_GET_MAX = 500  # /memories で1回に取得できる ID 数
+
+# fields= で指定できるフィールド → 必要なカラム（tokens は token_count。未計算の記憶のみ content から計算）
+_MEMORY_FIELD_COLUMNS = {
+    name: (("token_count", "content") if name == "tokens" else (name,)) for name in MemoryResponse.model_fields
+}
+_MEMORY_FIELD_CONVERTERS = {
+    "metadata": lambda row: json.loads(row["metadata"] or "{}"),
+    "tags": lambda row: json.loads(row["tags"] or "[]"),
+    "tokens": lambda row: row["token_count"] if row["token_count"] is not None else count_tokens(row["content"]),
+    "deprecated": lambda row: bool(row["deprecated"]),
+}
+
+
+@app.get("/memories")
+async def get_memories(
+    ids: str = Query(..., description="取得する記憶IDのカンマ区切り"),
+    fields: Optional[str] = Query(None, description="返すフィールドのカンマ区切り（省略時は全フィールド、id は常に含む）"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """複数の記憶を ID 指定でまとめて取得
+
+    1回の IN クエリで取得し、アクセス権は呼び出し元の閲覧可能スコープでまとめて判定する。
+    結果は ids の順序（重複は除く）。見つからない ID は not_found、権限のない ID は denied に入る。
+    """
+    memory_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not memory_ids:
+        raise HTTPException(status_code=422, detail="ids is required")
+    if len(memory_ids) > MEMORY_BATCH_GET_MAX:
+        raise HTTPException(status_code=422, detail=f"Too many ids (max {MEMORY_BATCH_GET_MAX})")
+
+    if fields:
+        field_names = list(dict.fromkeys(["id"] + [f.strip() for f in fields.split(",") if f.strip()]))
+        unknown = [f for f in field_names if f not in _MEMORY_FIELD_COLUMNS]
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}")
+        columns = {"id", "scope", "scope_id"} | {c for f in field_names for c in _MEMORY_FIELD_COLUMNS[f]}
+    else:
+        field_names = None
+        columns = {c for names in _MEMORY_FIELD_COLUMNS.values() for c in names}
 
-        now = datetime.utcnow().isoformat()
-        conn.execute("""
-            UPDATE memories SET access_count = access_count + 1, last_accessed_at = ?
-            WHERE id = ?
-        """, (now, memory_id))
-        conn.commit()
+    visible = visible_scope_ids(current_user)
 
-        return row_to_memory(row)
+    with get_db() as conn:
+        cursor = conn.execute(
+            f"SELECT {', '.join(sorted(columns))} FROM memories WHERE id IN ({','.join('?' * len(memory_ids))})",
+            memory_ids
+        )
+        rows = {row["id"]: row for row in cursor.fetchall()}
+
+        memories = []
+        found_ids = []
+        not_found = []
+        denied = []
+        for memory_id in memory_ids:
+            row = rows.get(memory_id)
+            if row is None:
+                not_found.append(memory_id)
+            elif visible is not None and row["scope"] != "global" and row["scope_id"] not in visible:
+                denied.append(memory_id)
+            else:
+                found_ids.append(memory_id)
+                if field_names is None:
+                    memories.append(row_to_memory(row).model_dump())
+                else:
+                    memories.append({
+                        f: _MEMORY_FIELD_CONVERTERS[f](row) if f in _MEMORY_FIELD_CONVERTERS else row[f]
+                        for f in field_names
+                    })
+
+        # アクセス記録も1回の UPDATE で済ませる
+        if found_ids:
+            conn.execute(f"""
+                UPDATE memories SET access_count = access_count + 1, last_accessed_at = ?
+                WHERE id IN ({','.join('?' * len(found_ids))})
+            """, [datetime.utcnow().isoformat()] + found_ids)
+            conn.commit()
+
+    return {"memories": memories, "count": len(memories), "not_found": not_found, "denied": denied}
 
 
 @app.patch("/memory/{memory_id}")
@@ -1258,6 +3884,10 @@ async def update_memory(
             validate_content_length(update.content)
             updates.append("content = ?")
             params.append(update.content)
+            updates.append("simhash = ?")
+            params.append(simhash(update.content))
+            updates.append("token_count = ?")
+            params.append(count_tokens(update.content))
 
         # カテゴリの更新
         if update.category is not None:
@@ -1298,11 +3928,20 @@ async def update_memory(
             updates.append("tags = ?")
             params.append(json.dumps(new_tags))
 
+        # コンテンツまたはタグが変わった場合は埋め込みと検索語を再計算
+        if update.content is not None or new_tags is not None:
+            new_content = update.content if update.content is not None else row["content"]
+            new_tag_list = new_tags if new_tags is not None else current_tags
+            updates.append("embedding = ?")
+            params.append(embed_memory(new_content, new_tag_list))
+            updates.append("search_terms = ?")
+            params.append(search_terms(new_content, new_tag_list))
+
         # メタデータの更新（既存のメタデータにマージ）
         # Todo用の許可されたキーのみ更新可能（セキュリティ対策）
         ALLOWED_METADATA_KEYS = {"status", "completed_at", "priority", "due_date"}
+        current_metadata = json.loads(row["metadata"] or "{}")
         if update.metadata is not None:
-            current_metadata = json.loads(row["metadata"] or "{}")
             # 許可されたキーのみマージ（ownerなど重要なフィールドの上書きを防止）
             for key, value in update.metadata.items():
                 if key in ALLOWED_METADATA_KEYS:
@@ -1310,6 +3949,14 @@ async def update_memory(
             updates.append("metadata = ?")
             params.append(json.dumps(current_metadata))
 
+        # 本文・メタデータが変わった場合は重複判定用のハッシュを付け直す（同じ内容の記憶が既にあれば対象外にする）
+        if update.content is not None or update.metadata is not None:
+            updates.append("content_hash = ?")
+            params.append(claimable_content_hash(
+                conn, memory_id, row["scope"], row["scope_id"], row["type"],
+                content_hash(update.content if update.content is not None else row["content"], current_metadata)
+            ))
+
         if not updates:
             raise HTTPException(status_code=400, detail="No updates provided")
 
@@ -1322,6 +3969,8 @@ async def update_memory(
         # 更新後の記憶を取得
         cursor = conn.execute("SELECT * FROM memories WHERE id = ?", (memory_id,))
         updated_row = cursor.fetchone()
+        project_indexes.on_upsert(updated_row)
+        context_cache.invalidate()
 
         log_audit(
             user_id=current_user.user_id if current_user else None,
@@ -1364,6 +4013,8 @@ async def delete_memory(
 
         conn.execute("DELETE FROM memories WHERE id = ?", (memory_id,))
         conn.commit()
+        project_indexes.on_delete(memory_id)
+        context_cache.invalidate()
 
         log_audit(
             user_id=current_user.user_id if current_user else None,
@@ -1417,15 +4068,22 @@ async def deprecate_memory(
             action = "deprecate_memory"
             message = "Memory deprecated"
         else:
+            # 廃止中に同じ内容の記憶が作られていた場合は、重複判定の代表をそちらに残す
+            digest = claimable_content_hash(
+                conn, memory_id, row["scope"], row["scope_id"], row["type"],
+                content_hash(row["content"], json.loads(row["metadata"] or "{}"))
+            )
             conn.execute("""
                 UPDATE memories
-                SET deprecated = FALSE, superseded_by = NULL
+                SET deprecated = FALSE, superseded_by = NULL, content_hash = ?
                 WHERE id = ?
-            """, (memory_id,))
+            """, (digest, memory_id))
             action = "restore_memory"
             message = "Memory restored"
 
         conn.commit()
+        project_indexes.on_deprecate(memory_id, request.deprecated)
+        context_cache.invalidate()
 
         log_audit(
             user_id=current_user.user_id if current_user else None,
@@ -1443,6 +4101,165 @@ async def deprecate_memory(
         }
 
 
+BULK_UPDATE_CHUNK_SIZE = 500  # 一括更新で1トランザクションにまとめる件数（書き込みを長時間ブロックしない）
+BULK_DRY_RUN_SAMPLE = 20      # dry_run で返す対象IDの件数
+
+
+class BulkAction(str, Enum):
+    DEPRECATE = "deprecate"
+    RETAG = "retag"
+    RECATEGORIZE = "recategorize"
+
+
+class BulkFilter(BaseModel):
+    """一括更新の対象条件（すべて AND）"""
+    scope_id: str = Field(..., description="対象のプロジェクト/チーム（必須）")
+    type: Optional[MemoryType] = None
+    category: Optional[MemoryCategory] = None
+    tag: Optional[str] = None
+    created_before: Optional[str] = Field(None, description="この日時より前に作成された記憶（ISO 8601）")
+    include_deprecated: bool = False
+
+
+class BulkUpdateRequest(BaseModel):
+    filter: BulkFilter
+    action: BulkAction
+    add_tags: list[str] = Field(default_factory=list, description="retag: 追加するタグ")
+    remove_tags: list[str] = Field(default_factory=list, description="retag: 削除するタグ")
+    category: Optional[MemoryCategory] = Field(None, description="recategorize: 新しいカテゴリ")
+    dry_run: bool = False
+
+
+@app.post("/memories/bulk")
+async def bulk_update_memories(
+    request: BulkUpdateRequest,
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """条件に一致する記憶をまとめて廃止・タグ変更・カテゴリ変更する
+
+    BULK_UPDATE_CHUNK_SIZE 件ごとにコミットし、他の書き込みを長時間ブロックしない。
+    更新はスレッドプールで実行するため、処理中もイベントループは他のリクエストを処理できる。
+    一般ユーザーは自分が作成した記憶のみが対象（個別の PATCH と同じ権限）。
+    dry_run=true では件数と対象IDの一部のみ返す。監査ログは1件にまとめて記録する。
+    """
+    f = request.filter
+    if current_user and not current_user.can_write_project(f.scope_id) and f.scope_id != current_user.team_id:
+        raise HTTPException(status_code=403, detail="No write access to this project")
+    if f.created_before:
+        try:
+            datetime.fromisoformat(f.created_before)
+        except ValueError:
+            raise HTTPException(status_code=422, detail="created_before は ISO 8601 形式で指定してください")
+    if request.action == BulkAction.RETAG and not (request.add_tags or request.remove_tags):
+        raise HTTPException(status_code=422, detail="retag requires add_tags or remove_tags")
+    if request.action == BulkAction.RECATEGORIZE and request.category is None:
+        raise HTTPException(status_code=422, detail="recategorize requires category")
+
+    where_sql = "scope_id = ?"
+    params: list = [f.scope_id]
+    if f.type:
+        where_sql += " AND type = ?"
+        params.append(f.type.value)
+    if f.category:
+        where_sql += " AND category = ?"
+        params.append(f.category.value)
+    if f.tag:
+        where_sql += " AND EXISTS (SELECT 1 FROM json_each(memories.tags) WHERE lower(json_each.value) = ?)"
+        params.append(f.tag.lower().strip())
+    if f.created_before:
+        where_sql += " AND created_at < ?"
+        params.append(f.created_before)
+    if not f.include_deprecated or request.action == BulkAction.DEPRECATE:
+        where_sql += " AND (deprecated IS NULL OR deprecated = FALSE)"
+    if current_user and not current_user.is_admin:
+        where_sql += " AND created_by = ?"
+        params.append(current_user.user_id)
+
+    def sample_targets() -> dict:
+        with get_db() as conn:
+            matched = conn.execute(f"SELECT COUNT(*) FROM memories WHERE {where_sql}", params).fetchone()[0]
+            cursor = conn.execute(
+                f"SELECT id FROM memories WHERE {where_sql} ORDER BY id LIMIT ?", params + [BULK_DRY_RUN_SAMPLE]
+            )
+            return {
+                "action": request.action.value,
+                "dry_run": True,
+                "matched": matched,
+                "sample_ids": [row["id"] for row in cursor.fetchall()],
+            }
+
+    def apply_updates() -> list[str]:
+        """対象をチャンクごとに更新・コミットし、変更した記憶IDを返す"""
+        with get_db() as conn:
+            add_tags = [t.lower().strip() for t in request.add_tags if t.strip()]
+            remove_set = {t.lower().strip() for t in request.remove_tags}
+            updated_ids: list[str] = []
+            last_id = ""
+            while True:
+                rows = conn.execute(
+                    f"SELECT id, content, tags, category FROM memories WHERE {where_sql} AND id > ? ORDER BY id LIMIT ?",
+                    params + [last_id, BULK_UPDATE_CHUNK_SIZE]
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                ids = [row["id"] for row in rows]
+
+                if request.action == BulkAction.DEPRECATE:
+                    conn.execute(f"UPDATE memories SET deprecated = TRUE WHERE id IN ({','.join('?' * len(ids))})", ids)
+                    chunk_ids = ids
+                elif request.action == BulkAction.RECATEGORIZE:
+                    chunk_ids = [row["id"] for row in rows if row["category"] != request.category.value]
+                    conn.executemany(
+                        "UPDATE memories SET category = ? WHERE id = ?",
+                        [(request.category.value, memory_id) for memory_id in chunk_ids]
+                    )
+                else:
+                    # タグ変更は PATCH /memory/{id} と同じ規則（小文字化・重複除去・最大10個）。埋め込みも再計算する
+                    changes = []
+                    for row in rows:
+                        current = json.loads(row["tags"] or "[]")
+                        new_tags = [t for t in dict.fromkeys(current + add_tags) if t not in remove_set][:10]
+                        if new_tags != current:
+                            changes.append((
+                                json.dumps(new_tags), embed_memory(row["content"], new_tags),
+                                search_terms(row["content"], new_tags), row["id"]
+                            ))
+                    conn.executemany("UPDATE memories SET tags = ?, embedding = ?, search_terms = ? WHERE id = ?", changes)
+                    chunk_ids = [c[-1] for c in changes]
+                conn.commit()
+                updated_ids.extend(chunk_ids)
+        return updated_ids
+
+    # 件数が多いと時間がかかるため、イベントループ（SSE や /batch など）を止めないようスレッドプールで実行する
+    if request.dry_run:
+        return await run_in_threadpool(sample_targets)
+    updated_ids = await run_in_threadpool(apply_updates)
+
+    if updated_ids:
+        context_cache.invalidate()
+        if request.action == BulkAction.DEPRECATE:
+            for memory_id in updated_ids:
+                project_indexes.on_deprecate(memory_id, True)
+        else:
+            project_indexes.invalidate(f.scope_id)
+
+    log_audit(
+        user_id=current_user.user_id if current_user else None,
+        action="bulk_update_memories",
+        details={
+            "action": request.action.value,
+            "filter": f.model_dump(exclude_none=True, mode="json"),
+            "add_tags": request.add_tags,
+            "remove_tags": request.remove_tags,
+            "category": request.category.value if request.category else None,
+            "updated_count": len(updated_ids),
+        }
+    )
+
+    return {"action": request.action.value, "dry_run": False, "updated": len(updated_ids)}
+
+
 # ============================================================
 # API エンドポイント: チーム管理
 # ============================================================
@@ -1759,35 +4576,160 @@ async def get_my_todos(
 
 @app.get("/projects", response_model=list[ProjectInfo])
 async def list_projects(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="最大件数（省略時は全件）"),
+    offset: int = Query(0, ge=0, description="結果のオフセット"),
     current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """登録されているプロジェクト一覧を取得"""
+    """登録されているプロジェクト一覧を取得（集計は project_stats から読む）
+
+    認証が有効な場合、アクセス権があるプロジェクトのみ返す。権限の絞り込みは
+    project_members との JOIN で SQL 側で行うため、コストは閲覧可能なプロジェクト数に比例する。
+    総件数は X-Total-Count ヘッダーで返す。
+    """
+    member_join = ""
+    params: list = []
+    if current_user and not current_user.is_admin:
+        member_join = "JOIN project_members pm ON pm.project_id = s.scope_id AND pm.user_id = ?"
+        params.append(current_user.user_id)
+
+    base_sql = f"""
+        FROM project_stats s
+        {member_join}
+        WHERE s.scope = 'project' AND s.scope_id != ''
+    """
+
     with get_db() as conn:
-        cursor = conn.execute("""
+        total = conn.execute(f"SELECT COUNT(DISTINCT s.scope_id) {base_sql}", params).fetchone()[0]
+
+        sql = f"""
             SELECT
-                scope_id as project_id,
-                COUNT(*) as memory_count,
-                SUM(CASE WHEN type = 'decision' THEN 1 ELSE 0 END) as decision_count,
-                MAX(created_at) as last_activity
-            FROM memories
-            WHERE scope = 'project' AND scope_id IS NOT NULL
-            GROUP BY scope_id
-            ORDER BY last_activity DESC
-        """)
+                s.scope_id as project_id,
+                SUM(s.count) as memory_count,
+                SUM(CASE WHEN s.type = 'decision' THEN s.count ELSE 0 END) as decision_count,
+                MAX(s.last_activity) as last_activity
+            {base_sql}
+            GROUP BY s.scope_id
+            ORDER BY last_activity DESC, project_id
+            LIMIT ? OFFSET ?
+        """
+        cursor = conn.execute(sql, params + [limit if limit is not None else -1, offset])
 
-        projects = []
-        for row in cursor.fetchall():
-            # 認証が有効な場合、アクセス権があるプロジェクトのみ返す
-            if current_user and not current_user.can_access_project(row["project_id"]):
-                continue
-            projects.append(ProjectInfo(
+        projects = [
+            ProjectInfo(
                 project_id=row["project_id"],
                 memory_count=row["memory_count"],
                 decision_count=row["decision_count"],
                 last_activity=row["last_activity"]
-            ))
+            )
+            for row in cursor.fetchall()
+        ]
+
+    response.headers["X-Total-Count"] = str(total)
+    return projects
+
+
+def damerau_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """制限付き Damerau-Levenshtein 距離（隣接文字の入れ替えを1操作とみなす）
+
+    max_distance を超えることが確定した時点で打ち切り、max_distance + 1 を返す。
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2: list[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def name_trigrams(name: str) -> set[str]:
+    """前後に空白を補ったトライグラム（短い名前や先頭の違いも拾えるようにする）"""
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProjectNameRegistry:
+    """/projects/suggest 用のプロジェクト名レジストリ（トライグラム索引つき）
+
+    project_names_version（プロジェクトが現れる・消えるたびにトリガーで増える）が
+    変わったときだけ project_stats から名前を読み直す。候補は共有トライグラム数の上位に絞ってから
+    編集距離を計算するため、プロジェクト数が増えても全件比較にならない。
+    """
+
+    SIMILARITY_THRESHOLD = 0.4
+    MAX_CANDIDATES = 50  # 共有トライグラム数の上位だけ編集距離を計算する
+
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._names: set[str] = set()
+        self._trigrams: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, conn: sqlite3.Connection):
+        """名前の一覧が変わっていれば索引を作り直す"""
+        version = conn.execute("SELECT value FROM project_names_version WHERE id = 1").fetchone()[0]
+        with self._lock:
+            if version == self._version:
+                return
+        cursor = conn.execute("""
+            SELECT DISTINCT scope_id FROM project_stats WHERE scope = 'project' AND scope_id != ''
+        """)
+        names = {row[0] for row in cursor.fetchall()}
+        trigrams: dict[str, set[str]] = {}
+        for name in names:
+            for gram in name_trigrams(name.lower()):
+                trigrams.setdefault(gram, set()).add(name)
+        with self._lock:
+            self._version, self._names, self._trigrams = version, names, trigrams
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    def suggest(self, name: str, limit: int = 5) -> list[dict]:
+        """類似するプロジェクト名を類似度の高い順に返す"""
+        query = name.lower()
+        with self._lock:
+            names, trigrams = self._names, self._trigrams
+        shared: Counter[str] = Counter()
+        for gram in name_trigrams(query):
+            shared.update(trigrams.get(gram, ()))
+
+        suggestions = []
+        for project, _ in shared.most_common(self.MAX_CANDIDATES):
+            score = self.similarity(query, project.lower())
+            if score >= self.SIMILARITY_THRESHOLD:
+                suggestions.append({"project_id": project, "similarity": round(score, 2)})
+
+        suggestions.sort(key=lambda x: (-x["similarity"], x["project_id"]))
+        return suggestions[:limit]
+
+    @classmethod
+    def similarity(cls, a: str, b: str) -> float:
+        """編集距離ベースの類似度（前方一致・部分一致は従来どおり 0.8 / 0.6 を下限とする）"""
+        if a == b:
+            return 1.0
+        longest = max(len(a), len(b))
+        if a.startswith(b) or b.startswith(a):
+            floor = 0.8
+        elif a in b or b in a:
+            floor = 0.6
+        else:
+            floor = 0.0
+        max_distance = int(longest * (1 - max(floor, cls.SIMILARITY_THRESHOLD)))
+        distance = damerau_levenshtein(a, b, max_distance)
+        return max(floor, 1 - distance / longest) if distance <= max_distance else floor
 
-        return projects
+
+project_names = ProjectNameRegistry()
 
 
 @app.get("/projects/suggest")
@@ -1797,134 +4739,545 @@ async def suggest_project(
 ):
     """類似プロジェクト名を提案（Typoチェック用）"""
     with get_db() as conn:
-        cursor = conn.execute("""
-            SELECT DISTINCT scope_id as project_id
-            FROM memories
-            WHERE scope = 'project' AND scope_id IS NOT NULL
-        """)
-
-        existing_projects = [row["project_id"] for row in cursor.fetchall()]
+        project_names.refresh(conn)
 
     # 完全一致チェック
-    if name in existing_projects:
+    if name in project_names:
         return {
             "exact_match": True,
             "project_id": name,
             "suggestions": []
         }
 
-    # 類似度計算（レーベンシュタイン距離の簡易版）
-    def similarity(a: str, b: str) -> float:
-        a, b = a.lower(), b.lower()
-        if a == b:
-            return 1.0
-        # 前方一致
-        if a.startswith(b) or b.startswith(a):
-            return 0.8
-        # 含まれている
-        if a in b or b in a:
-            return 0.6
-        # 編集距離ベースの類似度
-        len_a, len_b = len(a), len(b)
-        if abs(len_a - len_b) > max(len_a, len_b) * 0.5:
-            return 0.0
-        # 共通文字数
-        common = sum(1 for c in a if c in b)
-        return common / max(len_a, len_b)
-
-    # 類似プロジェクトを検索
-    suggestions = []
-    for project in existing_projects:
-        score = similarity(name, project)
-        if score >= 0.4:  # 閾値
-            suggestions.append({
-                "project_id": project,
-                "similarity": round(score, 2)
-            })
-
-    # スコア順にソート
-    suggestions.sort(key=lambda x: x["similarity"], reverse=True)
-
     return {
         "exact_match": False,
         "input": name,
-        "suggestions": suggestions[:5]  # 上位5件
+        "suggestions": project_names.suggest(name)  # 上位5件
+    }
+
+
+# ============================================================
+# API エンドポイント: 統計・管理
+# ============================================================
+
+@app.get("/stats/{project_id}")
+async def get_stats(
+    project_id: str,
+    include_deprecated: bool = Query(False, description="廃止済み記憶を含めるか"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """プロジェクトの統計情報（集計は project_stats から読む）"""
+    # deprecated フィルタ条件
+    deprecated_filter = "" if include_deprecated else "AND deprecated = 0"
+
+    with get_db() as conn:
+        cursor = conn.execute(f"""
+            SELECT
+                scope,
+                type,
+                SUM(count) as count,
+                SUM(importance_micros) as importance_micros,
+                SUM(importance_count) as importance_count
+            FROM project_stats
+            WHERE (scope_id = ? OR scope = 'global')
+            {deprecated_filter}
+            GROUP BY scope, type
+        """, (project_id,))
+
+        stats = {}
+        for row in cursor.fetchall():
+            key = f"{row['scope']}/{row['type']}"
+            # AVG(importance) と同じく NULL を除いた平均（対象がなければ None → 0 と表示する）
+            avg_importance = (
+                row["importance_micros"] / row["importance_count"] / IMPORTANCE_SCALE
+                if row["importance_count"] else None
+            )
+            stats[key] = {
+                "count": row["count"],
+                "avg_importance": round(avg_importance, 2) if avg_importance else 0
+            }
+
+        return {"project_id": project_id, "stats": stats}
+
+
+def near_duplicate_clusters(rows: list[sqlite3.Row], max_distance: int) -> list[list[sqlite3.Row]]:
+    """SimHash の距離が max_distance 以下の記憶を連結してクラスタにまとめる（2件以上のもののみ）
+
+    同じバンド値を持つ指紋どうしだけを照合する。同じ指紋の記憶は照合せずにまとめる。
+    """
+    by_value: dict[tuple[str, int], list[sqlite3.Row]] = defaultdict(list)
+    for row in rows:
+        by_value[(row["type"], row["simhash"])].append(row)
+    keys = list(by_value)
+    parent = list(range(len(keys)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(SIMHASH_BANDS):
+        buckets: dict[tuple[str, int], list[int]] = defaultdict(list)
+        for i, (memory_type, value) in enumerate(keys):
+            buckets[(memory_type, simhash_band(value, band))].append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    a, b = members[x], members[y]
+                    if simhash_distance(keys[a][1], keys[b][1]) <= max_distance:
+                        parent[find(a)] = find(b)
+
+    clusters: dict[int, list[sqlite3.Row]] = defaultdict(list)
+    for i, key in enumerate(keys):
+        clusters[find(i)].extend(by_value[key])
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+@app.get("/near-duplicates/{project_id}")
+async def get_near_duplicates(
+    project_id: str,
+    type: Optional[MemoryType] = Query(None, description="対象の type（省略時は全 type）"),
+    max_distance: int = Query(
+        NEAR_DUPLICATE_MAX_DISTANCE, ge=0, le=SIMHASH_BANDS - 1, description="同じクラスタとみなす SimHash のハミング距離"
+    ),
+    limit: int = Query(50, ge=1, le=500, description="返すクラスタ数の上限（大きい順）"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """プロジェクト内の近似重複（行番号・時刻だけ違う記憶など）のクラスタ一覧
+
+    各クラスタの先頭（representative_id）は最新の記憶。distance は代表とのハミング距離。
+    unindexed は SimHash が未計算の記憶の件数（/admin/reindex で計算される）。
+    """
+    if current_user and not current_user.can_access_project(project_id):
+        raise HTTPException(status_code=403, detail="No access to this project")
+
+    where_sql = "scope_id = ? AND COALESCE(deprecated, 0) = 0"
+    params: list = [project_id]
+    if type:
+        where_sql += " AND type = ?"
+        params.append(type.value)
+
+    with get_db() as conn:
+        rows = conn.execute(f"""
+            SELECT id, type, summary, created_at, simhash FROM memories
+            WHERE {where_sql} AND simhash IS NOT NULL
+        """, params).fetchall()
+        unindexed = conn.execute(
+            f"SELECT COUNT(*) FROM memories WHERE {where_sql} AND simhash IS NULL", params
+        ).fetchone()[0]
+
+    clusters = []
+    for members in near_duplicate_clusters(rows, max_distance):
+        members.sort(key=lambda row: row["created_at"], reverse=True)
+        representative = members[0]
+        clusters.append({
+            "type": representative["type"],
+            "size": len(members),
+            "representative_id": representative["id"],
+            "memories": [
+                {
+                    "id": row["id"],
+                    "summary": row["summary"],
+                    "created_at": row["created_at"],
+                    "distance": simhash_distance(representative["simhash"], row["simhash"]),
+                }
+                for row in members
+            ],
+        })
+    # 大きい順、同じ大きさなら代表が新しい順
+    clusters.sort(key=lambda cluster: cluster["memories"][0]["created_at"], reverse=True)
+    clusters.sort(key=lambda cluster: cluster["size"], reverse=True)
+
+    return {
+        "project_id": project_id,
+        "clusters": clusters[:limit],
+        "total_clusters": len(clusters),
+        "duplicate_memories": sum(cluster["size"] - 1 for cluster in clusters),
+        "scanned": len(rows),
+        "unindexed": unindexed,
+    }
+
+
+@app.get("/admin/audit-logs")
+async def get_audit_logs(
+    limit: int = Query(100, le=1000),
+    user_id: Optional[str] = Query(None),
+    action: Optional[str] = Query(None),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """監査ログを取得（管理者のみ）"""
+    if current_user and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    with get_db() as conn:
+        sql = "SELECT * FROM audit_logs WHERE 1=1"
+        params: list = []
+
+        if user_id:
+            sql += " AND user_id = ?"
+            params.append(user_id)
+
+        if action:
+            sql += " AND action = ?"
+            params.append(action)
+
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        cursor = conn.execute(sql, params)
+        logs = []
+        for row in cursor.fetchall():
+            log = dict(row)
+            if log.get("details"):
+                log["details"] = json.loads(log["details"])
+            logs.append(log)
+
+        return {"logs": logs, "count": len(logs)}
+
+
+# ============================================================
+# API エンドポイント: セマンティック検索インデックス
+# ============================================================
+
+# 再インデックスジョブの進捗（プロセス内で1ジョブのみ実行）
+_reindex_state: dict = {
+    "running": False,
+    "project_id": None,
+    "total": 0,
+    "processed": 0,
+    "started_at": None,
+    "finished_at": None,
+    "error": None,
+}
+_reindex_lock = threading.Lock()
+
+
+def run_reindex(project_id: Optional[str], force: bool):
+    """埋め込み（と近似重複検出用の SimHash）を再計算するバックグラウンドジョブ
+
+    REINDEX_BATCH_SIZE 件ごとにコミットし、書き込みを長時間ブロックしない。
+    force=False の場合は埋め込みが未計算・次元数不一致か、SimHash が未計算の記憶のみ対象とする。
+    読み取り後に PATCH などで変更された記憶は上書きしない（変更側が新しい内容で計算済みのため）。
+    """
+    where_sql = "1=1"
+    params: list = []
+    if project_id:
+        where_sql += " AND scope_id = ?"
+        params.append(project_id)
+    if not force:
+        where_sql += " AND (embedding IS NULL OR length(embedding) != ? OR simhash IS NULL)"
+        params.append(EMBEDDING_DIM * 4)
+
+    try:
+        with get_db() as conn:
+            cursor = conn.execute(f"SELECT COUNT(*) FROM memories WHERE {where_sql}", params)
+            _reindex_state["total"] = cursor.fetchone()[0]
+
+            last_id = ""
+            while True:
+                cursor = conn.execute(f"""
+                    SELECT id, content, tags, change_seq FROM memories
+                    WHERE {where_sql} AND id > ?
+                    ORDER BY id LIMIT ?
+                """, params + [last_id, REINDEX_BATCH_SIZE])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                conn.executemany(
+                    "UPDATE memories SET embedding = ?, simhash = ? WHERE id = ? AND change_seq IS ?",
+                    [
+                        (
+                            embed_memory(row["content"], json.loads(row["tags"] or "[]")), simhash(row["content"]),
+                            row["id"], row["change_seq"]
+                        )
+                        for row in rows
+                    ]
+                )
+                conn.commit()
+                last_id = rows[-1]["id"]
+                _reindex_state["processed"] += len(rows)
+        context_cache.invalidate()
+    except Exception as e:
+        _reindex_state["error"] = str(e)
+    finally:
+        _reindex_state["finished_at"] = datetime.utcnow().isoformat()
+        _reindex_state["running"] = False
+
+
+def schedule_reindex(background_tasks: BackgroundTasks, project_id: Optional[str], force: bool) -> bool:
+    """再インデックスジョブを登録する。実行中なら登録せず False を返す"""
+    with _reindex_lock:
+        if _reindex_state["running"]:
+            return False
+        _reindex_state.update(
+            running=True,
+            project_id=project_id,
+            total=0,
+            processed=0,
+            started_at=datetime.utcnow().isoformat(),
+            finished_at=None,
+            error=None,
+        )
+
+    background_tasks.add_task(run_reindex, project_id, force)
+    return True
+
+
+@app.post("/admin/reindex", status_code=202)
+async def start_reindex(
+    background_tasks: BackgroundTasks,
+    project_id: Optional[str] = Query(None, description="対象プロジェクト（省略時は全体）"),
+    force: bool = Query(False, description="計算済みの埋め込みも再計算するか"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """埋め込みの再計算をバックグラウンドで開始（管理者のみ）"""
+    if current_user and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    if not schedule_reindex(background_tasks, project_id, force):
+        raise HTTPException(status_code=409, detail="Reindex already running")
+
+    log_audit(
+        user_id=current_user.user_id if current_user else None,
+        action="start_reindex",
+        details={"project_id": project_id, "force": force}
+    )
+
+    return {"message": "Reindex started", "project_id": project_id, "force": force}
+
+
+@app.get("/admin/reindex")
+async def get_reindex_status(
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """再インデックスジョブの進捗を取得（管理者のみ）"""
+    if current_user and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return dict(_reindex_state)
+
+
+# 再タグ付けジョブの進捗（プロセス内で1ジョブのみ実行）
+_retag_state: dict = {
+    "running": False,
+    "project_id": None,
+    "recategorize": False,
+    "dictionary_version": None,
+    "total": 0,
+    "processed": 0,
+    "updated": 0,
+    "started_at": None,
+    "finished_at": None,
+    "error": None,
+}
+_retag_lock = threading.Lock()
+
+
+def retag_row(row: sqlite3.Row, recategorize: bool) -> Optional[tuple[Optional[str], list[str]]]:
+    """現在のキーワード辞書でカテゴリ・タグを付け直す。変化がなければ None
+
+    既存のタグは残して自動抽出タグを追加する（指定タグと自動タグは区別できないため）。
+    カテゴリは未設定の場合のみ推定し、recategorize=True なら推定できたものに置き換える。
+    """
+    file_path = json.loads(row["metadata"] or "{}").get("file")
+    tags = json.loads(row["tags"] or "[]")
+    new_tags = (tags + [t for t in auto_extract_tags(row["content"], file_path) if t not in tags])[:10]
+
+    category = row["category"]
+    if category is None or recategorize:
+        category = auto_detect_category(row["content"], file_path) or category
+
+    if new_tags == tags and category == row["category"]:
+        return None
+    return category, new_tags
+
+
+def run_retag(project_id: Optional[str], recategorize: bool):
+    """既存の記憶にカテゴリ・タグを付け直すバックグラウンドジョブ
+
+    RETAG_BATCH_SIZE 件ごとにコミットし、変化した記憶だけを更新する（埋め込みも再計算）。
+    読み取り後に PATCH などで変更された記憶は上書きしない（change_seq が読み取り時と同じ行だけ更新する）。
+    """
+    where_sql = "1=1"
+    params: list = []
+    if project_id:
+        where_sql += " AND scope_id = ?"
+        params.append(project_id)
+
+    try:
+        with get_db() as conn:
+            cursor = conn.execute(f"SELECT COUNT(*) FROM memories WHERE {where_sql}", params)
+            _retag_state["total"] = cursor.fetchone()[0]
+
+            last_id = ""
+            while True:
+                cursor = conn.execute(f"""
+                    SELECT id, content, metadata, category, tags, change_seq FROM memories
+                    WHERE {where_sql} AND id > ?
+                    ORDER BY id LIMIT ?
+                """, params + [last_id, RETAG_BATCH_SIZE])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                updates = []
+                for row in rows:
+                    result = retag_row(row, recategorize)
+                    if result is not None:
+                        category, tags = result
+                        updates.append((
+                            category, json.dumps(tags), embed_memory(row["content"], tags),
+                            search_terms(row["content"], tags), row["id"], row["change_seq"]
+                        ))
+                updated = 0
+                if updates:
+                    cursor = conn.executemany("""
+                        UPDATE memories SET category = ?, tags = ?, embedding = ?, search_terms = ?
+                        WHERE id = ? AND change_seq IS ?
+                    """, updates)
+                    updated = cursor.rowcount
+                    conn.commit()
+                last_id = rows[-1]["id"]
+                _retag_state["processed"] += len(rows)
+                _retag_state["updated"] += updated
+        if _retag_state["updated"]:
+            project_indexes.invalidate(project_id)
+            context_cache.invalidate()
+    except Exception as e:
+        _retag_state["error"] = str(e)
+    finally:
+        _retag_state["finished_at"] = datetime.utcnow().isoformat()
+        _retag_state["running"] = False
+
+
+def schedule_retag(background_tasks: BackgroundTasks, project_id: Optional[str], recategorize: bool) -> bool:
+    """再タグ付けジョブを登録する。実行中なら登録せず False を返す"""
+    with _retag_lock:
+        if _retag_state["running"]:
+            return False
+        _retag_state.update(
+            running=True,
+            project_id=project_id,
+            recategorize=recategorize,
+            dictionary_version=keyword_dictionaries.current().version,
+            total=0,
+            processed=0,
+            updated=0,
+            started_at=datetime.utcnow().isoformat(),
+            finished_at=None,
+            error=None,
+        )
+
+    background_tasks.add_task(run_retag, project_id, recategorize)
+    return True
+
+
+@app.post("/admin/retag", status_code=202)
+async def start_retag(
+    background_tasks: BackgroundTasks,
+    project_id: Optional[str] = Query(None, description="対象プロジェクト（省略時は全体）"),
+    recategorize: bool = Query(False, description="設定済みのカテゴリも推定し直すか"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """現在のキーワード辞書で既存の記憶にカテゴリ・タグを付け直す（管理者のみ、バックグラウンド実行）"""
+    if current_user and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    if not schedule_retag(background_tasks, project_id, recategorize):
+        raise HTTPException(status_code=409, detail="Retag already running")
+
+    log_audit(
+        user_id=current_user.user_id if current_user else None,
+        action="start_retag",
+        details={"project_id": project_id, "recategorize": recategorize}
+    )
+
+    return {
+        "message": "Retag started",
+        "project_id": project_id,
+        "recategorize": recategorize,
+        "dictionary_version": _retag_state["dictionary_version"],
     }
 
 
-# ============================================================
-# API エンドポイント: 統計・管理
-# ============================================================
+@app.get("/admin/retag")
+async def get_retag_status(
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """再タグ付けジョブの進捗を取得（管理者のみ）"""
+    if current_user and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return dict(_retag_state)
+
+
+@app.get("/admin/keywords")
+async def get_keyword_dictionary(
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """使用中のキーワード辞書の情報（管理者のみ）"""
+    if current_user and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
 
-@app.get("/stats/{project_id}")
-async def get_stats(
-    project_id: str,
-    include_deprecated: bool = Query(False, description="廃止済み記憶を含めるか"),
+    keyword_dictionaries.current()  # 更新があれば反映してから返す
+    return keyword_dictionaries.status()
+
+
+@app.post("/admin/keywords/reload")
+async def reload_keyword_dictionary(
+    background_tasks: BackgroundTasks,
+    retag: bool = Query(False, description="読み込み後に再タグ付けジョブを開始するか"),
     current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """プロジェクトの統計情報"""
-    # deprecated フィルタ条件
-    deprecated_filter = "" if include_deprecated else "AND (deprecated IS NULL OR deprecated = FALSE)"
+    """キーワード辞書を即座に読み直す（管理者のみ）
 
-    with get_db() as conn:
-        cursor = conn.execute(f"""
-            SELECT
-                scope,
-                type,
-                COUNT(*) as count,
-                AVG(importance) as avg_importance
-            FROM memories
-            WHERE (scope_id = ? OR scope = 'global')
-            {deprecated_filter}
-            GROUP BY scope, type
-        """, (project_id,))
+    通常は KEYWORD_DICTIONARY_CHECK_SECONDS ごとに更新が自動で反映される。
+    読み込みに失敗した場合は直前の辞書を使い続け、400 を返す。
+    """
+    if current_user and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not keyword_dictionaries.path:
+        raise HTTPException(status_code=400, detail="KEYWORD_DICTIONARY_PATH is not set")
 
-        stats = {}
-        for row in cursor.fetchall():
-            key = f"{row['scope']}/{row['type']}"
-            stats[key] = {
-                "count": row["count"],
-                "avg_importance": round(row["avg_importance"], 2) if row["avg_importance"] else 0
-            }
+    reloaded = keyword_dictionaries.reload(force=True)
+    status = keyword_dictionaries.status()
+    if not reloaded:
+        raise HTTPException(status_code=400, detail=f"Failed to load keyword dictionary: {status['error']}")
 
-        return {"project_id": project_id, "stats": stats}
+    retag_scheduled = retag and schedule_retag(background_tasks, None, False)
 
+    log_audit(
+        user_id=current_user.user_id if current_user else None,
+        action="reload_keywords",
+        details={"version": status["version"], "retag": retag_scheduled}
+    )
 
-@app.get("/admin/audit-logs")
-async def get_audit_logs(
-    limit: int = Query(100, le=1000),
-    user_id: Optional[str] = Query(None),
-    action: Optional[str] = Query(None),
+    return {**status, "retag_scheduled": retag_scheduled}
+
+
+@app.post("/admin/stats/rebuild")
+async def rebuild_stats(
     current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """監査ログを取得（管理者のみ）"""
+    """project_stats を memories から再集計（管理者のみ）
+
+    通常はトリガーで最新に保たれる。トリガー導入前の DB を手で編集した場合や、
+    削除で古くなった last_activity を正確にしたい場合に使う。
+    """
     if current_user and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
 
     with get_db() as conn:
-        sql = "SELECT * FROM audit_logs WHERE 1=1"
-        params: list = []
-
-        if user_id:
-            sql += " AND user_id = ?"
-            params.append(user_id)
-
-        if action:
-            sql += " AND action = ?"
-            params.append(action)
-
-        sql += " ORDER BY created_at DESC LIMIT ?"
-        params.append(limit)
+        rows = rebuild_project_stats(conn)
+        conn.commit()
 
-        cursor = conn.execute(sql, params)
-        logs = []
-        for row in cursor.fetchall():
-            log = dict(row)
-            if log.get("details"):
-                log["details"] = json.loads(log["details"])
-            logs.append(log)
+    log_audit(
+        user_id=current_user.user_id if current_user else None,
+        action="rebuild_stats",
+        details={"rows": rows}
+    )
 
-        return {"logs": logs, "count": len(logs)}
+    return {"message": "Stats rebuilt", "rows": rows}
 
 
 @app.post("/cleanup")
@@ -1937,109 +5290,917 @@ async def cleanup_expired(
         cursor = conn.execute("""
             DELETE FROM memories WHERE expires_at IS NOT NULL AND expires_at < ?
         """, (now,))
+        deleted = cursor.rowcount
+        purged = purge_tombstones(conn)
+        purged_changes = purge_change_log(conn)
         conn.commit()
+        if deleted:
+            project_indexes.invalidate()
+            context_cache.invalidate()
 
         log_audit(
             user_id=current_user.user_id if current_user else None,
             action="cleanup_expired",
-            details={"deleted_count": cursor.rowcount}
+            details={"deleted_count": deleted, "purged_tombstones": purged, "purged_changes": purged_changes}
+        )
+
+        return {"deleted": deleted, "purged_tombstones": purged, "purged_changes": purged_changes}
+
+
+def purge_tombstones(conn: sqlite3.Connection) -> int:
+    """保持期間を過ぎた墓標を削除し、削除した最大の change_seq を purged_seq に記録する
+
+    purged_seq より古い watermark からの差分エクスポートは削除を取りこぼすため 410 を返す。
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)).isoformat()
+    max_seq = conn.execute(
+        "SELECT MAX(change_seq) FROM memory_tombstones WHERE deleted_at < ?", (cutoff,)
+    ).fetchone()[0]
+    if max_seq is None:
+        return 0
+    cursor = conn.execute("DELETE FROM memory_tombstones WHERE change_seq <= ?", (max_seq,))
+    conn.execute("UPDATE change_sequence SET purged_seq = MAX(purged_seq, ?) WHERE id = 1", (max_seq,))
+    return cursor.rowcount
+
+
+def purge_change_log(conn: sqlite3.Connection) -> int:
+    """保持期間を過ぎた変更ログを削除し、削除した最大の seq を changes_purged_seq に記録する"""
+    cutoff = (datetime.utcnow() - timedelta(days=CHANGE_LOG_RETENTION_DAYS)).isoformat()
+    max_seq = conn.execute(
+        "SELECT MAX(seq) FROM memory_changes WHERE changed_at < ?", (cutoff,)
+    ).fetchone()[0]
+    if max_seq is None:
+        return 0
+    cursor = conn.execute("DELETE FROM memory_changes WHERE seq <= ?", (max_seq,))
+    conn.execute(
+        "UPDATE change_sequence SET changes_purged_seq = MAX(changes_purged_seq, ?) WHERE id = 1", (max_seq,)
+    )
+    return cursor.rowcount
+
+
+EXPORT_STREAM_BATCH_SIZE = 500  # ストリーミングエクスポートで1回に送る行数
+
+
+def export_row(row: sqlite3.Row) -> dict:
+    """エクスポート用に DB の行を dict に変換"""
+    return {
+        "id": row["id"],
+        "scope": row["scope"],
+        "scope_id": row["scope_id"],
+        "type": row["type"],
+        "content": row["content"],
+        "summary": row["summary"],
+        "importance": row["importance"],
+        "metadata": json.loads(row["metadata"] or "{}"),
+        "category": row["category"] if "category" in row.keys() else None,
+        "tags": json.loads(row["tags"] or "[]") if "tags" in row.keys() else [],
+        "created_by": row["created_by"],
+        "created_at": row["created_at"],
+        "expires_at": row["expires_at"],
+        "deprecated": bool(row["deprecated"]),
+        "superseded_by": row["superseded_by"],
+        "updated_at": row["updated_at"],
+        "change_seq": row["change_seq"]
+    }
+
+
+def tombstone_row(row: sqlite3.Row) -> dict:
+    """差分エクスポート用に墓標（削除済み記憶）を dict に変換"""
+    return {
+        "id": row["id"],
+        "scope": row["scope"],
+        "scope_id": row["scope_id"],
+        "deleted": True,
+        "deleted_at": row["deleted_at"],
+        "change_seq": row["change_seq"]
+    }
+
+
+def read_export_watermark(conn: sqlite3.Connection, since: Optional[int]) -> int:
+    """現在の change_seq（次回の since に使う watermark）を返す
+
+    読み取り前に取得するため、返す値以下の変更はすべてコミット済み。
+    それより後の変更が結果に混ざっても、次回の差分で再送されるだけ（取り込みは冪等）。
+    """
+    row = conn.execute("SELECT value, purged_seq FROM change_sequence WHERE id = 1").fetchone()
+    if since is not None and since < row["purged_seq"]:
+        raise HTTPException(
+            status_code=410,
+            detail={
+                "message": "watermark が古すぎて削除履歴が残っていません。フルエクスポートからやり直してください",
+                "purged_seq": row["purged_seq"],
+            }
         )
+    return row["value"]
 
-        return {"deleted": cursor.rowcount}
+
+def iter_export_ndjson(project_id: str, after: Optional[str], compress: bool, since: Optional[int] = None):
+    """プロジェクトの記憶を NDJSON で1行ずつ生成する
+
+    1つの読み取りトランザクション内でカーソルを回すため、途中の書き込みに影響されない
+    一貫したスナップショットになる。id 昇順なので、中断時は最後に受け取った id を after に渡せば再開できる。
+    since 指定時は change_seq が since より大きい記憶のみを出力し、先頭に削除の墓標を出力する
+    （墓標は after 指定の再開時には再送しない）。
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits=31: gzip 形式
+    with get_db(check_same_thread=False) as conn:
+        conn.execute("BEGIN")
+        try:
+            if since is not None and after is None:
+                cursor = conn.execute("""
+                    SELECT * FROM memory_tombstones
+                    WHERE (scope_id = ? OR scope = 'global') AND change_seq > ?
+                    ORDER BY change_seq
+                """, (project_id, since))
+                chunk = "".join(json.dumps(tombstone_row(row), ensure_ascii=False) + "\n" for row in cursor.fetchall()).encode("utf-8")
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+
+            where_sql = "(scope_id = ? OR scope = 'global') AND id > ?"
+            params: list = [project_id, after or ""]
+            if since is not None:
+                where_sql += " AND change_seq > ?"
+                params.append(since)
+            cursor = conn.execute(f"SELECT * FROM memories WHERE {where_sql} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                chunk = "".join(json.dumps(export_row(row), ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+        finally:
+            conn.rollback()
+    if compressor:
+        yield compressor.flush()
 
 
 @app.get("/export/{project_id}")
 async def export_memories(
     project_id: str,
+    format: ExportFormat = Query(ExportFormat.JSON, description="出力形式: json（一括）, ndjson（ストリーミング）"),
+    gzip: bool = Query(False, description="ndjson を gzip 圧縮して返すか"),
+    after: Optional[str] = Query(None, description="再開用: この id より後の記憶から出力（ndjson のみ）"),
+    since: Optional[int] = Query(None, ge=0, description="差分エクスポート: 前回の watermark より後の変更・削除のみ出力"),
     current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """プロジェクトの記憶をエクスポート"""
+    """プロジェクトの記憶をエクスポート
+
+    format=ndjson では1行1記憶のストリーミングで返し、メモリ使用量がプロジェクトの大きさに依存しない。
+    レスポンスには watermark（ndjson では X-Export-Watermark ヘッダ）を含み、
+    次回 since に渡すと作成・更新・廃止・削除された記憶だけを取得できる。
+    """
     if current_user and not current_user.can_access_project(project_id):
         raise HTTPException(status_code=403, detail="No access to this project")
 
     with get_db() as conn:
+        watermark = read_export_watermark(conn, since)
+
+        if format == ExportFormat.NDJSON:
+            headers = {"X-Export-Watermark": str(watermark)}
+            if gzip:
+                headers["Content-Encoding"] = "gzip"
+            return StreamingResponse(
+                iter_export_ndjson(project_id, after, gzip, since),
+                media_type="application/x-ndjson",
+                headers=headers
+            )
+
+        if since is None:
+            cursor = conn.execute("""
+                SELECT * FROM memories
+                WHERE scope_id = ? OR scope = 'global'
+            """, (project_id,))
+            memories = [export_row(row) for row in cursor.fetchall()]
+            return {"project_id": project_id, "memories": memories, "count": len(memories), "watermark": watermark}
+
         cursor = conn.execute("""
             SELECT * FROM memories
-            WHERE scope_id = ? OR scope = 'global'
-        """, (project_id,))
+            WHERE (scope_id = ? OR scope = 'global') AND change_seq > ?
+            ORDER BY change_seq
+        """, (project_id, since))
+        memories = [export_row(row) for row in cursor.fetchall()]
+        cursor = conn.execute("""
+            SELECT * FROM memory_tombstones
+            WHERE (scope_id = ? OR scope = 'global') AND change_seq > ?
+            ORDER BY change_seq
+        """, (project_id, since))
+        deleted = [tombstone_row(row) for row in cursor.fetchall()]
 
-        memories = []
-        for row in cursor.fetchall():
-            memories.append({
-                "id": row["id"],
-                "scope": row["scope"],
-                "scope_id": row["scope_id"],
-                "type": row["type"],
-                "content": row["content"],
-                "summary": row["summary"],
-                "importance": row["importance"],
-                "metadata": json.loads(row["metadata"] or "{}"),
-                "category": row["category"] if "category" in row.keys() else None,
-                "tags": json.loads(row["tags"] or "[]") if "tags" in row.keys() else [],
-                "created_by": row["created_by"],
-                "created_at": row["created_at"]
-            })
-
-        return {"project_id": project_id, "memories": memories, "count": len(memories)}
+        return {
+            "project_id": project_id,
+            "memories": memories,
+            "deleted": deleted,
+            "count": len(memories),
+            "since": since,
+            "watermark": watermark,
+        }
+
+
+IMPORT_CHUNK_SIZE = 500  # インポートで1トランザクションにまとめる行数
+IMPORT_MAX_ERRORS = 100  # レスポンスに含める行エラーの上限
+
+# インポートは内容が重複していてもまとめずにそのまま取り込む。
+# 同じ内容の有効な記憶が既にある場合は content_hash を NULL にして重複判定の対象から外す（一意インデックス違反を避ける）
+_IMPORT_SQL = """
+    INSERT OR REPLACE INTO memories
+    (id, scope, scope_id, type, content, summary, importance, metadata, category, tags, created_by, created_at, expires_at, deprecated, superseded_by, embedding, content_hash, simhash, token_count, search_terms)
+    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10, ?11, ?12, ?13, ?14, ?15, ?16, CASE WHEN ?14 OR NOT EXISTS (
+        SELECT 1 FROM memories
+        WHERE content_hash = ?17 AND scope = ?2 AND COALESCE(scope_id, '') = COALESCE(?3, '') AND type = ?4
+          AND COALESCE(deprecated, 0) = 0 AND id != ?1
+    ) THEN ?17 END, ?18, ?19, ?20)
+"""
+
+
+def prepare_import_row(
+    m, current_user: Optional[CurrentUser], defer_index: bool, default_id: Optional[str] = None
+) -> tuple:
+    """インポート1行を検証し、INSERT 用のタプルに変換する
+
+    /store と同じバリデーション・サニタイズ・カテゴリ推定・タグ抽出を適用する。
+    id / created_by / created_at / expires_at / deprecated はエクスポート元の値を引き継ぐ
+    （created_by を引き継ぐのは管理者のみ。一般ユーザーの取り込みは本人が作成者になる）。
+    id が無い行は default_id（未指定なら新しいID）で入れる。
+    不正な行は ValueError（メッセージは行エラーとして返す）。
+    """
+    if not isinstance(m, dict):
+        raise ValueError("各行は JSON オブジェクトで指定してください")
+
+    m = dict(m)
+    # 旧形式のエクスポートではタグが JSON 文字列のことがある
+    if isinstance(m.get("tags"), str):
+        try:
+            m["tags"] = json.loads(m["tags"])
+        except json.JSONDecodeError:
+            raise ValueError("tags が不正です")
+    if m.get("metadata") is None:
+        m["metadata"] = {}
+
+    try:
+        entry = MemoryEntry.model_validate({k: v for k, v in m.items() if k in MemoryEntry.model_fields})
+        validate_content_not_empty(entry.content)
+        validate_content_length(entry.content)
+        if entry.expires_at:
+            validate_expires_at(entry.expires_at)
+        entry.content = sanitize_control_chars(entry.content)
+        if entry.summary:
+            entry.summary = sanitize_control_chars(entry.summary)
+        entry.metadata = sanitize_metadata(entry.metadata)
+        enforce_type_metadata(entry, current_user)
+    except ValidationError as e:
+        first = e.errors()[0]
+        raise ValueError(f"{'.'.join(str(x) for x in first['loc'])}: {first['msg']}")
+    except HTTPException as e:
+        detail = e.detail.get("message") if isinstance(e.detail, dict) else e.detail
+        raise ValueError(str(detail))
+
+    if entry.scope == MemoryScope.PROJECT and entry.scope_id:
+        if current_user and not current_user.can_write_project(entry.scope_id):
+            raise ValueError("No write access to this project")
+    if entry.scope == MemoryScope.TEAM and not entry.scope_id:
+        raise ValueError("team scope requires scope_id")
+
+    if entry.expires_at:
+        expires_at = entry.expires_at
+    else:
+        ttl_days = DEFAULT_TTL_DAYS.get(entry.type.value, 30)
+        expires_at = (datetime.utcnow() + timedelta(days=ttl_days)).isoformat()
+
+    file_path = entry.metadata.get("file")
+    category = entry.category.value if entry.category else auto_detect_category(entry.content, file_path)
+    auto_tags = auto_extract_tags(entry.content, file_path)
+    all_tags = list(set(entry.tags + auto_tags))[:10]  # 最大10個
+
+    return (
+        m.get("id") or default_id or generate_id(),
+        entry.scope.value,
+        entry.scope_id,
+        entry.type.value,
+        entry.content,
+        entry.summary or create_summary(entry.content),
+        entry.importance,
+        json.dumps(entry.metadata),
+        category,
+        json.dumps(all_tags),
+        current_user.user_id if current_user and not current_user.is_admin
+        else m.get("created_by", current_user.user_id if current_user else None),
+        m.get("created_at") or datetime.utcnow().isoformat(),
+        expires_at,
+        bool(m.get("deprecated", False)),
+        m.get("superseded_by"),
+        # 遅延時は埋め込み・SimHash を NULL で入れ、インポート後の再インデックスジョブで計算する
+        None if defer_index else embed_memory(entry.content, all_tags),
+        content_hash(entry.content, entry.metadata),
+        None if defer_index else simhash(entry.content),
+        count_tokens(entry.content),
+        search_terms(entry.content, all_tags),
+    )
+
+
+async def iter_import_records(request: Request):
+    """インポートのリクエストボディを (行番号, レコード, エラー) で順に返す
+
+    Content-Type が application/x-ndjson の場合は1行ずつストリーミングで読み、
+    ボディ全体をメモリに載せない（Content-Encoding: gzip にも対応）。
+    それ以外は従来の {"memories": [...]} 形式として扱う。
+    """
+    if "ndjson" not in request.headers.get("content-type", ""):
+        try:
+            data = json.loads(await request.body() or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=422, detail="Invalid JSON body")
+        memories = data.get("memories", []) if isinstance(data, dict) else None
+        if not isinstance(memories, list):
+            raise HTTPException(status_code=422, detail="memories must be a list")
+        for i, m in enumerate(memories, 1):
+            yield i, m, None
+        return
+
+    decompressor = None
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        decompressor = zlib.decompressobj(47)  # wbits=47: gzip/zlib ヘッダを自動判別
+
+    line_no = 0
+    buffer = b""
+
+    def parse(line: bytes):
+        try:
+            return json.loads(line), None
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            return None, f"Invalid JSON: {e}"
+
+    async for chunk in request.stream():
+        if decompressor:
+            try:
+                chunk = decompressor.decompress(chunk)
+            except zlib.error:
+                raise HTTPException(status_code=400, detail="Invalid gzip body")
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                yield (line_no, *parse(line))
+    if buffer.strip():
+        yield (line_no + 1, *parse(buffer))
 
 
 @app.post("/import")
 async def import_memories(
-    data: dict,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    defer_index: bool = Query(False, description="埋め込みの計算をインポート後のバックグラウンド再インデックスに回すか"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: Optional[CurrentUser] = Depends(get_current_user)
 ):
-    """記憶をインポート"""
-    memories = data.get("memories", [])
+    """記憶をインポート
 
-    imported = 0
+    IMPORT_CHUNK_SIZE 行ごとに検証し、1トランザクションの executemany で書き込む。
+    不正な行はスキップして行番号付きで errors に返す（他の行の取り込みは継続）。
+
+    Idempotency-Key ヘッダーを付けると、同じキーでの再送には取り込みをせず最初の結果を返す。
+    ボディが最初と同じかを確かめるため、キー付きのリクエストはストリーミングせずボディ全体を読んでから処理する。
+    """
+    idempotent = None
+    if idempotency_key is not None:
+        idempotent = IdempotentRequest(
+            idempotency_key, current_user, "/import", IdempotentRequest.hash_request(request, await request.body())
+        )
+        replay = idempotent.begin()
+        if replay is not None:
+            return replay
+
+    try:
+        return await run_import(request, background_tasks, defer_index, current_user, idempotent)
+    except BaseException:
+        if idempotent:
+            idempotent.abort()
+        raise
+
+
+async def run_import(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    defer_index: bool,
+    current_user: Optional[CurrentUser],
+    idempotent: Optional[IdempotentRequest]
+) -> dict:
+    """/import の本体（記憶を取り込み、結果を返す）
+
+    チャンクごとにコミットするため、途中で失敗するとそれまでの行は取り込まれたまま予約が消える。
+    キー付きの場合は id の無い行にキーと行番号から決まるIDを使い、同じキーでの再送が同じ記憶を置き換えるようにする。
+    """
     user_id = current_user.user_id if current_user else None
+    imported = 0
+    failed = 0
+    errors: list[dict] = []
+    pending: list[tuple[int, tuple]] = []
+
+    def add_error(line: int, memory_id, message: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append({"line": line, "id": memory_id, "error": message})
 
     with get_db() as conn:
-        for m in memories:
+        def reject_foreign_rows():
+            """既存の記憶を置き換える行のうち、PATCH / DELETE と同じ権限（作成者本人）を満たさないものを除く"""
+            ids = [values[0] for _, values in pending]
+            placeholders = ",".join("?" * len(ids))
+            existing = {
+                row["id"]: row for row in conn.execute(
+                    f"SELECT id, scope, scope_id, created_by FROM memories WHERE id IN ({placeholders})", ids
+                )
+            }
+            allowed = []
+            for line, values in pending:
+                row = existing.get(values[0])
+                if row is not None and (
+                    row["created_by"] != user_id
+                    or (row["scope"] == MemoryScope.PROJECT.value and not current_user.can_write_project(row["scope_id"]))
+                ):
+                    add_error(line, values[0], "Cannot overwrite others' memories")
+                    continue
+                allowed.append((line, values))
+            pending[:] = allowed
+
+        def flush():
+            nonlocal imported
+            if current_user and not current_user.is_admin and pending:
+                reject_foreign_rows()
+            if not pending:
+                return
             try:
-                memory_id = m.get("id", generate_id())
-                now = datetime.utcnow().isoformat()
-                scope = m.get("scope", "project")
-                ttl_days = DEFAULT_TTL_DAYS.get(m.get("type", "work"), 30)
-                expires_at = (datetime.utcnow() + timedelta(days=ttl_days)).isoformat()
-
-                # タグはリストまたはJSON文字列として受け取る
-                tags = m.get("tags", [])
-                if isinstance(tags, str):
-                    tags = json.loads(tags)
-
-                conn.execute("""
-                    INSERT OR REPLACE INTO memories
-                    (id, scope, scope_id, type, content, summary, importance, metadata, category, tags, created_by, created_at, expires_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    memory_id,
-                    scope,
-                    m.get("scope_id"),
-                    m.get("type", "work"),
-                    m.get("content", ""),
-                    m.get("summary"),
-                    m.get("importance", 0.5),
-                    json.dumps(m.get("metadata", {})),
-                    m.get("category"),
-                    json.dumps(tags),
-                    m.get("created_by", user_id),
-                    m.get("created_at", now),
-                    expires_at
-                ))
-                imported += 1
-            except Exception:
-                continue
-
-        conn.commit()
+                conn.executemany(_IMPORT_SQL, [values for _, values in pending])
+                conn.commit()
+                imported += len(pending)
+            except sqlite3.Error:
+                # チャンク単位で失敗した場合のみ1行ずつ入れ直し、原因の行を特定する
+                conn.rollback()
+                for line, values in pending:
+                    try:
+                        conn.execute(_IMPORT_SQL, values)
+                        imported += 1
+                    except sqlite3.Error as e:
+                        add_error(line, values[0], str(e))
+                conn.commit()
+            pending.clear()
+
+        async for line, record, error in iter_import_records(request):
+            if error is None:
+                try:
+                    default_id = idempotent.derive_id(line) if idempotent else None
+                    pending.append((line, prepare_import_row(record, current_user, defer_index, default_id)))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                add_error(line, record.get("id") if isinstance(record, dict) else None, error)
+            if len(pending) >= IMPORT_CHUNK_SIZE:
+                flush()
+        flush()
+
+    # INSERT OR REPLACE はスコープ移動もあり得るため、ロード済みインデックスは作り直す
+    reindex_scheduled = False
+    if imported:
+        project_indexes.invalidate()
+        context_cache.invalidate()
+        if defer_index:
+            reindex_scheduled = schedule_reindex(background_tasks, None, False)
 
     log_audit(
         user_id=user_id,
         action="import_memories",
-        details={"imported_count": imported}
+        details={"imported_count": imported, "failed_count": failed, "defer_index": defer_index}
+    )
+
+    result = {
+        "imported": imported,
+        "failed": failed,
+        "errors": errors,
+        "reindex_scheduled": reindex_scheduled,
+    }
+    if idempotent:
+        with get_db() as conn:
+            idempotent.complete(conn, 200, result)
+            conn.commit()
+    return result
+
+
+# ============================================================
+# API エンドポイント: 変更フィード
+# ============================================================
+
+def visible_scope_ids(current_user: Optional[CurrentUser]) -> Optional[set]:
+    """閲覧可能な scope_id（所属プロジェクト＋チーム）の集合。None なら全スコープ閲覧可（管理者・認証無効時）"""
+    if current_user and not current_user.is_admin:
+        current_user.load_project_roles()
+        visible = set(current_user._project_roles)
+        if current_user.team_id:
+            visible.add(current_user.team_id)
+        return visible
+    return None
+
+
+def change_visibility(scope_id: Optional[str], current_user: Optional[CurrentUser]) -> tuple[Optional[str], Optional[set]]:
+    """変更フィードの可視範囲を決める
+
+    Returns:
+        (絞り込む scope_id, 閲覧可能な scope_id の集合)。集合が None なら全スコープ閲覧可（管理者・認証無効時）。
+        global スコープの変更は常に閲覧可。
+    """
+    if scope_id:
+        if current_user and not current_user.is_admin and not current_user.can_access_project(scope_id) \
+                and scope_id != current_user.team_id:
+            raise HTTPException(status_code=403, detail="No access to this project")
+        return scope_id, None
+    return None, visible_scope_ids(current_user)
+
+
+def change_filter_sql(scope_id: Optional[str], visible: Optional[set]) -> tuple[str, list]:
+    """change_visibility の結果を memory_changes の WHERE 句に変換"""
+    if scope_id:
+        return " AND (scope_id = ? OR scope = 'global')", [scope_id]
+    if visible is not None:
+        if not visible:
+            return " AND scope = 'global'", []
+        return f" AND (scope = 'global' OR scope_id IN ({','.join('?' * len(visible))}))", sorted(visible)
+    return "", []
+
+
+def change_rows_to_dicts(conn: sqlite3.Connection, rows: list, include_memory: bool) -> list[dict]:
+    """memory_changes の行を API 用の dict に変換（記憶の現在の内容は1回の IN クエリでまとめて取得）"""
+    memories = {}
+    if include_memory:
+        ids = list({row["memory_id"] for row in rows if row["op"] != "delete"})
+        if ids:
+            cursor = conn.execute(f"SELECT * FROM memories WHERE id IN ({','.join('?' * len(ids))})", ids)
+            memories = {row["id"]: export_row(row) for row in cursor.fetchall()}
+
+    changes = []
+    for row in rows:
+        change = {
+            "seq": row["seq"],
+            "op": row["op"],
+            "id": row["memory_id"],
+            "scope": row["scope"],
+            "scope_id": row["scope_id"],
+            "changed_at": row["changed_at"],
+        }
+        if include_memory:
+            # 後続の変更で削除済み・別スコープへ移動済みなら None（どちらも後続の delete で届く）
+            memory = memories.get(row["memory_id"]) if row["op"] != "delete" else None
+            if memory is not None and (memory["scope"], memory["scope_id"]) != (row["scope"], row["scope_id"]):
+                memory = None
+            change["memory"] = memory
+        changes.append(change)
+    return changes
+
+
+@app.get("/changes")
+async def get_changes(
+    since: int = Query(0, ge=0, description="この seq より後の変更を返す（前回の next_since）"),
+    limit: int = Query(100, ge=1, le=CHANGES_MAX_LIMIT),
+    scope_id: Optional[str] = Query(None, description="プロジェクト/チームで絞り込み（global の変更も含む）"),
+    include_memory: bool = Query(True, description="各変更に記憶の現在の内容を含めるか"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """記憶の変更フィードを seq 昇順で返す
+
+    作成・更新・廃止・削除のたびに単調増加の seq が振られる。
+    next_since を次回の since に渡せば、変更件数に比例するコストで追従できる。
+    since が保持期間外（削除済みの変更ログ）なら 410。フルエクスポートの watermark から始め直す。
+    """
+    filter_sql, filter_params = change_filter_sql(*change_visibility(scope_id, current_user))
+
+    with get_db() as conn:
+        sequence = conn.execute("SELECT value, changes_purged_seq FROM change_sequence WHERE id = 1").fetchone()
+        if since < sequence["changes_purged_seq"]:
+            raise HTTPException(
+                status_code=410,
+                detail={
+                    "message": "since が変更ログの保持期間外です。エクスポートの watermark から追従し直してください",
+                    "oldest_available": sequence["changes_purged_seq"],
+                }
+            )
+
+        rows = conn.execute(
+            f"SELECT * FROM memory_changes WHERE seq > ?{filter_sql} ORDER BY seq LIMIT ?",
+            [since] + filter_params + [limit + 1]
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        changes = change_rows_to_dicts(conn, rows, include_memory)
+
+    # 続きが無ければ、絞り込みで読み飛ばした分も含めて latest_seq まで進めてよい
+    # （latest_seq は SELECT より前に読んだコミット済みの値なので、それ以下の変更は取りこぼさない）
+    next_since = rows[-1]["seq"] if rows else since
+    if not has_more:
+        next_since = max(next_since, sequence["value"])
+
+    return {
+        "changes": changes,
+        "next_since": next_since,
+        "has_more": has_more,
+        "latest_seq": sequence["value"],
+    }
+
+
+class ChangeSubscriber:
+    """SSE 購読者1人分の状態（有界キュー＋可視範囲）"""
+
+    def __init__(self, scope_id: Optional[str], visible: Optional[set], queue_size: int):
+        self.scope_id = scope_id
+        self.visible = visible
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def accepts(self, change: dict) -> bool:
+        if change["scope"] == "global":
+            return True
+        if self.scope_id:
+            return change["scope_id"] == self.scope_id
+        return self.visible is None or change["scope_id"] in self.visible
+
+
+class ChangeBroadcaster:
+    """変更ログを1か所で読み、全 SSE 購読者へ配信する
+
+    購読者がいる間だけ1つのタスクが SSE_POLL_INTERVAL ごとに memory_changes を読む。
+    購読者数に関係なく DB 読み取りは1回で済み、トリガーで記録されるため他ワーカーの書き込みも届く。
+    キューが溢れた（読み出しが遅い）購読者は切断し、/changes での再同期を促す（背圧）。
+    """
+
+    def __init__(self, poll_interval: float, queue_size: int, max_subscribers: int):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: set[ChangeSubscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._last_seq = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, scope_id: Optional[str], visible: Optional[set]) -> tuple[ChangeSubscriber, int]:
+        """購読を開始し、(購読者, 配信開始位置の seq) を返す"""
+        if len(self._subscribers) >= self.max_subscribers:
+            raise HTTPException(status_code=503, detail="Too many subscribers")
+        subscriber = ChangeSubscriber(scope_id, visible, self.queue_size)
+        if self._task is None or self._task.done():
+            with get_db() as conn:
+                self._last_seq = conn.execute("SELECT value FROM change_sequence WHERE id = 1").fetchone()[0]
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        self._subscribers.add(subscriber)
+        return subscriber, self._last_seq
+
+    def unsubscribe(self, subscriber: ChangeSubscriber):
+        self._subscribers.discard(subscriber)
+
+    def _publish(self, changes: list[dict]):
+        for subscriber in list(self._subscribers):
+            for change in changes:
+                if not subscriber.accepts(change):
+                    continue
+                try:
+                    subscriber.queue.put_nowait(change)
+                except asyncio.QueueFull:
+                    # 溢れた分は捨てて終了を通知する（None が終了の合図）
+                    subscriber.overflowed = True
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.queue.put_nowait(None)
+                    self._subscribers.discard(subscriber)
+                    break
+
+    async def _run(self):
+        while self._subscribers:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                with get_db() as conn:
+                    rows = conn.execute(
+                        "SELECT * FROM memory_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                        (self._last_seq, CHANGES_MAX_LIMIT)
+                    ).fetchall()
+                    if not rows:
+                        continue
+                    changes = change_rows_to_dicts(conn, rows, include_memory=True)
+            except sqlite3.Error:
+                continue  # 一時的なロック等は次の周期で再試行
+            self._last_seq = rows[-1]["seq"]
+            self._publish(changes)
+
+
+change_broadcaster = ChangeBroadcaster(SSE_POLL_INTERVAL, SSE_QUEUE_SIZE, SSE_MAX_SUBSCRIBERS)
+
+
+def sse_event(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    """SSE の1イベント分のテキストを作る"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@app.get("/changes/stream")
+async def stream_changes(
+    request: Request,
+    scope_id: Optional[str] = Query(None, description="プロジェクト/チームで絞り込み（global の変更も含む）"),
+    since: Optional[int] = Query(None, ge=0, description="この seq より後の変更から配信（Last-Event-ID ヘッダでも可）"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """記憶の変更を Server-Sent Events で配信する
+
+    イベント名は /changes の op（insert, update, deprecate, delete）、id は seq。
+    無通信時は SSE_HEARTBEAT_SECONDS ごとにコメント行を送る。
+    読み出しが追いつかずキューが溢れた場合は overflow イベントを送って切断するので、
+    resume_from を since にして /changes で再同期してから再接続すること。
+    """
+    if request.scope.get("batch_subrequest"):
+        # 購読キューと配信タスクはサーバーのイベントループに紐づくため、/batch の使い捨てループでは購読させない
+        raise HTTPException(status_code=422, detail="/changes/stream is not available in /batch")
+    scope_id, visible = change_visibility(scope_id, current_user)
+    if since is None and last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    subscriber, live_from = change_broadcaster.subscribe(scope_id, visible)
+
+    # 再接続時は購読開始位置までの取りこぼしを変更ログから補う（購読後に読むので隙間ができない）
+    backlog: list[dict] = []
+    if since is not None and since < live_from:
+        filter_sql, filter_params = change_filter_sql(scope_id, visible)
+        with get_db() as conn:
+            purged = conn.execute("SELECT changes_purged_seq FROM change_sequence WHERE id = 1").fetchone()[0]
+            if since < purged:
+                change_broadcaster.unsubscribe(subscriber)
+                raise HTTPException(status_code=410, detail="since が変更ログの保持期間外です")
+            rows = conn.execute(
+                f"SELECT * FROM memory_changes WHERE seq > ? AND seq <= ?{filter_sql} ORDER BY seq LIMIT ?",
+                [since, live_from] + filter_params + [CHANGES_MAX_LIMIT + 1]
+            ).fetchall()
+            if len(rows) > CHANGES_MAX_LIMIT:
+                change_broadcaster.unsubscribe(subscriber)
+                raise HTTPException(status_code=409, detail="Too many missed changes; resync with /changes first")
+            backlog = change_rows_to_dicts(conn, rows, include_memory=True)
+
+    async def events():
+        last_sent = since if since is not None else live_from
+        try:
+            yield sse_event("ready", {"since": last_sent})
+            for change in backlog:
+                last_sent = change["seq"]
+                yield sse_event(change["op"], change, change["seq"])
+            while True:
+                try:
+                    change = await asyncio.wait_for(subscriber.queue.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                if change is None:
+                    yield sse_event("overflow", {"resume_from": last_sent})
+                    break
+                if change["seq"] <= last_sent:
+                    continue
+                last_sent = change["seq"]
+                yield sse_event(change["op"], change, change["seq"])
+        finally:
+            change_broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    return {"imported": imported}
+
+# ============================================================
+# API エンドポイント: バッチ
+# ============================================================
+
+BATCH_MAX_REQUESTS = 20               # 1回の /batch に含められるサブリクエスト数
+BATCH_SUBREQUEST_TIMEOUT = 10.0       # サブリクエスト1件のタイムアウト（秒）
+_BATCH_FORWARD_HEADERS = {b"authorization", b"x-api-key"}  # サブリクエストに引き継ぐ認証ヘッダ
+_BATCH_EXCLUDED_PATHS = ("/batch", "/changes/stream")      # 入れ子・終わらないストリームは不可
+
+# サブリクエストを実行するスレッド。エンドポイントは async def の中で同期的に SQLite を呼ぶため、
+# 同じイベントループ上では1件ずつしか進まない。スレッドごとのイベントループで実行して並行にする
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_REQUESTS, thread_name_prefix="batch")
+
+
+class BatchSubRequest(BaseModel):
+    method: str = "GET"
+    path: str = Field(..., description="例: /stats/my-project（クエリ文字列を含めてもよい）")
+    params: dict = Field(default_factory=dict, description="クエリパラメータ（値にリストを渡すと複数指定）")
+
+
+class BatchRequest(BaseModel):
+    requests: list[BatchSubRequest] = Field(..., min_length=1, max_length=BATCH_MAX_REQUESTS)
+
+
+async def run_subrequest(parent: Request, sub: BatchSubRequest) -> dict:
+    """サブリクエストをアプリ内で直接（ASGI で）実行し、ステータスとボディを返す
+
+    HTTP を経由しないためネットワーク往復は発生しないが、ルーティング・バリデーション・認証は通常と同じ経路を通る。
+    path はパーセントエンコードされたまま受け取る（ASGI の path はデコード済み、raw_path はエンコード済みの値）。
+    実行は _batch_executor のスレッド上で行い、BATCH_SUBREQUEST_TIMEOUT を過ぎたら 504 を返す
+    （実行中のハンドラは止められないため、そのスレッドで最後まで処理される）。
+    """
+    path, _, query = sub.path.partition("?")
+    params = parse_qsl(query, keep_blank_values=True)
+    for key, value in sub.params.items():
+        for v in value if isinstance(value, list) else [value]:
+            params.append((key, "true" if v is True else "false" if v is False else str(v)))
+
+    headers = [(k, v) for k, v in parent.scope["headers"] if k in _BATCH_FORWARD_HEADERS]
+    headers.append((b"host", parent.headers.get("host", "localhost").encode()))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": parent.url.scheme,
+        "path": unquote(path),
+        "raw_path": path.encode(),
+        "root_path": parent.scope.get("root_path", ""),
+        "query_string": urlencode(params).encode(),
+        "headers": headers,
+        "client": parent.scope.get("client"),
+        "server": parent.scope.get("server"),
+        "batch_subrequest": True,  # 実行スレッドのイベントループは使い捨てのため、ループに紐づく処理は断る目印
+    }
+
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            return {"type": "http.disconnect"}
+        request_sent = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    status = 500
+    content_type = ""
+    chunks: list[bytes] = []
+
+    async def send(message):
+        nonlocal status, content_type
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for key, value in message.get("headers", []):
+                if key.lower() == b"content-type":
+                    content_type = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.wait_for(
+            loop.run_in_executor(_batch_executor, asyncio.run, app(scope, receive, send)),
+            BATCH_SUBREQUEST_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        return {"status": 504, "body": {"detail": "Sub-request timed out"}}
+
+    body = b"".join(chunks)
+    if content_type.startswith("application/json"):
+        try:
+            return {"status": status, "body": json.loads(body)}
+        except json.JSONDecodeError:
+            pass
+    return {"status": status, "body": body.decode("utf-8", errors="replace")}
+
+
+@app.post("/batch")
+async def batch_requests(
+    batch: BatchRequest,
+    request: Request,
+    current_user: Optional[CurrentUser] = Depends(get_current_user)
+):
+    """複数の読み取りリクエストを1往復でまとめて実行
+
+    サブリクエストは呼び出し元と同じ認証情報でスレッドプール上で並行に実行し、結果をリクエストと同じ順序で返す。
+    読み取り（GET）のみ対応。書き込みは /store/batch 等の専用エンドポイントを使う。
+    """
+    for index, sub in enumerate(batch.requests):
+        if sub.method.upper() != "GET":
+            raise HTTPException(status_code=422, detail={"index": index, "detail": "Only GET sub-requests are supported"})
+        # 実行時と同じくデコードしてから判定する（%63hanges/stream や //changes/stream の迂回を防ぐ）
+        path = unquote(sub.path.partition("?")[0])
+        if not path.startswith("/") or posixpath.normpath("/" + path.lstrip("/")) in _BATCH_EXCLUDED_PATHS:
+            raise HTTPException(status_code=422, detail={"index": index, "detail": f"Path not allowed: {sub.path}"})
+
+    responses = await asyncio.gather(*(run_subrequest(request, sub) for sub in batch.requests))
+    return {"responses": responses, "count": len(responses)}
 
 
 # ============================================================
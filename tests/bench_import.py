@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+/import のスループット計測（rows/sec）
+
+実行方法:
+    python tests/bench_import.py [--rows 20000] [--min-rows-per-sec 2000]
+
+前提条件:
+    - Memory Service が http://localhost:8200 で起動していること
+    - 書き込みが多いため、検証用のデータベースで実行すること
+
+JSON 一括 / NDJSON / NDJSON+defer_index の3方式で同じ件数を取り込み、
+いずれかが --min-rows-per-sec を下回った場合は終了コード 1 を返す。
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+
+import requests
+
+BASE_URL = "http://localhost:8200"
+
+
+def make_rows(count: int, scope_id: str) -> list[dict]:
+    """検索・タグ抽出が実際に働く程度の長さの記憶を生成"""
+    return [
+        {
+            "content": f"API のレスポンスを修正 #{i}: JWT 認証エラー時に 401 を返すよう変更。テスト追加済み。",
+            "type": "decision" if i % 5 == 0 else "work",
+            "scope": "project",
+            "scope_id": scope_id,
+            "importance": (i % 10) / 10,
+        }
+        for i in range(count)
+    ]
+
+
+def run(name: str, rows: int, **request_kwargs) -> float:
+    scope_id = f"bench-import-{uuid.uuid4().hex[:8]}"
+    data = make_rows(rows, scope_id)
+    params = request_kwargs.pop("params", {})
+    if request_kwargs.pop("ndjson", False):
+        body = "\n".join(json.dumps(m, ensure_ascii=False) for m in data).encode("utf-8")
+        kwargs = {"data": body, "headers": {"Content-Type": "application/x-ndjson"}}
+    else:
+        kwargs = {"json": {"memories": data}}
+
+    start = time.perf_counter()
+    response = requests.post(f"{BASE_URL}/import", params=params, timeout=600, **kwargs)
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    result = response.json()
+    assert result["imported"] == rows, result
+
+    rate = rows / elapsed
+    print(f"{name:<24} {rows:>8} rows  {elapsed:>7.2f}s  {rate:>10.0f} rows/sec")
+    return rate
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--min-rows-per-sec", type=float, default=2000)
+    args = parser.parse_args()
+
+    rates = [
+        run("json", args.rows),
+        run("ndjson", args.rows, ndjson=True),
+        run("ndjson+defer_index", args.rows, ndjson=True, params={"defer_index": "true"}),
+    ]
+
+    if min(rates) < args.min_rows_per_sec:
+        print(f"FAIL: 目標 {args.min_rows_per_sec:.0f} rows/sec を下回りました")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
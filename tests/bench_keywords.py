@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+auto_detect_category / auto_extract_tags のマイクロベンチマーク
+
+実行方法:
+    python tests/bench_keywords.py [--chars 65536] [--repeat 50]
+
+前提条件:
+    - memory-service の依存パッケージがインストールされていること（サーバーの起動は不要）
+    - main.py の import 時に DB を初期化するため、一時ディレクトリの DB を使う
+
+従来実装（キーワードごとの `in` 走査をカテゴリ推定・タグ抽出で別々に行う）と
+KeywordMatcher（全キーワードを1つの正規表現にまとめた1回の走査）を使う現在の実装を、
+同じ入力で結果が一致することを確かめたうえで比較する。
+結果が一致しない場合は終了コード 1 を返す。
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "memory-service"))
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import main  # noqa: E402
+
+SAMPLE_WORDS = {
+    "en": "the quick service now deploys a fastapi backend with redis cache and jwt auth "
+          "to kubernetes while we add unit tests for the login page and fix an error".split(),
+    "ja": "認証 の 実装 を 修正 した 。 データベース の マイグレーション と キャッシュ の 設定 を "
+          "変更 し 、 ログイン 画面 の エラー 表示 を 改善".split(),
+    "no-keywords": "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split(),
+    # 別のキーワードの途中から始まる・別のキーワードを含むキーワード（一致漏れの確認用）
+    "overlap": "apipeline postgresql authentication ログイン rapid designer restapi sqlite3 k8sdeploy".split(),
+}
+
+
+def legacy_detect_category(content: str) -> str | None:
+    """従来のコンテンツ側カテゴリ推定（カテゴリごとに any(x in content) を評価）"""
+    content_lower = content.lower()
+    for category, keywords in main.CATEGORY_KEYWORD_RULES:
+        if any(x in content_lower for x in keywords):
+            return category
+    return None
+
+
+def legacy_extract_tags(content: str) -> list[str]:
+    """従来のキーワードによるタグ抽出（パターンごとに in を評価）"""
+    content_lower = content.lower()
+    return sorted({tag for pattern, tag in main.TAG_KEYWORD_PATTERNS if pattern in content_lower})[:10]
+
+
+def make_text(kind: str, chars: int) -> str:
+    words = SAMPLE_WORDS[kind]
+    rng = random.Random(42)
+    parts: list[str] = []
+    length = 0
+    while length < chars:
+        word = rng.choice(words)
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)[:chars]
+
+
+def timed(func, content: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for i in range(repeat):
+        # 同じ文字列オブジェクトを使い回すと KeywordMatcher の直前結果が効くため、毎回別の本文にする
+        func(content + str(i))
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main_() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=65536)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    ok = True
+    for kind in SAMPLE_WORDS:
+        content = make_text(kind, args.chars)
+        if (legacy_detect_category(content), legacy_extract_tags(content)) != (
+            main.auto_detect_category(content), main.auto_extract_tags(content)
+        ):
+            print(f"MISMATCH: {kind}")
+            ok = False
+
+        # /store と同じく、カテゴリ推定とタグ抽出を同じ本文に続けて行う
+        legacy = timed(lambda c: (legacy_detect_category(c), legacy_extract_tags(c)), content, args.repeat)
+        current = timed(lambda c: (main.auto_detect_category(c), main.auto_extract_tags(c)), content, args.repeat)
+        print(f"{kind:<12} {args.chars:>7} chars  legacy {legacy:>7.2f} ms  current {current:>7.2f} ms  "
+              f"x{legacy / current:.2f}")
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
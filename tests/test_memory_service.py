@@ -16,6 +16,7 @@ import re
 import requests
 import uuid
 from datetime import datetime
+from urllib.parse import quote
 
 BASE_URL = "http://localhost:8200"
 
@@ -491,6 +492,212 @@ class TestContext:
         response = requests.get(f"{BASE_URL}/context/test-project")
         assert response.status_code == 422
 
+    def test_get_context_truncated_false_by_default(self):
+        """deadline 未指定時は truncated=False"""
+        response = requests.get(f"{BASE_URL}/context/test-project", params={"query": "テスト"})
+        assert response.status_code == 200
+        assert response.json()["truncated"] is False
+
+    def test_get_context_expired_deadline_returns_truncated(self):
+        """期限切れの deadline では空の tier と truncated=True を返す"""
+        response = requests.get(
+            f"{BASE_URL}/context/test-project",
+            params={"query": f"テスト {uuid.uuid4().hex[:8]}", "deadline_ms": 0}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["truncated"] is True
+        assert data["project_decisions"] == []
+        assert data["total_tokens"] == 0
+
+    def test_get_context_deadline_on_cold_project(self):
+        """期限付きでは未ロードのプロジェクトも SQL 候補で返し、インデックス構築後も同じ結果になる"""
+        scope_id = f"deadline-{uuid.uuid4().hex[:8]}"
+        ids = [requests.post(f"{BASE_URL}/store", json={
+            "content": f"冷えたプロジェクトの決定 {i}", "type": "decision", "scope": "project", "scope_id": scope_id
+        }).json()["id"] for i in range(3)]
+        params = {"query": "冷えたプロジェクトの決定", "deadline_ms": 5000}
+
+        cold = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert cold["truncated"] is False
+        assert set(ids) <= {m["id"] for m in cold["project_decisions"]}
+
+        # 書き込みでキャッシュを破棄してから、バックグラウンドで構築されたインデックス経由で取り直す
+        ids.append(requests.post(f"{BASE_URL}/store", json={
+            "content": "冷えたプロジェクトの決定 追加", "type": "decision", "scope": "project", "scope_id": scope_id
+        }).json()["id"])
+        warm = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert set(ids) <= {m["id"] for m in warm["project_decisions"]}
+
+    def test_get_context_deadline_header(self):
+        """X-Deadline-Ms ヘッダーでも期限を指定できる"""
+        scope_id = f"deadline-{uuid.uuid4().hex[:8]}"
+        store = requests.post(f"{BASE_URL}/store", json={
+            "content": "期限テスト用の決定", "type": "decision", "scope": "project", "scope_id": scope_id
+        })
+        memory_id = store.json()["id"]
+
+        response = requests.get(
+            f"{BASE_URL}/context/{scope_id}",
+            params={"query": "期限テスト用の決定"},
+            headers={"X-Deadline-Ms": "5000"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["truncated"] is False
+        assert memory_id in [m["id"] for m in data["project_decisions"]]
+
+    def test_get_context_markdown_format(self):
+        """format=markdown で tier ごとの見出し付きテキストを返す"""
+        scope_id = f"render-{uuid.uuid4().hex[:8]}"
+        requests.post(f"{BASE_URL}/store", json={
+            "content": "レンダリング確認用の決定\n詳細な理由", "type": "decision",
+            "scope": "project", "scope_id": scope_id
+        })
+
+        response = requests.get(
+            f"{BASE_URL}/context/{scope_id}",
+            params={"query": "レンダリング確認用の決定", "format": "markdown"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/markdown")
+        assert "## プロジェクトの決定事項" in response.text
+        assert "- " in response.text
+        assert "  詳細な理由" in response.text
+
+    def test_get_context_text_format(self):
+        """format=text は Markdown 見出しを使わない"""
+        scope_id = f"render-{uuid.uuid4().hex[:8]}"
+        requests.post(f"{BASE_URL}/store", json={
+            "content": "テキスト形式確認", "type": "decision", "scope": "project", "scope_id": scope_id
+        })
+
+        response = requests.get(
+            f"{BASE_URL}/context/{scope_id}",
+            params={"query": "テキスト形式確認", "format": "text"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "[プロジェクトの決定事項]" in response.text
+        assert "##" not in response.text
+
+    def test_get_context_rendered_respects_max_tokens(self):
+        """レンダリング結果は max_tokens に収まるよう切り詰められる"""
+        scope_id = f"render-{uuid.uuid4().hex[:8]}"
+        requests.post(f"{BASE_URL}/store", json={
+            "content": "長文 " + "とても長い本文です。" * 200, "type": "decision",
+            "scope": "project", "scope_id": scope_id
+        })
+
+        response = requests.get(
+            f"{BASE_URL}/context/{scope_id}",
+            params={"query": "長文", "format": "markdown", "max_tokens": 100000}
+        )
+        full = response.text
+        response = requests.get(
+            f"{BASE_URL}/context/{scope_id}",
+            params={"query": "長文", "format": "markdown", "max_tokens": 50}
+        )
+        assert response.status_code == 200
+        assert len(response.text) < len(full)
+
+    def test_get_context_cache_invalidated_on_store(self):
+        """キャッシュ済みのコンテキストも store 後は新しい記憶を含む"""
+        scope_id = f"render-{uuid.uuid4().hex[:8]}"
+        params = {"query": "キャッシュ確認"}
+        first = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert first["project_decisions"] == []
+
+        store = requests.post(f"{BASE_URL}/store", json={
+            "content": "キャッシュ確認", "type": "decision", "scope": "project", "scope_id": scope_id
+        })
+        second = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert store.json()["id"] in [m["id"] for m in second["project_decisions"]]
+
+    def test_get_context_session_delta(self):
+        """同じ session_id の2回目は送信済みの記憶を unchanged_ids に回す"""
+        scope_id = f"session-{uuid.uuid4().hex[:8]}"
+        first_id = requests.post(f"{BASE_URL}/store", json={
+            "content": "セッション差分 一件目", "type": "decision", "scope": "project", "scope_id": scope_id
+        }).json()["id"]
+        params = {"query": "セッション差分", "session_id": f"s-{uuid.uuid4().hex[:8]}"}
+
+        first = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert first_id in [m["id"] for m in first["project_decisions"]]
+        assert first["unchanged_ids"] == []
+
+        second_id = requests.post(f"{BASE_URL}/store", json={
+            "content": "セッション差分 二件目", "type": "decision", "scope": "project", "scope_id": scope_id
+        }).json()["id"]
+        second = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert [m["id"] for m in second["project_decisions"]] == [second_id]
+        assert first_id in second["unchanged_ids"]
+        assert second["total_tokens"] == second["project_decisions"][0]["tokens"]
+
+    def test_get_context_session_resends_memories_cut_by_max_tokens(self):
+        """max_tokens に収まらず出力しきれなかった記憶は送信済みにせず、次の呼び出しで再送される"""
+        scope_id = f"session-{uuid.uuid4().hex[:8]}"
+        ids = {}
+        for memory_type in ("decision", "work"):
+            ids[memory_type] = requests.post(f"{BASE_URL}/store", json={
+                "content": f"セッション予算 {memory_type} の記録。" + "背景と理由を詳しく説明する文章。" * 6,
+                "type": memory_type, "scope": "project", "scope_id": scope_id
+            }).json()["id"]
+        params = {"query": "セッション予算", "max_tokens": 100, "session_id": f"s-{uuid.uuid4().hex[:8]}"}
+
+        first = requests.get(f"{BASE_URL}/context/{scope_id}", params={**params, "format": "markdown"})
+        assert "decision の記録" in first.text
+        assert first.text.rstrip().endswith("...")  # 最近の作業は予算切れで切り詰められる
+
+        second = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert ids["decision"] in second["unchanged_ids"]
+        assert ids["work"] not in second["unchanged_ids"]
+        assert [m["id"] for m in second["project_recent"]] == [ids["work"]]
+
+        third = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert set(ids.values()) <= set(third["unchanged_ids"])
+
+    def test_get_context_session_resends_changed_memory(self):
+        """送信済みでも内容が更新された記憶は再送される"""
+        scope_id = f"session-{uuid.uuid4().hex[:8]}"
+        memory_id = requests.post(f"{BASE_URL}/store", json={
+            "content": "セッション更新 元の内容", "type": "decision", "scope": "project", "scope_id": scope_id
+        }).json()["id"]
+        params = {"query": "セッション更新", "session_id": f"s-{uuid.uuid4().hex[:8]}"}
+        requests.get(f"{BASE_URL}/context/{scope_id}", params=params)
+
+        requests.patch(f"{BASE_URL}/memory/{memory_id}", json={"content": "セッション更新 新しい内容"})
+        data = requests.get(f"{BASE_URL}/context/{scope_id}", params=params).json()
+        assert memory_id in [m["id"] for m in data["project_decisions"]]
+        assert memory_id not in data["unchanged_ids"]
+
+    def test_get_context_without_session_returns_full(self):
+        """session_id なしでは毎回全件を返す"""
+        scope_id = f"session-{uuid.uuid4().hex[:8]}"
+        memory_id = requests.post(f"{BASE_URL}/store", json={
+            "content": "セッションなし", "type": "decision", "scope": "project", "scope_id": scope_id
+        }).json()["id"]
+        for _ in range(2):
+            data = requests.get(f"{BASE_URL}/context/{scope_id}", params={"query": "セッションなし"}).json()
+            assert memory_id in [m["id"] for m in data["project_decisions"]]
+            assert data["unchanged_ids"] == []
+
+    def test_get_context_invalid_format_rejected(self):
+        """不正な format は 422"""
+        response = requests.get(
+            f"{BASE_URL}/context/test-project",
+            params={"query": "テスト", "format": "html"}
+        )
+        assert response.status_code == 422
+
+    def test_get_context_negative_deadline_rejected(self):
+        """負の deadline_ms は 422"""
+        response = requests.get(
+            f"{BASE_URL}/context/test-project",
+            params={"query": "テスト", "deadline_ms": -1}
+        )
+        assert response.status_code == 422
+
 
 class TestProjects:
     """プロジェクト管理のテスト"""
@@ -508,6 +715,26 @@ class TestProjects:
             assert "decision_count" in project
             assert "last_activity" in project
 
+    def test_list_projects_pagination(self):
+        """limit / offset でページングでき、総件数は X-Total-Count で返る"""
+        for i in range(3):
+            requests.post(f"{BASE_URL}/store", json={
+                "content": f"ページングテスト {uuid.uuid4()}",
+                "type": "work",
+                "scope": "project",
+                "scope_id": f"page-test-{uuid.uuid4().hex[:8]}"
+            })
+
+        full = requests.get(f"{BASE_URL}/projects")
+        total = int(full.headers["X-Total-Count"])
+        assert total == len(full.json()) >= 3
+
+        first = requests.get(f"{BASE_URL}/projects", params={"limit": 2})
+        second = requests.get(f"{BASE_URL}/projects", params={"limit": 2, "offset": 2})
+        assert int(first.headers["X-Total-Count"]) == total
+        paged = [p["project_id"] for p in first.json() + second.json()]
+        assert paged == [p["project_id"] for p in full.json()][:4]
+
     def test_suggest_exact_match(self):
         """完全一致するプロジェクト名の提案"""
         # まずプロジェクトが存在することを確認
@@ -545,6 +772,47 @@ class TestProjects:
         assert data["exact_match"] is False
         assert "suggestions" in data
 
+    def test_suggest_transposition_and_new_project(self):
+        """新しく現れたプロジェクトも即座に候補になり、文字の入れ替えは1文字違いとして扱われる"""
+        suffix = uuid.uuid4().hex[:6]
+        project_id = f"payment-gateway-{suffix}"
+
+        # 作成前に一度呼んでレジストリを構築しておく
+        requests.get(f"{BASE_URL}/projects/suggest", params={"name": project_id})
+        requests.post(f"{BASE_URL}/store", json={
+            "content": "suggest registry test",
+            "type": "work",
+            "scope": "project",
+            "scope_id": project_id
+        })
+
+        typo = f"paymnet-gateway-{suffix}"  # "en" -> "ne"
+        response = requests.get(f"{BASE_URL}/projects/suggest", params={"name": typo})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["exact_match"] is False
+        top = data["suggestions"][0]
+        assert top["project_id"] == project_id
+        assert top["similarity"] == round(1 - 1 / len(project_id), 2)
+
+    def test_suggest_forgets_deleted_project(self):
+        """記憶がすべて削除されたプロジェクトは候補から外れる"""
+        project_id = f"vanishing-project-{uuid.uuid4().hex[:6]}"
+        resp = requests.post(f"{BASE_URL}/store", json={
+            "content": "suggest delete test",
+            "type": "work",
+            "scope": "project",
+            "scope_id": project_id
+        })
+        assert requests.get(
+            f"{BASE_URL}/projects/suggest", params={"name": project_id}
+        ).json()["exact_match"] is True
+
+        requests.delete(f"{BASE_URL}/memory/{resp.json()['id']}")
+        data = requests.get(f"{BASE_URL}/projects/suggest", params={"name": project_id}).json()
+        assert data["exact_match"] is False
+        assert project_id not in [s["project_id"] for s in data["suggestions"]]
+
 
 class TestSearch:
     """検索のテスト"""
@@ -602,6 +870,315 @@ class TestSearch:
         assert len(data["memories"]) <= 2
 
 
+class TestSearchCursor:
+    """/search のキーセットページネーション（next_cursor）のテスト"""
+
+    def _store_many(self, word: str, scope_id: str, count: int) -> list[str]:
+        ids = []
+        for i in range(count):
+            response = requests.post(f"{BASE_URL}/store", json={
+                "content": f"{word} カーソル {i}", "type": "work", "scope": "project",
+                "scope_id": scope_id, "importance": 0.5 if i % 2 else 0.7
+            })
+            ids.append(response.json()["id"])
+        return ids
+
+    def _collect(self, params: dict) -> list[str]:
+        collected = []
+        cursor = None
+        for _ in range(10):
+            page_params = dict(params, limit=2)
+            if cursor:
+                page_params["cursor"] = cursor
+            data = requests.get(f"{BASE_URL}/search", params=page_params).json()
+            collected.extend(m["id"] for m in data["memories"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        return collected
+
+    def test_cursor_pages_cover_all_results_without_duplicates(self):
+        """next_cursor をたどると全件を重複なく取得できる（SQL 経路）"""
+        word = f"cur{uuid.uuid4().hex[:8]}"
+        ids = self._store_many(word, f"cursor-{uuid.uuid4().hex[:8]}", 5)
+
+        collected = self._collect({"query": word})
+        assert sorted(collected) == sorted(ids)
+        assert len(collected) == len(set(collected))
+
+    def test_cursor_order_matches_offset_order(self):
+        """カーソルでの並び順は offset 指定の並び順と一致する"""
+        word = f"cur{uuid.uuid4().hex[:8]}"
+        self._store_many(word, f"cursor-{uuid.uuid4().hex[:8]}", 5)
+
+        by_offset = requests.get(f"{BASE_URL}/search", params={"query": word, "limit": 5}).json()
+        assert self._collect({"query": word}) == [m["id"] for m in by_offset["memories"]]
+
+    def test_indexed_and_sql_paths_return_same_order(self):
+        """scope_id 指定（転置インデックス経路）でも同じ並び・カーソルで取得できる"""
+        word = f"cur{uuid.uuid4().hex[:8]}"
+        scope_id = f"cursor-{uuid.uuid4().hex[:8]}"
+        self._store_many(word, scope_id, 5)
+        requests.get(f"{BASE_URL}/context/{scope_id}")  # インデックスをロード（/search は未ロードなら SQL 経路）
+
+        assert self._collect({"query": word, "scope_id": scope_id}) == self._collect({"query": word})
+
+    def test_indexed_and_sql_paths_tokenize_alike(self):
+        """全角空白区切り・ASCII 以外の大文字も、SQL 経路と転置インデックス経路で同じように一致する"""
+        word = f"cur{uuid.uuid4().hex[:8]}"
+        scope_id = f"cursor-{uuid.uuid4().hex[:8]}"
+        spaced = requests.post(f"{BASE_URL}/store", json={
+            "content": f"認証\u3000{word}\u3000メモ", "type": "work", "scope": "project", "scope_id": scope_id
+        }).json()["id"]
+        upper = requests.post(f"{BASE_URL}/store", json={
+            "content": f"ÄRGER{word} を修正", "type": "work", "scope": "project", "scope_id": scope_id
+        }).json()["id"]
+        requests.get(f"{BASE_URL}/context/{scope_id}")  # インデックスをロード（/search は未ロードなら SQL 経路）
+
+        for query, expected in ((word, spaced), (f"ärger{word}", upper)):
+            indexed = requests.get(f"{BASE_URL}/search", params={"query": query, "scope_id": scope_id}).json()
+            sql = requests.get(f"{BASE_URL}/search", params={"query": f"{query} zzz", "scope": "project"}).json()
+            assert [m["id"] for m in indexed["memories"]] == [expected]
+            assert sql["memories"][0]["id"] == expected
+
+    def test_last_page_has_no_cursor(self):
+        """最後のページでは next_cursor が null"""
+        word = f"cur{uuid.uuid4().hex[:8]}"
+        self._store_many(word, f"cursor-{uuid.uuid4().hex[:8]}", 2)
+
+        data = requests.get(f"{BASE_URL}/search", params={"query": word, "limit": 2}).json()
+        assert len(data["memories"]) == 2
+        assert data["next_cursor"] is None
+
+    def test_invalid_cursor_rejected(self):
+        """不正なカーソルは 400"""
+        response = requests.get(f"{BASE_URL}/search", params={"query": "x", "cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+
+class TestSemanticSearch:
+    """セマンティック検索（mode=semantic/hybrid）のテスト"""
+
+    def _store(self, scope_id: str, content: str, type_: str = "knowledge") -> str:
+        response = requests.post(f"{BASE_URL}/store", json={
+            "content": content,
+            "type": type_,
+            "scope": "project",
+            "scope_id": scope_id
+        })
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def test_semantic_search_matches_paraphrase(self):
+        """キーワードが一致しない言い換え（認証 ↔ login）でもヒットする"""
+        scope_id = f"semantic-{uuid.uuid4().hex[:8]}"
+        auth_id = self._store(scope_id, "認証はJWTトークンで行う")
+        self._store(scope_id, "README の誤字を修正した")
+
+        response = requests.get(f"{BASE_URL}/search", params={
+            "query": "login flow", "scope_id": scope_id, "mode": "semantic"
+        })
+        assert response.status_code == 200
+        memories = response.json()["memories"]
+        assert len(memories) > 0
+        assert memories[0]["id"] == auth_id
+
+    def test_hybrid_search_ranks_exact_match_first(self):
+        """hybrid モードではキーワード一致が上位に来る"""
+        scope_id = f"semantic-{uuid.uuid4().hex[:8]}"
+        unique_word = f"word{uuid.uuid4().hex[:8]}"
+        target_id = self._store(scope_id, f"{unique_word} を採用した")
+        self._store(scope_id, "別の作業メモ")
+
+        response = requests.get(f"{BASE_URL}/search", params={
+            "query": unique_word, "scope_id": scope_id, "mode": "hybrid"
+        })
+        assert response.status_code == 200
+        assert response.json()["memories"][0]["id"] == target_id
+
+    def test_context_semantic_mode(self):
+        """/context でも mode=semantic が使える"""
+        scope_id = f"semantic-{uuid.uuid4().hex[:8]}"
+        decision_id = self._store(scope_id, "認証方式はOAuthに決定", type_="decision")
+
+        response = requests.get(f"{BASE_URL}/context/{scope_id}", params={
+            "query": "ログイン", "mode": "semantic"
+        })
+        assert response.status_code == 200
+        ids = [m["id"] for m in response.json()["project_decisions"]]
+        assert decision_id in ids
+
+    def test_invalid_mode_rejected(self):
+        """不正な mode は 422"""
+        response = requests.get(f"{BASE_URL}/search", params={"query": "x", "mode": "vector"})
+        assert response.status_code == 422
+
+    def test_reindex_job(self):
+        """再インデックスジョブを開始し、完了状態を取得できる"""
+        import time
+
+        scope_id = f"semantic-{uuid.uuid4().hex[:8]}"
+        self._store(scope_id, "再インデックス対象")
+
+        response = requests.post(f"{BASE_URL}/admin/reindex", params={"project_id": scope_id, "force": True})
+        assert response.status_code in [202, 409]
+
+        for _ in range(50):
+            status = requests.get(f"{BASE_URL}/admin/reindex").json()
+            if not status["running"]:
+                break
+            time.sleep(0.1)
+        assert status["running"] is False
+        assert status["error"] is None
+
+
+class TestKeywordDictionary:
+    """キーワード辞書と再タグ付けジョブのテスト"""
+
+    def test_keyword_dictionary_status(self):
+        """使用中の辞書の情報を取得できる"""
+        response = requests.get(f"{BASE_URL}/admin/keywords")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["version"]
+        assert "security" in data["categories"]
+        assert data["tag_patterns"] > 0
+
+        if data["path"] is None:
+            # 辞書ファイル未設定では再読み込みできない
+            response = requests.post(f"{BASE_URL}/admin/keywords/reload")
+            assert response.status_code == 400
+
+    def test_retag_job_adds_auto_tags(self):
+        """再タグ付けジョブで自動抽出タグが付け直され、既存タグは残る"""
+        import time
+
+        scope_id = f"retag-{uuid.uuid4().hex[:8]}"
+        response = requests.post(f"{BASE_URL}/store", json={
+            "content": "ログインに JWT を使う", "type": "decision", "scope": "project", "scope_id": scope_id
+        })
+        memory_id = response.json()["id"]
+        requests.patch(f"{BASE_URL}/memory/{memory_id}", json={"tags": ["custom"]})
+        assert requests.get(f"{BASE_URL}/memory/{memory_id}").json()["tags"] == ["custom"]
+
+        for _ in range(50):
+            response = requests.post(f"{BASE_URL}/admin/retag", params={"project_id": scope_id})
+            if response.status_code == 202:
+                break
+            time.sleep(0.1)
+        assert response.status_code == 202
+
+        for _ in range(50):
+            status = requests.get(f"{BASE_URL}/admin/retag").json()
+            if not status["running"]:
+                break
+            time.sleep(0.1)
+        assert status["error"] is None
+        assert status["project_id"] == scope_id
+        assert status["processed"] == status["total"] == 1
+        assert status["updated"] == 1
+
+        tags = requests.get(f"{BASE_URL}/memory/{memory_id}").json()["tags"]
+        assert tags[0] == "custom"
+        assert {"auth", "jwt"} <= set(tags)
+
+
+class TestInvertedIndex:
+    """転置インデックス（差分更新）経由の検索テスト"""
+
+    def _search(self, scope_id: str, query: str, **params) -> list[str]:
+        response = requests.get(f"{BASE_URL}/search", params={"query": query, "scope_id": scope_id, **params})
+        assert response.status_code == 200
+        return [m["id"] for m in response.json()["memories"]]
+
+    def _store(self, scope_id: str, content: str) -> str:
+        response = requests.post(f"{BASE_URL}/store", json={
+            "content": content, "type": "work", "scope": "project", "scope_id": scope_id
+        })
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    def _load_index(self, scope_id: str):
+        # /search は未ロードのインデックスを待たないため、期限なしの /context で同期的にロードする
+        assert requests.get(f"{BASE_URL}/context/{scope_id}", params={"query": "x"}).status_code == 200
+
+    def test_store_after_index_load_is_searchable(self):
+        """インデックスロード後に保存した記憶も検索できる"""
+        scope_id = f"index-{uuid.uuid4().hex[:8]}"
+        word = f"w{uuid.uuid4().hex[:8]}"
+        self._store(scope_id, "最初の記憶")
+        self._load_index(scope_id)
+
+        memory_id = self._store(scope_id, f"{word} を追加")
+        assert self._search(scope_id, word) == [memory_id]
+
+    def test_update_reflected_in_index(self):
+        """コンテンツ更新後は新しい語でヒットする"""
+        scope_id = f"index-{uuid.uuid4().hex[:8]}"
+        old_word = f"old{uuid.uuid4().hex[:8]}"
+        new_word = f"new{uuid.uuid4().hex[:8]}"
+        memory_id = self._store(scope_id, f"{old_word} の記録")
+        self._store(scope_id, "別の記録")
+        self._load_index(scope_id)
+        assert self._search(scope_id, old_word) == [memory_id]
+
+        response = requests.patch(f"{BASE_URL}/memory/{memory_id}", json={"content": f"{new_word} の記録"})
+        assert response.status_code == 200
+
+        assert self._search(scope_id, new_word) == [memory_id]
+
+    def test_deprecate_and_delete_reflected_in_index(self):
+        """廃止・削除した記憶はヒットしない"""
+        scope_id = f"index-{uuid.uuid4().hex[:8]}"
+        word = f"w{uuid.uuid4().hex[:8]}"
+        deprecated_id = self._store(scope_id, f"{word} 廃止予定")
+        deleted_id = self._store(scope_id, f"{word} 削除予定")
+        kept_id = self._store(scope_id, f"{word} 残す")
+        self._load_index(scope_id)
+        assert set(self._search(scope_id, word)) == {deprecated_id, deleted_id, kept_id}
+
+        requests.patch(f"{BASE_URL}/memory/{deprecated_id}/deprecate", json={"deprecated": True})
+        requests.delete(f"{BASE_URL}/memory/{deleted_id}")
+
+        assert self._search(scope_id, word) == [kept_id]
+        assert set(self._search(scope_id, word, include_deprecated=True)) == {deprecated_id, kept_id}
+
+    def test_indexed_search_respects_tag_filter_and_offset(self):
+        """インデックス経由でもタグフィルタと offset が効く"""
+        scope_id = f"index-{uuid.uuid4().hex[:8]}"
+        word = f"w{uuid.uuid4().hex[:8]}"
+        ids = []
+        for i in range(3):
+            response = requests.post(f"{BASE_URL}/store", json={
+                "content": f"{word} {i}", "type": "work", "scope": "project", "scope_id": scope_id,
+                "tags": ["target"] if i < 2 else [], "importance": 0.9 - i * 0.1
+            })
+            ids.append(response.json()["id"])
+
+        self._load_index(scope_id)
+        assert self._search(scope_id, word, tags="target") == ids[:2]
+        assert self._search(scope_id, word, offset=1, limit=1) == [ids[1]]
+
+    def test_deleted_doc_number_is_reused_cleanly(self):
+        """削除した記憶の doc番号を再利用しても、古い語・タグでヒットしない"""
+        scope_id = f"index-{uuid.uuid4().hex[:8]}"
+        old_word = f"old{uuid.uuid4().hex[:8]}"
+        new_word = f"new{uuid.uuid4().hex[:8]}"
+        deleted_id = requests.post(f"{BASE_URL}/store", json={
+            "content": f"{old_word} 削除予定", "type": "work", "scope": "project", "scope_id": scope_id,
+            "tags": [old_word]
+        }).json()["id"]
+        kept_id = self._store(scope_id, f"{old_word} 残す")
+        self._load_index(scope_id)
+
+        requests.delete(f"{BASE_URL}/memory/{deleted_id}")
+        new_id = self._store(scope_id, f"{new_word} を追加")
+
+        assert self._search(scope_id, old_word) == [kept_id]
+        assert self._search(scope_id, old_word, tags=old_word) == []
+        assert self._search(scope_id, new_word) == [new_id]
+
+
 class TestStats:
     """統計情報のテスト"""
 
@@ -763,6 +1340,84 @@ class TestStats:
         assert stats.get("project/decision", {}).get("count", 0) == 3
         assert stats.get("project/work", {}).get("count", 0) == 2
 
+    def test_stats_follow_update_and_delete(self):
+        """重要度の更新・削除が統計と /projects に即時反映される"""
+        project_id = f"stats-update-test-{uuid.uuid4().hex[:8]}"
+
+        ids = []
+        for importance in (0.2, 0.4):
+            resp = requests.post(f"{BASE_URL}/store", json={
+                "content": f"決定 {importance} {uuid.uuid4()}",
+                "type": "decision",
+                "scope": "project",
+                "scope_id": project_id,
+                "importance": importance
+            })
+            ids.append(resp.json()["id"])
+
+        stats = requests.get(f"{BASE_URL}/stats/{project_id}").json()["stats"]
+        assert stats["project/decision"] == {"count": 2, "avg_importance": 0.3}
+
+        requests.patch(f"{BASE_URL}/memory/{ids[0]}", json={"importance": 0.8})
+        stats = requests.get(f"{BASE_URL}/stats/{project_id}").json()["stats"]
+        assert stats["project/decision"] == {"count": 2, "avg_importance": 0.6}
+
+        requests.delete(f"{BASE_URL}/memory/{ids[1]}")
+        stats = requests.get(f"{BASE_URL}/stats/{project_id}").json()["stats"]
+        assert stats["project/decision"] == {"count": 1, "avg_importance": 0.8}
+
+        projects = {p["project_id"]: p for p in requests.get(f"{BASE_URL}/projects").json()}
+        assert projects[project_id]["memory_count"] == 1
+        assert projects[project_id]["decision_count"] == 1
+
+        # 全件削除するとプロジェクト一覧から消える
+        requests.delete(f"{BASE_URL}/memory/{ids[0]}")
+        projects = [p["project_id"] for p in requests.get(f"{BASE_URL}/projects").json()]
+        assert project_id not in projects
+
+    def test_stats_not_double_counted_on_reimport(self):
+        """同じ ID を再インポート（置き換え）しても件数が二重にならない"""
+        project_id = f"stats-reimport-test-{uuid.uuid4().hex[:8]}"
+        resp = requests.post(f"{BASE_URL}/store", json={
+            "content": f"置き換えられる記憶 {uuid.uuid4()}",
+            "type": "knowledge",
+            "scope": "project",
+            "scope_id": project_id,
+            "importance": 0.4
+        })
+        memory = requests.get(f"{BASE_URL}/memory/{resp.json()['id']}").json()
+        memory["importance"] = 0.6
+
+        response = requests.post(f"{BASE_URL}/import", json={"memories": [memory]})
+        assert response.json()["imported"] == 1
+
+        stats = requests.get(f"{BASE_URL}/stats/{project_id}").json()["stats"]
+        assert stats["project/knowledge"] == {"count": 1, "avg_importance": 0.6}
+
+    def test_rebuild_stats_keeps_results(self):
+        """再集計しても統計の結果は変わらない"""
+        project_id = f"stats-rebuild-test-{uuid.uuid4().hex[:8]}"
+        for i in range(3):
+            requests.post(f"{BASE_URL}/store", json={
+                "content": f"作業 {i} {uuid.uuid4()}",
+                "type": "work",
+                "scope": "project",
+                "scope_id": project_id,
+                "importance": 0.5
+            })
+
+        before = requests.get(
+            f"{BASE_URL}/stats/{project_id}", params={"include_deprecated": "true"}
+        ).json()
+        response = requests.post(f"{BASE_URL}/admin/stats/rebuild")
+        assert response.status_code == 200
+        assert response.json()["rows"] > 0
+        after = requests.get(
+            f"{BASE_URL}/stats/{project_id}", params={"include_deprecated": "true"}
+        ).json()
+        assert after == before
+        assert after["stats"]["project/work"]["count"] == 3
+
 
 class TestExport:
     """エクスポートのテスト"""
@@ -776,6 +1431,260 @@ class TestExport:
         assert "memories" in data
         assert "count" in data
 
+    def _store_many(self, project_id: str, count: int) -> list[str]:
+        ids = []
+        for i in range(count):
+            response = requests.post(f"{BASE_URL}/store", json={
+                "content": f"エクスポート {i}", "type": "work", "scope": "project", "scope_id": project_id
+            })
+            ids.append(response.json()["id"])
+        return ids
+
+    def _project_lines(self, text: str, project_id: str) -> list[dict]:
+        import json
+        rows = [json.loads(line) for line in text.splitlines() if line]
+        return [r for r in rows if r["scope_id"] == project_id]
+
+    def test_export_ndjson_stream(self):
+        """format=ndjson で1行1記憶のストリームを返す"""
+        project_id = f"export-{uuid.uuid4().hex[:8]}"
+        ids = self._store_many(project_id, 3)
+
+        response = requests.get(f"{BASE_URL}/export/{project_id}", params={"format": "ndjson"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = self._project_lines(response.text, project_id)
+        assert sorted(r["id"] for r in rows) == sorted(ids)
+        assert all("embedding" not in r for r in rows)
+
+    def test_export_ndjson_gzip(self):
+        """gzip=true で圧縮されたストリームを返す（Content-Encoding: gzip）"""
+        project_id = f"export-{uuid.uuid4().hex[:8]}"
+        ids = self._store_many(project_id, 2)
+
+        response = requests.get(f"{BASE_URL}/export/{project_id}", params={"format": "ndjson", "gzip": True})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        rows = self._project_lines(response.text, project_id)
+        assert sorted(r["id"] for r in rows) == sorted(ids)
+
+    def test_export_ndjson_resume_after(self):
+        """after を指定するとその id より後から再開できる"""
+        project_id = f"export-{uuid.uuid4().hex[:8]}"
+        ids = sorted(self._store_many(project_id, 3))
+
+        response = requests.get(
+            f"{BASE_URL}/export/{project_id}", params={"format": "ndjson", "after": ids[0]}
+        )
+        rows = self._project_lines(response.text, project_id)
+        assert [r["id"] for r in rows] == ids[1:]
+
+    def test_export_invalid_format_rejected(self):
+        """不正な format は 422"""
+        response = requests.get(f"{BASE_URL}/export/test-project", params={"format": "csv"})
+        assert response.status_code == 422
+
+    def test_export_since_returns_only_changes(self):
+        """since（前回の watermark）指定で作成・更新・廃止・削除された記憶だけを返す"""
+        project_id = f"export-delta-{uuid.uuid4().hex[:8]}"
+        ids = self._store_many(project_id, 4)
+
+        full = requests.get(f"{BASE_URL}/export/{project_id}").json()
+        watermark = full["watermark"]
+        assert isinstance(watermark, int)
+
+        requests.patch(f"{BASE_URL}/memory/{ids[0]}", json={"content": "更新後"})
+        requests.patch(f"{BASE_URL}/memory/{ids[1]}/deprecate", json={"deprecated": True})
+        requests.delete(f"{BASE_URL}/memory/{ids[2]}")
+        new_id = self._store_many(project_id, 1)[0]
+
+        delta = requests.get(f"{BASE_URL}/export/{project_id}", params={"since": watermark}).json()
+        changed = {m["id"] for m in delta["memories"] if m["scope_id"] == project_id}
+        assert changed == {ids[0], ids[1], new_id}
+        assert [d["id"] for d in delta["deleted"] if d["scope_id"] == project_id] == [ids[2]]
+        assert delta["watermark"] > watermark
+
+        # 新しい watermark 以降に変更がなければ空
+        again = requests.get(f"{BASE_URL}/export/{project_id}", params={"since": delta["watermark"]}).json()
+        assert [m for m in again["memories"] if m["scope_id"] == project_id] == []
+        assert [d for d in again["deleted"] if d["scope_id"] == project_id] == []
+
+    def test_export_since_ndjson_includes_tombstones(self):
+        """ndjson の差分は先頭に墓標を出力し、watermark をヘッダで返す"""
+        project_id = f"export-delta-{uuid.uuid4().hex[:8]}"
+        ids = self._store_many(project_id, 2)
+        watermark = int(requests.get(
+            f"{BASE_URL}/export/{project_id}", params={"format": "ndjson"}
+        ).headers["x-export-watermark"])
+
+        requests.delete(f"{BASE_URL}/memory/{ids[0]}")
+        response = requests.get(
+            f"{BASE_URL}/export/{project_id}", params={"format": "ndjson", "since": watermark}
+        )
+        assert response.status_code == 200
+        assert int(response.headers["x-export-watermark"]) > watermark
+        rows = self._project_lines(response.text, project_id)
+        assert all(r.get("deleted") for r in rows)
+        assert [r["id"] for r in rows] == [ids[0]]
+
+
+    def test_export_since_tombstones_memory_moved_by_import(self):
+        """/import の置き換えで別プロジェクトに移った記憶は、移動元の差分に墓標として出る"""
+        project_id = f"export-delta-{uuid.uuid4().hex[:8]}"
+        other_id = f"export-delta-{uuid.uuid4().hex[:8]}"
+        memory_id = self._store_many(project_id, 1)[0]
+        watermark = requests.get(f"{BASE_URL}/export/{project_id}").json()["watermark"]
+
+        memory = requests.get(f"{BASE_URL}/memory/{memory_id}").json()
+        memory["scope_id"] = other_id
+        assert requests.post(f"{BASE_URL}/import", json={"memories": [memory]}).json()["imported"] == 1
+
+        delta = requests.get(f"{BASE_URL}/export/{project_id}", params={"since": watermark}).json()
+        assert [m for m in delta["memories"] if m["scope_id"] == project_id] == []
+        assert [d["id"] for d in delta["deleted"] if d["scope_id"] == project_id] == [memory_id]
+
+        moved = requests.get(f"{BASE_URL}/export/{other_id}", params={"since": watermark}).json()
+        assert [m["id"] for m in moved["memories"] if m["scope_id"] == other_id] == [memory_id]
+        assert [d for d in moved["deleted"] if d["scope_id"] == other_id] == []
+
+
+class TestChanges:
+    """変更フィード（/changes）のテスト"""
+
+    def _latest_seq(self) -> int:
+        return requests.get(f"{BASE_URL}/changes", params={"limit": 1, "since": 0}).json()["latest_seq"]
+
+    def test_changes_records_each_operation_in_order(self):
+        """作成・更新・廃止・削除が seq 昇順で記録される"""
+        scope_id = f"changes-{uuid.uuid4().hex[:8]}"
+        since = self._latest_seq()
+
+        memory_id = requests.post(f"{BASE_URL}/store", json={"content": "変更フィード", "scope_id": scope_id}).json()["id"]
+        requests.patch(f"{BASE_URL}/memory/{memory_id}", json={"content": "変更フィード（更新）"})
+        requests.patch(f"{BASE_URL}/memory/{memory_id}/deprecate", json={"deprecated": True})
+        requests.delete(f"{BASE_URL}/memory/{memory_id}")
+
+        response = requests.get(f"{BASE_URL}/changes", params={"since": since, "scope_id": scope_id})
+        assert response.status_code == 200
+        data = response.json()
+        changes = [c for c in data["changes"] if c["scope_id"] == scope_id]
+        assert [c["op"] for c in changes] == ["insert", "update", "deprecate", "delete"]
+        seqs = [c["seq"] for c in changes]
+        assert seqs == sorted(seqs) and len(set(seqs)) == 4
+        assert all(c["id"] == memory_id for c in changes)
+        # 削除済みなので現在の内容は無い
+        assert all(c["memory"] is None for c in changes)
+        assert data["has_more"] is False
+        assert data["next_since"] >= seqs[-1]
+
+    def test_changes_reports_delete_when_import_moves_memory(self):
+        """/import の置き換えで別スコープに移った記憶は、移動元の scope_id に delete として流れる"""
+        scope_id = f"changes-{uuid.uuid4().hex[:8]}"
+        other_id = f"changes-{uuid.uuid4().hex[:8]}"
+        memory_id = requests.post(f"{BASE_URL}/store", json={"content": "移動する記憶", "scope_id": scope_id}).json()["id"]
+        since = self._latest_seq()
+
+        memory = requests.get(f"{BASE_URL}/memory/{memory_id}").json()
+        memory["scope_id"] = other_id
+        requests.post(f"{BASE_URL}/import", json={"memories": [memory]})
+
+        old = requests.get(f"{BASE_URL}/changes", params={"since": since, "scope_id": scope_id}).json()
+        assert [(c["id"], c["op"]) for c in old["changes"]] == [(memory_id, "delete")]
+        assert old["changes"][0]["memory"] is None
+        new = requests.get(f"{BASE_URL}/changes", params={"since": since, "scope_id": other_id}).json()
+        assert [(c["id"], c["op"]) for c in new["changes"]] == [(memory_id, "insert")]
+
+    def test_changes_pagination(self):
+        """limit で区切り、next_since で続きを取得できる"""
+        scope_id = f"changes-{uuid.uuid4().hex[:8]}"
+        since = self._latest_seq()
+        ids = [
+            requests.post(f"{BASE_URL}/store", json={"content": f"ページ{i}", "scope_id": scope_id}).json()["id"]
+            for i in range(3)
+        ]
+
+        first = requests.get(f"{BASE_URL}/changes", params={"since": since, "scope_id": scope_id, "limit": 2}).json()
+        assert first["has_more"] is True
+        assert [c["id"] for c in first["changes"]] == ids[:2]
+        assert first["changes"][0]["memory"]["content"] == "ページ0"
+
+        rest = requests.get(f"{BASE_URL}/changes", params={
+            "since": first["next_since"], "scope_id": scope_id, "include_memory": False
+        }).json()
+        assert [c["id"] for c in rest["changes"]] == ids[2:]
+        assert "memory" not in rest["changes"][0]
+
+    def test_changes_empty_advances_to_latest(self):
+        """変更が無い場合も next_since は latest_seq まで進む"""
+        data = requests.get(f"{BASE_URL}/changes", params={
+            "since": self._latest_seq(), "scope_id": f"changes-none-{uuid.uuid4().hex[:8]}"
+        }).json()
+        assert data["next_since"] == data["latest_seq"]
+
+    def test_changes_invalid_limit(self):
+        """limit の上限を超えると 422"""
+        response = requests.get(f"{BASE_URL}/changes", params={"limit": 100000})
+        assert response.status_code == 422
+
+
+class TestChangeStream:
+    """変更の SSE 配信（/changes/stream）のテスト"""
+
+    def _read_events(self, lines, count: int) -> list[tuple[str, dict]]:
+        """SSE の行イテレータから count 件のイベント（ハートビートを除く）を読む"""
+        import json
+
+        events = []
+        event = None
+        for line in lines:
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+                if len(events) == count:
+                    break
+        return events
+
+    def test_stream_pushes_store_and_delete(self):
+        """購読中の store / delete がイベントとして届く"""
+        scope_id = f"stream-{uuid.uuid4().hex[:8]}"
+        with requests.get(
+            f"{BASE_URL}/changes/stream", params={"scope_id": scope_id}, stream=True, timeout=10
+        ) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            lines = response.iter_lines(decode_unicode=True)
+            assert self._read_events(lines, 1)[0][0] == "ready"
+
+            # 他プロジェクトの変更は届かない
+            requests.post(f"{BASE_URL}/store", json={"content": "別プロジェクト", "scope_id": f"other-{scope_id}"})
+            memory_id = requests.post(f"{BASE_URL}/store", json={"content": "SSE配信", "scope_id": scope_id}).json()["id"]
+            requests.delete(f"{BASE_URL}/memory/{memory_id}")
+
+            events = self._read_events(lines, 2)
+        assert [name for name, _ in events] == ["insert", "delete"]
+        assert all(data["id"] == memory_id for _, data in events)
+        assert events[0][1]["scope_id"] == scope_id
+
+    def test_stream_replays_from_since(self):
+        """since（Last-Event-ID）指定で接続前の変更を補ってから配信する"""
+        scope_id = f"stream-{uuid.uuid4().hex[:8]}"
+        since = requests.get(f"{BASE_URL}/changes", params={"limit": 1}).json()["latest_seq"]
+        memory_id = requests.post(f"{BASE_URL}/store", json={"content": "再接続", "scope_id": scope_id}).json()["id"]
+
+        with requests.get(
+            f"{BASE_URL}/changes/stream",
+            params={"scope_id": scope_id},
+            headers={"Last-Event-ID": str(since)},
+            stream=True,
+            timeout=10
+        ) as response:
+            events = self._read_events(response.iter_lines(decode_unicode=True), 2)
+        assert events[0][0] == "ready"
+        assert events[1][0] == "insert"
+        assert events[1][1]["id"] == memory_id
+        assert events[1][1]["memory"]["content"] == "再接続"
+
 
 class TestMemoryOperations:
     """メモリ操作のテスト"""
@@ -823,6 +1732,670 @@ class TestMemoryOperations:
         assert response.status_code == 404
 
 
+class TestBatchGet:
+    """複数ID取得（/memories）のテスト"""
+
+    def _store(self, content: str, scope_id: str) -> str:
+        return requests.post(f"{BASE_URL}/store", json={"content": content, "scope_id": scope_id}).json()["id"]
+
+    def test_get_memories_in_request_order(self):
+        """ids の順序で返し、存在しない ID は not_found に入る"""
+        scope_id = f"multiget-{uuid.uuid4().hex[:8]}"
+        ids = [self._store(f"複数取得{i}", scope_id) for i in range(3)]
+        requested = [ids[2], "missing-id", ids[0], ids[2], ids[1]]
+
+        response = requests.get(f"{BASE_URL}/memories", params={"ids": ",".join(requested)})
+        assert response.status_code == 200
+        data = response.json()
+        assert [m["id"] for m in data["memories"]] == [ids[2], ids[0], ids[1]]
+        assert data["not_found"] == ["missing-id"]
+        assert data["denied"] == []
+        assert data["memories"][0]["content"] == "複数取得2"
+        assert data["memories"][0]["tokens"] > 0
+
+    def test_get_memories_fields_projection(self):
+        """fields= で返すフィールドを絞り込める（id は常に含む）"""
+        scope_id = f"multiget-{uuid.uuid4().hex[:8]}"
+        memory_id = self._store("射影テスト", scope_id)
+
+        response = requests.get(f"{BASE_URL}/memories", params={"ids": memory_id, "fields": "superseded_by,tags"})
+        assert response.status_code == 200
+        memory = response.json()["memories"][0]
+        assert set(memory) == {"id", "superseded_by", "tags"}
+        assert isinstance(memory["tags"], list)
+
+    def test_get_memories_validation(self):
+        """不明なフィールド・ID 数の上限超過は 422"""
+        response = requests.get(f"{BASE_URL}/memories", params={"ids": "a", "fields": "password"})
+        assert response.status_code == 422
+        too_many = ",".join(f"id{i}" for i in range(501))
+        assert requests.get(f"{BASE_URL}/memories", params={"ids": too_many}).status_code == 422
+
+
+class TestBulkUpdate:
+    """条件指定の一括更新（/memories/bulk）のテスト"""
+
+    def _store(self, scope_id: str, content: str, **kwargs) -> str:
+        payload = {"content": content, "scope_id": scope_id, **kwargs}
+        return requests.post(f"{BASE_URL}/store", json=payload).json()["id"]
+
+    def test_bulk_deprecate_dry_run_then_apply(self):
+        """dry_run で件数を確認してから、条件に一致する記憶だけを廃止できる"""
+        scope_id = f"bulk-{uuid.uuid4().hex[:8]}"
+        work_ids = [self._store(scope_id, f"古い作業{i}", type="work") for i in range(3)]
+        decision_id = self._store(scope_id, "残す決定", type="decision")
+        body = {"filter": {"scope_id": scope_id, "type": "work"}, "action": "deprecate"}
+
+        dry = requests.post(f"{BASE_URL}/memories/bulk", json={**body, "dry_run": True}).json()
+        assert dry["matched"] == 3
+        assert sorted(dry["sample_ids"]) == sorted(work_ids)
+        assert requests.get(f"{BASE_URL}/memory/{work_ids[0]}").json()["deprecated"] is False
+
+        result = requests.post(f"{BASE_URL}/memories/bulk", json=body).json()
+        assert result["updated"] == 3
+        assert all(requests.get(f"{BASE_URL}/memory/{i}").json()["deprecated"] for i in work_ids)
+        assert requests.get(f"{BASE_URL}/memory/{decision_id}").json()["deprecated"] is False
+
+        # 廃止済みは再度の対象にならない
+        again = requests.post(f"{BASE_URL}/memories/bulk", json=body).json()
+        assert again["updated"] == 0
+
+    def test_bulk_retag_by_tag(self):
+        """タグで絞り込んでタグの追加・削除ができる"""
+        scope_id = f"bulk-{uuid.uuid4().hex[:8]}"
+        target = self._store(scope_id, "タグ変更対象", tags=["legacy"])
+        other = self._store(scope_id, "対象外", tags=["current"])
+
+        result = requests.post(f"{BASE_URL}/memories/bulk", json={
+            "filter": {"scope_id": scope_id, "tag": "LEGACY"},
+            "action": "retag",
+            "add_tags": ["Migrated"],
+            "remove_tags": ["legacy"],
+        }).json()
+        assert result["updated"] == 1
+        tags = requests.get(f"{BASE_URL}/memory/{target}").json()["tags"]
+        assert "migrated" in tags and "legacy" not in tags
+        assert requests.get(f"{BASE_URL}/memory/{other}").json()["tags"] == ["current"]
+
+    def test_bulk_recategorize_created_before(self):
+        """created_before で古い記憶だけカテゴリを変更できる"""
+        scope_id = f"bulk-{uuid.uuid4().hex[:8]}"
+        memory_id = self._store(scope_id, "カテゴリ変更", category="other")
+        future = "2999-01-01T00:00:00"
+
+        result = requests.post(f"{BASE_URL}/memories/bulk", json={
+            "filter": {"scope_id": scope_id, "created_before": future},
+            "action": "recategorize",
+            "category": "infra",
+        }).json()
+        assert result["updated"] == 1
+        assert requests.get(f"{BASE_URL}/memory/{memory_id}").json()["category"] == "infra"
+
+        past = requests.post(f"{BASE_URL}/memories/bulk", json={
+            "filter": {"scope_id": scope_id, "created_before": "2000-01-01T00:00:00"},
+            "action": "recategorize",
+            "category": "backend",
+            "dry_run": True,
+        }).json()
+        assert past["matched"] == 0
+
+    def test_bulk_validation(self):
+        """scope_id 必須、action ごとの必須パラメータ、日時形式を検証する"""
+        url = f"{BASE_URL}/memories/bulk"
+        assert requests.post(url, json={"filter": {}, "action": "deprecate"}).status_code == 422
+        assert requests.post(url, json={"filter": {"scope_id": "x"}, "action": "recategorize"}).status_code == 422
+        assert requests.post(url, json={"filter": {"scope_id": "x"}, "action": "retag"}).status_code == 422
+        assert requests.post(url, json={
+            "filter": {"scope_id": "x", "created_before": "yesterday"}, "action": "deprecate"
+        }).status_code == 422
+
+
+class TestBatchRequests:
+    """複数リクエストの一括実行（/batch）のテスト"""
+
+    def test_batch_returns_responses_in_order(self):
+        """サブリクエストの結果をリクエストと同じ順序で返す"""
+        scope_id = f"batchreq-{uuid.uuid4().hex[:8]}"
+        requests.post(f"{BASE_URL}/store", json={"content": "決定 バッチ", "type": "decision", "scope_id": scope_id})
+
+        response = requests.post(f"{BASE_URL}/batch", json={"requests": [
+            {"path": "/health"},
+            {"path": f"/stats/{scope_id}"},
+            {"path": "/search", "params": {"query": "バッチ", "scope_id": scope_id, "type": "decision", "limit": 3}},
+        ]})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 3
+        health, stats, search = data["responses"]
+        assert health["status"] == 200 and health["body"]["status"] == "healthy"
+        assert stats["status"] == 200 and stats["body"]["project_id"] == scope_id
+        assert search["status"] == 200 and len(search["body"]["memories"]) == 1
+
+    def test_batch_decodes_encoded_path(self):
+        """パーセントエンコードしたパス（空白・日本語を含む project_id）は直接の GET と同じ結果になる"""
+        scope_id = f"batch 日本語-{uuid.uuid4().hex[:8]}"
+        requests.post(f"{BASE_URL}/store", json={"content": "決定 エンコード", "type": "decision", "scope_id": scope_id})
+
+        response = requests.post(f"{BASE_URL}/batch", json={"requests": [
+            {"path": "/stats/" + quote(scope_id, safe="")},
+        ]})
+        stats = response.json()["responses"][0]
+        assert stats["status"] == 200
+        assert stats["body"] == requests.get(f"{BASE_URL}/stats/{quote(scope_id, safe='')}").json()
+        assert stats["body"]["project_id"] == scope_id
+        assert stats["body"]["stats"]
+
+    def test_batch_reports_sub_request_errors(self):
+        """サブリクエストのエラーは個別のステータスとして返り、他は影響を受けない"""
+        response = requests.post(f"{BASE_URL}/batch", json={"requests": [
+            {"path": "/memory/nonexistent-id"},
+            {"path": "/search?limit=abc"},
+            {"path": "/health"},
+        ]})
+        assert response.status_code == 200
+        statuses = [r["status"] for r in response.json()["responses"]]
+        assert statuses == [404, 422, 200]
+
+    def test_batch_rejects_writes_and_excluded_paths(self):
+        """GET 以外・入れ子の /batch・ストリームは 422"""
+        url = f"{BASE_URL}/batch"
+        assert requests.post(url, json={"requests": [{"method": "POST", "path": "/store"}]}).status_code == 422
+        assert requests.post(url, json={"requests": [{"path": "/batch"}]}).status_code == 422
+        assert requests.post(url, json={"requests": [{"path": "/changes/stream"}]}).status_code == 422
+        for path in ("/%63hanges/stream", "//changes/stream", "/changes/./stream/", "/%62atch"):
+            assert requests.post(url, json={"requests": [{"path": path}]}).status_code == 422, path
+        assert requests.post(url, json={"requests": []}).status_code == 422
+        assert requests.post(url, json={"requests": [{"path": "/health"}] * 21}).status_code == 422
+
+
+class TestDeferredEnrichment:
+    """/store?defer_enrich=true（自動推定のバックグラウンド化）のテスト"""
+
+    def test_deferred_store_is_enriched_later(self):
+        """202 で ID が返り、後処理の完了後にカテゴリ・タグ・要約が付く"""
+        scope_id = f"enrich-{uuid.uuid4().hex[:8]}"
+        response = requests.post(f"{BASE_URL}/store", params={"defer_enrich": "true"}, json={
+            "content": "ログイン API に JWT 認証を導入\n詳細は後述",
+            "type": "decision",
+            "scope": "project",
+            "scope_id": scope_id,
+            "tags": ["custom"]
+        })
+        assert response.status_code == 202
+        data = response.json()
+        assert data["enrichment"] == "pending"
+        assert data["tags"] == ["custom"]
+        memory_id = data["id"]
+
+        response = requests.get(f"{BASE_URL}/enrichment/wait", params={"ids": memory_id, "timeout": 10})
+        assert response.status_code == 200
+        assert response.json() == {"done": True, "pending": []}
+
+        memory = requests.get(f"{BASE_URL}/memory/{memory_id}").json()
+        assert memory["category"] == "security"
+        assert {"custom", "jwt", "auth"} <= set(memory["tags"])
+        assert memory["summary"] == "ログイン API に JWT 認証を導入"
+
+        # 埋め込みも計算済みなので意味検索で見つかる
+        response = requests.get(f"{BASE_URL}/search", params={
+            "query": "JWT 認証", "scope_id": scope_id, "mode": "semantic"
+        })
+        assert memory_id in [m["id"] for m in response.json()["memories"]]
+
+    def test_deferred_store_keeps_explicit_category(self):
+        """指定したカテゴリは後処理で上書きされない"""
+        response = requests.post(f"{BASE_URL}/store", params={"defer_enrich": "true"}, json={
+            "content": "JWT の有効期限を 1 時間にする",
+            "type": "decision",
+            "scope": "project",
+            "scope_id": f"enrich-{uuid.uuid4().hex[:8]}",
+            "category": "backend"
+        })
+        assert response.status_code == 202
+        memory_id = response.json()["id"]
+
+        assert requests.get(
+            f"{BASE_URL}/enrichment/wait", params={"ids": memory_id, "timeout": 10}
+        ).json()["done"] is True
+        memory = requests.get(f"{BASE_URL}/memory/{memory_id}").json()
+        assert memory["category"] == "backend"
+        assert "jwt" in memory["tags"]
+
+    def test_deferred_store_computes_tokens_and_simhash_later(self):
+        """トークン数・SimHash も後処理で計算され、近似重複の一覧に現れる"""
+        scope_id = f"enrich-{uuid.uuid4().hex[:8]}"
+        content = "src/api/orders.py の {line} 行目で ValueError を修正。数量が負の場合は 400 を返すようにした。"
+        first_id = requests.post(f"{BASE_URL}/store", json={
+            "content": content.format(line=40), "type": "work", "scope": "project", "scope_id": scope_id
+        }).json()["id"]
+        response = requests.post(f"{BASE_URL}/store", params={"defer_enrich": "true"}, json={
+            "content": content.format(line=41), "type": "work", "scope": "project", "scope_id": scope_id
+        })
+        assert response.status_code == 202
+        assert response.json()["near_duplicate_ids"] == []
+        memory_id = response.json()["id"]
+
+        assert requests.get(
+            f"{BASE_URL}/enrichment/wait", params={"ids": memory_id, "timeout": 10}
+        ).json()["done"] is True
+        assert requests.get(f"{BASE_URL}/memory/{memory_id}").json()["tokens"] > 0
+        data = requests.get(f"{BASE_URL}/near-duplicates/{scope_id}").json()
+        assert data["unindexed"] == 0
+        assert {m["id"] for m in data["clusters"][0]["memories"]} == {first_id, memory_id}
+
+    def test_failing_row_does_not_block_queue(self):
+        """後処理で例外になる記憶があっても、後続の記憶は処理される（失敗した記憶はキューから外れる）"""
+        scope_id = f"enrich-{uuid.uuid4().hex[:8]}"
+        params = {"defer_enrich": "true"}
+        # metadata.file が文字列でないとカテゴリ推定で例外になる
+        bad_id = requests.post(f"{BASE_URL}/store", params=params, json={
+            "content": "壊れたメタデータ", "type": "work", "scope_id": scope_id, "metadata": {"file": 123}
+        }).json()["id"]
+        good_id = requests.post(f"{BASE_URL}/store", params=params, json={
+            "content": "JWT 認証の後処理", "type": "work", "scope_id": scope_id
+        }).json()["id"]
+
+        response = requests.get(f"{BASE_URL}/enrichment/wait", params={"ids": f"{bad_id},{good_id}", "timeout": 10})
+        assert response.json() == {"done": True, "pending": []}
+        assert "jwt" in requests.get(f"{BASE_URL}/memory/{good_id}").json()["tags"]
+        assert requests.get(f"{BASE_URL}/memory/{bad_id}").json()["content"] == "壊れたメタデータ"
+
+        status = requests.get(f"{BASE_URL}/enrichment").json()
+        assert status["failed"] >= 1
+        assert bad_id in status["last_error"]
+
+    def test_enrichment_status(self):
+        """キューの滞留状況を取得できる"""
+        response = requests.get(f"{BASE_URL}/enrichment")
+        assert response.status_code == 200
+        data = response.json()
+        for key in ("pending", "oldest_pending_at", "lag_seconds", "processed", "failed", "batches", "last_error"):
+            assert key in data
+        assert data["lag_seconds"] >= 0
+
+    def test_wait_requires_ids(self):
+        """ids が空なら 422（/memories と同じ）、存在しない ID は待たずに完了扱い"""
+        response = requests.get(f"{BASE_URL}/enrichment/wait", params={"ids": " , "})
+        assert response.status_code == 422
+
+        response = requests.get(f"{BASE_URL}/enrichment/wait", params={"ids": "nonexist", "timeout": 1})
+        assert response.json() == {"done": True, "pending": []}
+
+
+class TestIdempotency:
+    """Idempotency-Key ヘッダーのテスト"""
+
+    def test_store_retry_returns_original_response(self):
+        """同じキーでの再送は最初の応答を返し、記憶は1件しか増えない"""
+        scope_id = f"idem-{uuid.uuid4().hex[:8]}"
+        key = uuid.uuid4().hex
+        entry = {"content": "冪等性キーのテスト", "type": "work", "scope": "project", "scope_id": scope_id}
+
+        first = requests.post(f"{BASE_URL}/store", json=entry, headers={"Idempotency-Key": key})
+        assert first.status_code == 200
+        assert "Idempotent-Replayed" not in first.headers
+
+        retry = requests.post(f"{BASE_URL}/store", json=entry, headers={"Idempotency-Key": key})
+        assert retry.status_code == 200
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+
+        memories = requests.get(f"{BASE_URL}/export/{scope_id}").json()["memories"]
+        assert [m["id"] for m in memories if m["scope_id"] == scope_id] == [first.json()["id"]]
+
+    def test_store_deferred_retry_replays_202(self):
+        """defer_enrich の 202 応答も再送時にそのまま返る"""
+        key = uuid.uuid4().hex
+        entry = {"content": "遅延モードの冪等性", "scope": "project", "scope_id": f"idem-{uuid.uuid4().hex[:8]}"}
+        params = {"defer_enrich": "true"}
+
+        first = requests.post(f"{BASE_URL}/store", params=params, json=entry, headers={"Idempotency-Key": key})
+        retry = requests.post(f"{BASE_URL}/store", params=params, json=entry, headers={"Idempotency-Key": key})
+        assert first.status_code == retry.status_code == 202
+        assert retry.json()["id"] == first.json()["id"]
+
+    def test_store_key_reused_with_different_body(self):
+        """別のリクエストに同じキーを使うと 422"""
+        key = uuid.uuid4().hex
+        assert requests.post(
+            f"{BASE_URL}/store", json={"content": "一回目"}, headers={"Idempotency-Key": key}
+        ).status_code == 200
+        response = requests.post(f"{BASE_URL}/store", json={"content": "二回目"}, headers={"Idempotency-Key": key})
+        assert response.status_code == 422
+
+    def test_store_failed_request_can_be_retried(self):
+        """失敗したリクエストは記録されず、修正して同じキーで送り直せる"""
+        key = uuid.uuid4().hex
+        response = requests.post(f"{BASE_URL}/store", json={"content": "   "}, headers={"Idempotency-Key": key})
+        assert response.status_code == 422
+
+        response = requests.post(f"{BASE_URL}/store", json={"content": "   "}, headers={"Idempotency-Key": key})
+        assert response.status_code == 422
+        assert "Idempotent-Replayed" not in response.headers
+
+    def test_invalid_key(self):
+        """長すぎるキーは 400"""
+        response = requests.post(f"{BASE_URL}/store", json={"content": "x"}, headers={"Idempotency-Key": "k" * 256})
+        assert response.status_code == 400
+
+    def test_import_retry_does_not_reimport(self):
+        """/import の再送は取り込みをやり直さず、最初の結果を返す"""
+        scope_id = f"idem-import-{uuid.uuid4().hex[:8]}"
+        key = uuid.uuid4().hex
+        body = {"memories": [{"content": f"冪等インポート{i}", "scope": "project", "scope_id": scope_id} for i in range(3)]}
+
+        first = requests.post(f"{BASE_URL}/import", json=body, headers={"Idempotency-Key": key})
+        assert first.status_code == 200
+        assert first.json()["imported"] == 3
+
+        retry = requests.post(f"{BASE_URL}/import", json=body, headers={"Idempotency-Key": key})
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+
+        memories = requests.get(f"{BASE_URL}/export/{scope_id}").json()["memories"]
+        assert len([m for m in memories if m["scope_id"] == scope_id]) == 3
+
+    def test_import_retry_after_partial_failure_does_not_duplicate(self):
+        """途中で失敗した /import を同じキーで送り直しても、コミット済みの id の無い行は重複しない"""
+        import json
+        scope_id = f"idem-partial-{uuid.uuid4().hex[:8]}"
+        key = uuid.uuid4().hex
+        rows = [{"content": f"部分インポート{i}", "scope": "project", "scope_id": scope_id} for i in range(501)]
+        # 最初のチャンク（500行）のコミット後に、パーサーが例外にする深い入れ子の行を置く
+        body = "\n".join([*(json.dumps(r) for r in rows[:500]), "[" * 100000, json.dumps(rows[500])])
+        headers = {"Idempotency-Key": key, "Content-Type": "application/x-ndjson"}
+
+        for _ in range(2):
+            requests.post(f"{BASE_URL}/import", data=body.encode("utf-8"), headers=headers)
+
+        memories = requests.get(f"{BASE_URL}/export/{scope_id}").json()["memories"]
+        contents = [m["content"] for m in memories if m["scope_id"] == scope_id]
+        assert len(contents) == len(set(contents))
+
+
+class TestContentDedup:
+    """同じ内容の保存（完全一致の重複）の抑止のテスト"""
+
+    def test_duplicate_store_refreshes_existing(self):
+        """空白だけ違う同じ内容は新しい記憶を作らず、既存の記憶を更新する"""
+        scope_id = f"dedup-{uuid.uuid4().hex[:8]}"
+        entry = {"content": "main.py を編集", "type": "work", "scope": "project", "scope_id": scope_id,
+                 "importance": 0.3, "metadata": {"file": "main.py"}}
+        first = requests.post(f"{BASE_URL}/store", json=entry).json()
+        assert first["deduplicated"] is False
+
+        response = requests.post(f"{BASE_URL}/store", json={**entry, "content": "main.py  を編集\n", "importance": 0.6})
+        assert response.status_code == 200
+        second = response.json()
+        assert second["id"] == first["id"]
+        assert second["deduplicated"] is True
+        assert second["duplicate_count"] == 1
+
+        memory = requests.get(f"{BASE_URL}/memory/{first['id']}").json()
+        assert memory["importance"] == 0.6
+        assert memory["duplicate_count"] == 1
+        assert memory["content"] == "main.py を編集"
+
+        stats = requests.get(f"{BASE_URL}/stats/{scope_id}").json()["stats"]
+        assert stats["project/work"]["count"] == 1
+
+    def test_different_metadata_or_tags_are_kept(self):
+        """メタデータが違う場合や、新しいタグを指定した場合は別の記憶として保存する"""
+        scope_id = f"dedup-{uuid.uuid4().hex[:8]}"
+        entry = {"content": "ファイルを編集", "type": "work", "scope": "project", "scope_id": scope_id,
+                 "metadata": {"file": "a.py"}}
+        ids = {
+            requests.post(f"{BASE_URL}/store", json=entry).json()["id"],
+            requests.post(f"{BASE_URL}/store", json={**entry, "metadata": {"file": "b.py"}}).json()["id"],
+            requests.post(f"{BASE_URL}/store", json={**entry, "tags": ["extra"]}).json()["id"],
+        }
+        assert len(ids) == 3
+
+        # 代表は最初の記憶のまま
+        response = requests.post(f"{BASE_URL}/store", json=entry).json()
+        assert response["deduplicated"] is True
+        assert response["id"] in ids
+
+    def test_deprecated_memory_is_not_refreshed(self):
+        """廃止済みの記憶とは重複扱いにせず、復元しても一意性が保たれる"""
+        scope_id = f"dedup-{uuid.uuid4().hex[:8]}"
+        entry = {"content": "廃止テスト", "type": "work", "scope": "project", "scope_id": scope_id}
+        old_id = requests.post(f"{BASE_URL}/store", json=entry).json()["id"]
+        requests.patch(f"{BASE_URL}/memory/{old_id}/deprecate", json={"deprecated": True})
+
+        new = requests.post(f"{BASE_URL}/store", json=entry).json()
+        assert new["id"] != old_id
+        assert new["deduplicated"] is False
+
+        response = requests.patch(f"{BASE_URL}/memory/{old_id}/deprecate", json={"deprecated": False})
+        assert response.status_code == 200
+        assert requests.post(f"{BASE_URL}/store", json=entry).json()["id"] == new["id"]
+
+    def test_batch_reports_suppressed_count(self):
+        """/store/batch は重複としてまとめた件数を返す"""
+        entry = {"content": "バッチの重複", "type": "work", "scope": "project",
+                 "scope_id": f"dedup-{uuid.uuid4().hex[:8]}"}
+        response = requests.post(f"{BASE_URL}/store/batch", json={"memories": [entry, entry, entry]})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["deduplicated"] == 2
+        assert len({r["id"] for r in data["results"]}) == 1
+        assert data["results"][2]["duplicate_count"] == 2
+
+    def test_import_keeps_duplicates(self):
+        """インポートは同じ内容でもまとめずに取り込む"""
+        scope_id = f"dedup-import-{uuid.uuid4().hex[:8]}"
+        entry = {"content": "インポートの重複", "type": "work", "scope": "project", "scope_id": scope_id}
+        response = requests.post(f"{BASE_URL}/import", json={"memories": [entry, entry]})
+        assert response.json()["imported"] == 2
+
+        assert requests.post(f"{BASE_URL}/store", json=entry).json()["deduplicated"] is True
+
+
+class TestNearDuplicates:
+    """近似重複（SimHash）の検出のテスト"""
+
+    CONTENT = "src/api/users.py の {line} 行目で KeyError を修正。設定が無い場合は既定値を返すよう変更し、テストを追加した。"
+
+    def store(self, scope_id, line, **params):
+        return requests.post(f"{BASE_URL}/store", params=params, json={
+            "content": self.CONTENT.format(line=line), "type": "work", "scope": "project", "scope_id": scope_id
+        })
+
+    def test_store_reports_near_duplicates(self):
+        """行番号だけ違う記憶は near_duplicate_ids に返る（既定では別の記憶として保存）"""
+        scope_id = f"near-{uuid.uuid4().hex[:8]}"
+        first = self.store(scope_id, 120).json()
+        assert first["near_duplicate_ids"] == []
+
+        second = self.store(scope_id, 121).json()
+        assert second["id"] != first["id"]
+        assert second["near_duplicate_ids"] == [first["id"]]
+
+        other = requests.post(f"{BASE_URL}/store", json={
+            "content": "React のコンポーネントを分割して描画を高速化", "type": "work",
+            "scope": "project", "scope_id": scope_id
+        }).json()
+        assert other["near_duplicate_ids"] == []
+
+    def test_merge_policy(self):
+        """merge では保存せず、最も近い既存の記憶を更新する"""
+        scope_id = f"near-{uuid.uuid4().hex[:8]}"
+        first = self.store(scope_id, 10).json()
+        response = self.store(scope_id, 11, near_duplicates="merge")
+        assert response.status_code == 200
+        merged = response.json()
+        assert merged["id"] == first["id"]
+        assert merged["deduplicated"] is True
+        assert merged["duplicate_count"] == 1
+
+    def test_merge_with_new_tags_keeps_content_hash(self):
+        """merge で新しいタグにより別保存された記憶も、同じ内容の再保存で重複として見つかる"""
+        scope_id = f"near-{uuid.uuid4().hex[:8]}"
+        first = self.store(scope_id, 10).json()
+        entry = {
+            "content": self.CONTENT.format(line=11), "type": "work", "scope": "project",
+            "scope_id": scope_id, "tags": ["keyerror"]
+        }
+        second = requests.post(f"{BASE_URL}/store", params={"near_duplicates": "merge"}, json=entry).json()
+        assert second["id"] != first["id"]
+
+        again = requests.post(f"{BASE_URL}/store", json=entry).json()
+        assert again["id"] == second["id"]
+        assert again["deduplicated"] is True
+
+    def test_supersede_policy(self):
+        """supersede では新しい記憶を保存し、近似重複を廃止する"""
+        scope_id = f"near-{uuid.uuid4().hex[:8]}"
+        first = self.store(scope_id, 10).json()
+        second = self.store(scope_id, 11, near_duplicates="supersede").json()
+        assert second["superseded_ids"] == [first["id"]]
+
+        old = requests.get(f"{BASE_URL}/memory/{first['id']}").json()
+        assert old["deprecated"] is True
+        assert old["superseded_by"] == second["id"]
+
+    def test_clusters(self):
+        """プロジェクト内の近似重複をクラスタにまとめて返す"""
+        scope_id = f"near-{uuid.uuid4().hex[:8]}"
+        ids = [self.store(scope_id, line).json()["id"] for line in (1, 22, 333)]
+        requests.post(f"{BASE_URL}/store", json={
+            "content": "デプロイ手順を README に追記", "type": "work", "scope": "project", "scope_id": scope_id
+        })
+
+        response = requests.get(f"{BASE_URL}/near-duplicates/{scope_id}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_clusters"] == 1
+        assert data["duplicate_memories"] == 2
+        cluster = data["clusters"][0]
+        assert cluster["size"] == 3
+        assert cluster["representative_id"] == ids[-1]
+        assert {m["id"] for m in cluster["memories"]} == set(ids)
+
+    def test_clusters_invalid_distance(self):
+        """バンドで保証できない距離は 422"""
+        response = requests.get(f"{BASE_URL}/near-duplicates/any", params={"max_distance": 10})
+        assert response.status_code == 422
+
+
+class TestWriteCoalescing:
+    """同じファイルの作業記録の追記（coalesce_window）のテスト"""
+
+    def store(self, scope_id, content, file="src/app.py", type="work", **params):
+        return requests.post(f"{BASE_URL}/store", params=params, json={
+            "content": content, "type": type, "scope": "project", "scope_id": scope_id,
+            "metadata": {"file": file} if file else {}
+        })
+
+    def test_appends_within_window(self):
+        """窓内の同じファイルへの保存は直近の記憶に追記され、トークン数も加算される"""
+        scope_id = f"coalesce-{uuid.uuid4().hex[:8]}"
+        first = self.store(scope_id, "ログイン処理のタイムアウトを 30 秒に変更", coalesce_window=600).json()
+        assert first["coalesced"] is False
+
+        second = self.store(scope_id, "タイムアウト時にリトライを 1 回追加", coalesce_window=600).json()
+        assert second["id"] == first["id"]
+        assert second["coalesced"] is True
+        assert second["coalesce_count"] == 1
+        assert second["tokens"] > first["tokens"]
+
+        memory = requests.get(f"{BASE_URL}/memory/{first['id']}").json()
+        assert memory["content"].split("\n") == [
+            "ログイン処理のタイムアウトを 30 秒に変更", "タイムアウト時にリトライを 1 回追加"
+        ]
+        assert memory["tokens"] == second["tokens"]
+
+    def test_multi_get_tokens_field_uses_stored_count(self):
+        """/memories の fields=tokens も保存済みのトークン数（追記で加算した値）を返す"""
+        scope_id = f"coalesce-{uuid.uuid4().hex[:8]}"
+        first = self.store(scope_id, "タイムアウトの既定値を 30 秒から 60 秒に延長", coalesce_window=600).json()
+        second = self.store(scope_id, "延長後のリトライ回数は 2 回のまま据え置き", coalesce_window=600).json()
+        assert second["id"] == first["id"]
+
+        full = requests.get(f"{BASE_URL}/memories", params={"ids": first["id"]}).json()["memories"][0]
+        projected = requests.get(f"{BASE_URL}/memories", params={"ids": first["id"], "fields": "tokens"}).json()
+        assert projected["memories"][0]["tokens"] == full["tokens"] == second["tokens"]
+
+    def test_other_file_or_type_is_not_coalesced(self):
+        """別ファイル・ファイル指定なし・work 以外の記憶は追記しない"""
+        scope_id = f"coalesce-{uuid.uuid4().hex[:8]}"
+        first = self.store(scope_id, "キャッシュの TTL を 5 分に短縮", coalesce_window=600).json()
+        assert self.store(scope_id, "README の手順を更新", file="README.md", coalesce_window=600).json()["id"] != first["id"]
+        assert self.store(scope_id, "CI の並列数を 4 に変更", file=None, coalesce_window=600).json()["id"] != first["id"]
+        decision = self.store(scope_id, "キャッシュは Redis に統一する", type="decision", coalesce_window=600).json()
+        assert decision["id"] != first["id"]
+        assert decision["coalesced"] is False
+
+    def test_zero_window_disables(self):
+        """coalesce_window=0 では追記しない"""
+        scope_id = f"coalesce-{uuid.uuid4().hex[:8]}"
+        first = self.store(scope_id, "認証ミドルウェアを追加", coalesce_window=0).json()
+        second = self.store(scope_id, "認証ミドルウェアのテストを追加", coalesce_window=0).json()
+        assert second["id"] != first["id"]
+        assert second["coalesced"] is False
+
+
+class TestStoreBatch:
+    """一括保存（/store/batch）のテスト"""
+
+    def test_store_batch_returns_results_in_order(self):
+        """各記憶に /store と同じ処理を行い、結果をリクエスト順に返す"""
+        scope_id = f"batch-{uuid.uuid4().hex[:8]}"
+        memories = [
+            {"content": "JWT認証のバグを修正", "scope_id": scope_id},
+            {"content": "TODO: テスト追加", "type": "todo", "scope_id": scope_id},
+            {"content": "制御文字\x01を含む", "scope_id": scope_id, "tags": ["manual"]},
+        ]
+        response = requests.post(f"{BASE_URL}/store/batch", json={"memories": memories})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["count"] == 3
+        results = data["results"]
+        assert len({r["id"] for r in results}) == 3
+        assert "auth" in results[0]["tags"]
+        assert "manual" in results[2]["tags"]
+        assert all(r["tokens"] > 0 for r in results)
+
+        for result, memory in zip(results, memories):
+            stored = requests.get(f"{BASE_URL}/memory/{result['id']}").json()
+            assert stored["content"] == memory["content"].replace("\x01", "")
+        todo = requests.get(f"{BASE_URL}/memory/{results[1]['id']}").json()
+        assert todo["metadata"]["status"] == "pending"
+
+    def test_store_batch_supersedes(self):
+        """supersedes による廃止も各記憶ごとに反映される"""
+        scope_id = f"batch-{uuid.uuid4().hex[:8]}"
+        old_id = requests.post(f"{BASE_URL}/store", json={"content": "旧方針", "scope_id": scope_id}).json()["id"]
+        response = requests.post(f"{BASE_URL}/store/batch", json={"memories": [
+            {"content": "無関係", "scope_id": scope_id},
+            {"content": "新方針", "scope_id": scope_id, "supersedes": [old_id, "missing-id"]},
+        ]})
+        results = response.json()["results"]
+        assert results[0]["superseded_ids"] == []
+        assert results[1]["superseded_ids"] == [old_id]
+        assert results[1]["skipped_supersedes"] == [{"id": "missing-id", "reason": "not_found"}]
+        assert requests.get(f"{BASE_URL}/memory/{old_id}").json()["deprecated"] is True
+
+    def test_store_batch_is_atomic(self):
+        """1件でも不正なら何も保存されず、index 付きでエラーになる"""
+        scope_id = f"batch-{uuid.uuid4().hex[:8]}"
+        response = requests.post(f"{BASE_URL}/store/batch", json={"memories": [
+            {"content": "正常", "scope_id": scope_id},
+            {"content": "   ", "scope_id": scope_id},
+        ]})
+        assert response.status_code == 422
+        assert response.json()["detail"]["index"] == 1
+        exported = requests.get(f"{BASE_URL}/export/{scope_id}").json()["memories"]
+        assert [m for m in exported if m["scope_id"] == scope_id] == []
+
+    def test_store_batch_size_limits(self):
+        """空のバッチと上限超過は 422"""
+        assert requests.post(f"{BASE_URL}/store/batch", json={"memories": []}).status_code == 422
+        too_many = [{"content": f"x{i}"} for i in range(101)]
+        assert requests.post(f"{BASE_URL}/store/batch", json={"memories": too_many}).status_code == 422
+
+
 class TestImport:
     """インポートのテスト"""
 
@@ -852,6 +2425,109 @@ class TestImport:
         data = response.json()
         assert data["imported"] == 2
 
+    def test_import_reports_row_errors(self):
+        """不正な行はスキップされ、行番号付きでエラーが返る"""
+        scope_id = f"import-errors-{uuid.uuid4().hex[:8]}"
+        memories = [
+            {"content": "正常な行", "scope_id": scope_id},
+            {"content": "   ", "scope_id": scope_id},
+            {"content": "不正なtype", "type": "unknown", "scope_id": scope_id},
+            {"content": "正常な行2", "scope_id": scope_id, "importance": 0.9},
+        ]
+        response = requests.post(f"{BASE_URL}/import", json={"memories": memories})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["imported"] == 2
+        assert data["failed"] == 2
+        assert [e["line"] for e in data["errors"]] == [2, 3]
+
+    def test_import_ndjson_applies_store_pipeline(self):
+        """NDJSON インポートでも /store と同じサニタイズ・自動分類が適用される"""
+        import json
+
+        scope_id = f"import-ndjson-{uuid.uuid4().hex[:8]}"
+        lines = [
+            json.dumps({"content": "JWT認証のバグを修正\x00", "scope_id": scope_id}),
+            "{broken json",
+            "",
+            json.dumps({"content": "2件目", "scope_id": scope_id}),
+        ]
+        response = requests.post(
+            f"{BASE_URL}/import",
+            data="\n".join(lines).encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["imported"] == 2
+        assert data["failed"] == 1
+        assert data["errors"][0]["line"] == 2
+
+        exported = requests.get(f"{BASE_URL}/export/{scope_id}").json()["memories"]
+        first = next(m for m in exported if m["content"].startswith("JWT"))
+        assert "\x00" not in first["content"]
+        assert first["category"] == "security"
+        assert "auth" in first["tags"]
+
+    def test_import_ndjson_gzip_roundtrip(self):
+        """gzip 圧縮した NDJSON エクスポートをそのまま別環境へインポートできる"""
+        import gzip
+        import json
+
+        scope_id = f"import-roundtrip-{uuid.uuid4().hex[:8]}"
+        for i in range(3):
+            requests.post(f"{BASE_URL}/store", json={
+                "content": f"往復テスト{i}", "scope_id": scope_id, "type": "decision"
+            })
+        exported = requests.get(
+            f"{BASE_URL}/export/{scope_id}",
+            params={"format": "ndjson", "gzip": "true"},
+            stream=True
+        ).raw.read()
+        rows = [json.loads(line) for line in gzip.decompress(exported).splitlines()]
+        own = [r for r in rows if r["scope_id"] == scope_id]
+        assert len(own) == 3
+
+        requests.delete(f"{BASE_URL}/memory/{own[0]['id']}")
+        body = gzip.compress("\n".join(json.dumps(r) for r in own).encode("utf-8"))
+        response = requests.post(
+            f"{BASE_URL}/import",
+            data=body,
+            headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.json()["imported"] == 3
+
+        restored = requests.get(f"{BASE_URL}/memory/{own[0]['id']}")
+        assert restored.status_code == 200
+        assert restored.json()["created_at"] == own[0]["created_at"]
+        assert restored.json()["type"] == "decision"
+
+    def test_import_defer_index_schedules_reindex(self):
+        """defer_index=true では埋め込み計算が再インデックスジョブに回される"""
+        import time
+
+        scope_id = f"import-defer-{uuid.uuid4().hex[:8]}"
+        response = requests.post(
+            f"{BASE_URL}/import",
+            params={"defer_index": "true"},
+            json={"memories": [{"content": "遅延インデックス", "scope_id": scope_id}]}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["imported"] == 1
+        assert "reindex_scheduled" in data
+
+        # ジョブ完了後はセマンティック検索で見つかる
+        for _ in range(50):
+            if not requests.get(f"{BASE_URL}/admin/reindex").json()["running"]:
+                break
+            time.sleep(0.1)
+        result = requests.get(f"{BASE_URL}/search", params={
+            "query": "遅延インデックス", "scope_id": scope_id, "mode": "semantic"
+        }).json()
+        assert len(result["memories"]) >= 1
+
 
 class TestDeprecation:
     """記憶の廃止機能のテスト"""
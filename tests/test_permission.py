@@ -276,3 +276,172 @@ class TestDeletePermission:
         # Admin が User A の記憶を削除
         response = admin_client.delete(f"/memory/{memory_id}")
         assert response.status_code == 200
+
+
+class TestBatchGetPermission:
+    """複数ID取得 API（/memories）の権限テスト"""
+
+    def test_batch_get_denies_other_projects(
+        self,
+        user_a_client: APIClient,
+        user_b_client: APIClient,
+        admin_client: APIClient,
+        project_with_user_a: str
+    ):
+        """メンバーでないプロジェクトの記憶は denied になる"""
+        create_response = user_a_client.post("/store", json={
+            "content": "一括取得の権限テスト",
+            "type": "work",
+            "scope": "project",
+            "scope_id": project_with_user_a
+        })
+        assert create_response.status_code == 200, f"Failed to create memory: {create_response.text}"
+        memory_id = create_response.json()["id"]
+
+        # メンバーの User A は取得できる
+        response = user_a_client.get("/memories", params={"ids": memory_id})
+        assert response.status_code == 200
+        assert [m["id"] for m in response.json()["memories"]] == [memory_id]
+
+        # メンバーでない User B は取得できない
+        response = user_b_client.get("/memories", params={"ids": memory_id})
+        assert response.status_code == 200
+        assert response.json()["memories"] == []
+        assert response.json()["denied"] == [memory_id]
+
+        # Admin は取得できる
+        response = admin_client.get("/memories", params={"ids": memory_id})
+        assert [m["id"] for m in response.json()["memories"]] == [memory_id]
+
+
+class TestBulkUpdatePermission:
+    """一括更新 API（/memories/bulk）の権限テスト"""
+
+    def test_bulk_deprecate_only_own_memories(
+        self,
+        user_a_client: APIClient,
+        user_b_client: APIClient,
+        project_with_both_users: str
+    ):
+        """一般ユーザーの一括廃止は自分が作成した記憶のみが対象"""
+        own = user_b_client.post("/store", json={
+            "content": "一括廃止（自分）", "type": "work", "scope": "project", "scope_id": project_with_both_users
+        }).json()["id"]
+        others = user_a_client.post("/store", json={
+            "content": "一括廃止（他人）", "type": "work", "scope": "project", "scope_id": project_with_both_users
+        }).json()["id"]
+
+        response = user_b_client.post("/memories/bulk", json={
+            "filter": {"scope_id": project_with_both_users}, "action": "deprecate"
+        })
+        assert response.status_code == 200
+        assert response.json()["updated"] == 1
+        assert user_b_client.get(f"/memory/{own}").json()["deprecated"] is True
+        assert user_a_client.get(f"/memory/{others}").json()["deprecated"] is False
+
+    def test_bulk_update_requires_project_access(self, user_b_client: APIClient, project_with_user_a: str):
+        """書き込み権限のないプロジェクトは 403"""
+        response = user_b_client.post("/memories/bulk", json={
+            "filter": {"scope_id": project_with_user_a}, "action": "deprecate"
+        })
+        assert response.status_code == 403
+
+
+class TestImportPermission:
+    """インポート API（/import）の権限テスト"""
+
+    def test_import_cannot_overwrite_others_memory(
+        self,
+        admin_client: APIClient,
+        user_a_client: APIClient,
+        user_b_client: APIClient,
+        project_with_both_users: str
+    ):
+        """他人の記憶（グローバルを含む）の id を指定した行は取り込まれず、元の記憶はそのまま残る"""
+        victims = [
+            user_a_client.post("/store", json={
+                "content": "インポートで上書きされない記憶", "type": "work",
+                "scope": "project", "scope_id": project_with_both_users
+            }).json()["id"],
+            admin_client.post("/store", json={
+                "content": "インポートで上書きされないグローバル記憶", "type": "knowledge", "scope": "global"
+            }).json()["id"],
+        ]
+
+        response = user_b_client.post("/import", json={"memories": [{
+            "id": victim, "content": "乗っ取り", "type": "work",
+            "scope": "project", "scope_id": project_with_both_users
+        } for victim in victims]})
+        assert response.status_code == 200
+        assert response.json()["imported"] == 0
+        assert [e["id"] for e in response.json()["errors"]] == victims
+
+        for victim in victims:
+            assert admin_client.get(f"/memory/{victim}").json()["content"] != "乗っ取り"
+
+    def test_import_sets_caller_as_creator(
+        self,
+        user_b_client: APIClient,
+        test_users: dict[str, UserInfo],
+        project_with_both_users: str
+    ):
+        """一般ユーザーの取り込みでは created_by を指定しても本人が作成者になる"""
+        response = user_b_client.post("/import", json={"memories": [{
+            "content": "作成者の詐称", "type": "work", "created_by": test_users["user_a"].user_id,
+            "scope": "project", "scope_id": project_with_both_users
+        }]})
+        assert response.json()["imported"] == 1
+
+        memories = user_b_client.get(f"/export/{project_with_both_users}").json()["memories"]
+        assert [m["created_by"] for m in memories if m["scope_id"] == project_with_both_users] == [
+            test_users["user_b"].user_id
+        ]
+
+
+class TestBatchRequestPermission:
+    """複数リクエスト一括実行 API（/batch）の権限テスト"""
+
+    def test_batch_uses_caller_auth_context(self, user_a_client: APIClient, anonymous_client: APIClient):
+        """サブリクエストは呼び出し元と同じ認証情報で実行される"""
+        response = user_a_client.post("/batch", json={"requests": [
+            {"path": "/admin/users"},
+            {"path": "/health"},
+        ]})
+        assert response.status_code == 200
+        statuses = [r["status"] for r in response.json()["responses"]]
+        # 一般ユーザーは管理者 API にアクセスできない
+        assert statuses == [403, 200]
+
+        # 認証なしでは /batch 自体が拒否される
+        response = anonymous_client.post("/batch", json={"requests": [{"path": "/health"}]})
+        assert response.status_code == 401
+
+
+class TestListProjectsPermission:
+    """プロジェクト一覧（/projects）の権限テスト"""
+
+    def test_list_projects_only_accessible(
+        self,
+        admin_client: APIClient,
+        user_a_client: APIClient,
+        user_b_client: APIClient,
+        project_with_user_a: str
+    ):
+        """メンバーになっているプロジェクトだけが一覧・総件数に含まれる"""
+        response = user_a_client.post("/store", json={
+            "content": "一覧権限テスト", "type": "work", "scope": "project", "scope_id": project_with_user_a
+        })
+        assert response.status_code == 200
+
+        response = user_a_client.get("/projects")
+        assert response.status_code == 200
+        assert project_with_user_a in [p["project_id"] for p in response.json()]
+        assert int(response.headers["X-Total-Count"]) == len(response.json())
+
+        response = user_b_client.get("/projects")
+        assert response.status_code == 200
+        assert project_with_user_a not in [p["project_id"] for p in response.json()]
+
+        # 管理者は全プロジェクトを閲覧できる
+        response = admin_client.get("/projects", params={"limit": 1000})
+        assert project_with_user_a in [p["project_id"] for p in response.json()]